@@ -0,0 +1,129 @@
+"""
+承認待ちキュー（ApprovalQueue）のベンチマーク
+
+chapter5/human_in_loop.py のエージェントに、承認が必要なリクエスト（メール送信）を --requests 件送り、
+承認者の判断に平均 --think 秒（指数分布）かかるとして
+- ブロッキング: 1件ずつ実行し、承認を待ってから再開し、次のリクエストへ進む（human_in_loop.py の方式）
+- キュー: 全件を実行して承認待ちに入れ、届いた決定からワーカーが再開する
+で、全件が終わるまでの時間と、止まってから再開するまでの時間を比較します。
+最後に、新しい ApprovalQueue の recover() がチェックポインターから承認待ちを読み直せるかを確認します。
+
+使い方:
+    python3 benchmarks/bench_approval.py
+    python3 benchmarks/bench_approval.py --requests 200 --think 1.0 --workers 8
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.approval import ApprovalQueue
+
+
+def message(i):
+    return f"user{i}@example.comに「件名{i}」という件名でメールを送って"
+
+
+def think_times(n, mean, seed=0):
+    rng = random.Random(seed)
+    return [rng.expovariate(1 / mean) for _ in range(n)]
+
+
+async def run_blocking(agent, args, delays):
+    waits = []
+    t0 = time.perf_counter()
+    for i, delay in enumerate(delays):
+        config = {"configurable": {"thread_id": f"blocking-{i}-{time.time_ns()}"}}
+        await agent.ainvoke({"messages": [("user", message(i))]}, config)
+        t1 = time.perf_counter()
+        await asyncio.sleep(delay)  # input("y/n: ") を待つ間、他のリクエストは処理されない
+        waits.append(time.perf_counter() - t1)
+        async for _ in agent.astream(None, config):
+            pass
+    return {"mode": "blocking", "elapsed_s": time.perf_counter() - t0, "interrupt_to_resume": summarize(waits)}
+
+
+async def run_queue(agent, args, delays):
+    queue = ApprovalQueue(agent, workers=args.workers)
+    await queue.start()
+    prefix = f"queue-{time.time_ns()}"
+    t0 = time.perf_counter()
+
+    async def request(i, delay):
+        await queue.submit(f"{prefix}-{i}", message(i))
+        await asyncio.sleep(delay)  # 承認者の判断（他のスレッドは止まらない）
+        queue.approve(f"{prefix}-{i}")
+
+    await asyncio.gather(*(request(i, d) for i, d in enumerate(delays)))
+    await queue.join()
+    elapsed = time.perf_counter() - t0
+    stats = queue.stats()
+    await queue.close()
+    return {"mode": "queue", "elapsed_s": elapsed, **stats}
+
+
+async def run_recover(agent, n):
+    """承認待ちを残したまま新しいキューを作り、recover() で読み直せるか"""
+    first = ApprovalQueue(agent)
+    prefix = f"recover-{time.time_ns()}"
+    await asyncio.gather(*(first.submit(f"{prefix}-{i}", message(i)) for i in range(n)))
+    second = ApprovalQueue(agent)
+    t0 = time.perf_counter()
+    await second.recover()
+    elapsed = time.perf_counter() - t0
+    found = sum(item.thread_id.startswith(prefix) for item in second.pending())
+    return {"mode": "recover", "parked": len(first.pending()), "recovered": found, "elapsed_s": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--think", type=float, default=0.2, help="承認者の判断にかかる平均秒数")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--ttft", type=float, default=0.02)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft)
+    agent = load_chapter("chapter5/human_in_loop.py").agent
+    delays = think_times(args.requests, args.think)
+
+    async def run():
+        return [
+            await run_blocking(agent, args, delays),
+            await run_queue(agent, args, delays),
+            await run_recover(agent, min(args.requests, 20)),
+        ]
+
+    results = asyncio.run(run())
+    for r in results:
+        if r["mode"] == "recover":
+            print(f"{'recover':>9s}: 承認待ち {r['parked']}件 -> 読み直し {r['recovered']}件（{r['elapsed_s'] * 1000:.0f}ms）")
+            continue
+        wait = r["interrupt_to_resume"]
+        print(f"{r['mode']:>9s}: 全件 {r['elapsed_s']:6.2f}秒  止まってから再開まで p50 {wait['p50_ms']:6.0f}ms "
+              f"p99 {wait['p99_ms']:6.0f}ms")
+
+    output = args.output or default_output("approval")
+    write_results(output, {
+        "benchmark": "approval",
+        "environment": environment_info(),
+        "settings": {"requests": args.requests, "think": args.think, "workers": args.workers, "ttft": args.ttft},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
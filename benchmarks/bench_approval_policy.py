@@ -0,0 +1,152 @@
+"""
+自動承認ポリシー（common/approval_policy.py）のベンチマーク
+
+chapter5/human_in_loop.py のエージェントに、安全なツール（get_info）と承認が必要なツール（send_email）の
+リクエストを --safe-ratio の割合で混ぜて --requests 件送り、
+- unconditional: 空のポリシー（すべてのツール呼び出しで止まる。以前の interrupt_before=["tools"] と同じ）
+- policy: chapter5 のポリシー（get_info は止まらずに実行する）
+で、チェックポインターへの書き込み回数（aput / aput_writes）・残ったチェックポイントの数・止まった回数・
+get_state の回数・エンドツーエンドのレイテンシを比較します。
+承認者はすぐに承認する（判断の時間は0）として、止まって再開する仕組みそのもののコストだけを測ります。
+
+使い方:
+    python3 benchmarks/bench_approval_policy.py
+    python3 benchmarks/bench_approval_policy.py --requests 200 --safe-ratio 0.9
+    CHECKPOINTER=sqlite python3 benchmarks/bench_approval_policy.py
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.approval_policy import ApprovalPolicy
+
+
+def messages(n, safe_ratio, seed=0):
+    rng = random.Random(seed)
+    return [
+        f"トピック{i}の情報を調べて" if rng.random() < safe_ratio
+        else f"user{i}@example.comに「件名{i}」という件名でメールを送って"
+        for i in range(n)
+    ]
+
+
+def count_writes(checkpointer):
+    """チェックポインターの aput / aput_writes の呼び出し回数を数える（インスタンスの属性を差し替える）"""
+    counts = {"aput": 0, "aput_writes": 0}
+    for name in counts:
+        original = getattr(checkpointer, name)
+
+        async def counted(*args, _name=name, _original=original, **kwargs):
+            counts[_name] += 1
+            return await _original(*args, **kwargs)
+
+        setattr(checkpointer, name, counted)
+    return counts
+
+
+async def run_request(agent, thread_id, message):
+    """1件を最後まで実行する（止まったらすぐに承認して再開する）。止まった回数を返す
+
+    human_in_loop.py と同じく、実行のあとに get_state で止まったかを確認し、止まっていれば再開する。
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    await agent.ainvoke({"messages": [("user", message)]}, config)
+    interrupts = 0
+    while (await agent.aget_state(config)).next:
+        interrupts += 1
+        async for _ in agent.astream(None, config):
+            pass
+    return interrupts
+
+
+async def run_mode(module, mode, policy, texts, concurrency, writes):
+    module.policy = policy
+    agent = module.agent
+    writes_before = dict(writes)
+    prefix = f"{mode}-{time.time_ns()}"
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, interrupts = [], []
+
+    async def one(i, text):
+        async with semaphore:
+            t0 = time.perf_counter()
+            interrupts.append(await run_request(agent, f"{prefix}-{i}", text))
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i, text) for i, text in enumerate(texts)))
+    elapsed = time.perf_counter() - t0
+    checkpoints = [
+        sum(1 for _ in agent.checkpointer.list({"configurable": {"thread_id": f"{prefix}-{i}"}}))
+        for i in range(len(texts))
+    ]
+    return {
+        "mode": mode,
+        "elapsed_s": elapsed,
+        "interrupts": sum(interrupts),
+        "get_state_calls": len(texts) + sum(interrupts),
+        "aput": writes["aput"] - writes_before["aput"],
+        "aput_writes": writes["aput_writes"] - writes_before["aput_writes"],
+        "checkpoints": sum(checkpoints),
+        "checkpoints_per_request": sum(checkpoints) / len(texts),
+        "latency": summarize(latencies),
+        "policy": policy.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--safe-ratio", type=float, default=0.8, help="get_info のリクエストの割合")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ttft", type=float, default=0.02)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft)
+    module = load_chapter("chapter5/human_in_loop.py")
+    default_policy = module.policy
+    texts = messages(args.requests, args.safe_ratio)
+    writes = count_writes(module.agent.checkpointer)
+
+    async def run():
+        return [
+            await run_mode(module, "unconditional", ApprovalPolicy(), texts, args.concurrency, writes),
+            await run_mode(module, "policy", ApprovalPolicy(allow=default_policy.allow), texts, args.concurrency, writes),
+        ]
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        module.policy = default_policy
+    for r in results:
+        print(f"{r['mode']:>13s}: 全件 {r['elapsed_s']:5.2f}秒  止まった回数 {r['interrupts']:4d}  "
+              f"get_state {r['get_state_calls']:4d}  aput {r['aput']:5d}  aput_writes {r['aput_writes']:5d}  "
+              f"チェックポイント {r['checkpoints']:5d}  "
+              f"p50 {r['latency']['p50_ms']:5.0f}ms  p99 {r['latency']['p99_ms']:5.0f}ms")
+
+    output = args.output or default_output("approval_policy")
+    write_results(output, {
+        "benchmark": "approval_policy",
+        "environment": environment_info(),
+        "settings": {"requests": args.requests, "safe_ratio": args.safe_ratio,
+                     "concurrency": args.concurrency, "ttft": args.ttft},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+同期実行と非同期実行のスループット比較
+
+chapter3/multi_tools.py のエージェントで N 件の会話を同時に処理し、
+- 同期版: スレッドプール（--threads 本）で agent.invoke
+- 非同期版: 1つのイベントループで agent.ainvoke を asyncio.gather
+の処理時間・スループット・会話ごとのレイテンシを比較します。
+
+フェイクモデルの遅延（--ttft / --token-latency）がLLMの待ち時間に相当します。
+
+使い方:
+    python3 benchmarks/bench_async.py
+    python3 benchmarks/bench_async.py --concurrency 10 100 500 --threads 16 --ttft 0.1
+"""
+import argparse
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+
+PROMPTS = ["25と75を足すといくつ？", "12かける8は？", "東京の天気を教えて", "今何時？", "LangGraphとは何ですか？"]
+
+
+def _inputs(n):
+    return [{"messages": [("user", PROMPTS[i % len(PROMPTS)])]} for i in range(n)]
+
+
+def run_sync(agent, n, threads):
+    def timed(inputs):
+        t0 = time.perf_counter()
+        agent.invoke(inputs)
+        return time.perf_counter() - t0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(timed, _inputs(n)))
+    return time.perf_counter() - start, latencies
+
+
+async def run_async(agent, n):
+    async def timed(inputs):
+        t0 = time.perf_counter()
+        await agent.ainvoke(inputs)
+        return time.perf_counter() - t0
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(inputs) for inputs in _inputs(n)))
+    return time.perf_counter() - start, list(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--threads", type=int, default=8, help="同期版のスレッド数")
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.001)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft, per_token_latency=args.token_latency)
+    agent = load_chapter("chapter3/multi_tools.py").agent
+
+    # ウォームアップ
+    agent.invoke(_inputs(1)[0])
+    asyncio.run(agent.ainvoke(_inputs(1)[0]))
+
+    results = []
+    print(f"{'N':>5s} {'mode':>6s} {'elapsed':>9s} {'conv/s':>8s} {'p50':>9s} {'p99':>9s}")
+    for n in args.concurrency:
+        for mode in ("sync", "async"):
+            if mode == "sync":
+                elapsed, latencies = run_sync(agent, n, args.threads)
+            else:
+                elapsed, latencies = asyncio.run(run_async(agent, n))
+            stats = summarize(latencies)
+            results.append({
+                "concurrency": n,
+                "mode": mode,
+                "threads": args.threads if mode == "sync" else 1,
+                "elapsed_sec": elapsed,
+                "conversations_per_sec": n / elapsed,
+                "latency": stats,
+            })
+            print(f"{n:5d} {mode:>6s} {elapsed:8.2f}s {n / elapsed:8.1f} "
+                  f"{stats['p50_ms']:7.1f}ms {stats['p99_ms']:7.1f}ms")
+
+    output = args.output or default_output("async")
+    write_results(output, {
+        "benchmark": "async",
+        "environment": environment_info(),
+        "settings": {"threads": args.threads, "ttft": args.ttft, "token_latency": args.token_latency},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
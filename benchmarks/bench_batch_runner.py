@@ -0,0 +1,148 @@
+"""
+バッチランナー（BatchRunner）のベンチマーク
+
+chapter3/multi_tools.py のエージェントで --prompts 件のプロンプトを処理し、
+- 1件ずつ agent.invoke する従来のループ
+- BatchRunner（--concurrency で指定した同時実行数ごと）
+のスループットとレイテンシを比較します。さらに
+- 429（レート制限）を --rate-limit-rate の確率で注入したときの完了件数と再試行回数
+- 途中で止めた（前半だけ処理した）出力ファイルからの再開で、重複なく全件そろうか
+を確認します。
+
+使い方:
+    python3 benchmarks/bench_batch_runner.py
+    python3 benchmarks/bench_batch_runner.py --prompts 2000 --concurrency 1 8 32 64 --ttft 0.1
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.batch_runner import BatchRunner
+from common.llm import get_llm
+from common.prompt_cache import CachedPrefix
+
+QUESTIONS = [
+    "25と75を足すといくつ？", "12かける8は？", "東京の天気を教えて", "今何時？", "LangGraphとは何ですか？",
+]
+
+
+def write_prompts(path, n):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            f.write(json.dumps({"id": f"q{i}", "prompt": QUESTIONS[i % len(QUESTIONS)]}, ensure_ascii=False) + "\n")
+
+
+def read_ids(path):
+    """出力の id の一覧（書き込み途中で切れた行は除く）"""
+    ids = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                ids.append(json.loads(line)["id"])
+            except json.JSONDecodeError:
+                continue
+    return ids
+
+
+def run_sequential(agent, n):
+    latencies = []
+    t0 = time.perf_counter()
+    for i in range(n):
+        t1 = time.perf_counter()
+        agent.invoke({"messages": [("user", QUESTIONS[i % len(QUESTIONS)])]})
+        latencies.append(time.perf_counter() - t1)
+    elapsed = time.perf_counter() - t0
+    return {"mode": "sequential", "elapsed_s": elapsed, "throughput_per_s": n / elapsed, "latency": summarize(latencies)}
+
+
+def run_batch(agent, prompts, output, concurrency, backoff=1.0):
+    stats = BatchRunner(agent, concurrency=concurrency, backoff=backoff).run(prompts, output)
+    return {"mode": "batch", "concurrency": concurrency, **stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.1)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft)
+    module = load_chapter("chapter3/multi_tools.py")
+    agent = module.agent
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        prompts = tmp / "prompts.jsonl"
+        write_prompts(prompts, args.prompts)
+
+        print(f"{'mode':>18s} {'items/s':>9s} {'elapsed':>9s} {'p50':>9s} {'p99':>9s} {'retries':>8s}")
+        r = run_sequential(agent, args.prompts)
+        results.append(r)
+        print(f"{'sequential':>18s} {r['throughput_per_s']:9.1f} {r['elapsed_s']:8.2f}s "
+              f"{r['latency']['p50_ms']:7.1f}ms {r['latency']['p99_ms']:7.1f}ms {'-':>8s}")
+
+        def show(label, r):
+            print(f"{label:>18s} {r['throughput_per_s']:9.1f} {r['elapsed_s']:8.2f}s "
+                  f"{r['latency_p50_ms']:7.1f}ms {r['latency_p99_ms']:7.1f}ms {r['retries']:8d}")
+
+        for c in args.concurrency:
+            r = run_batch(agent, prompts, tmp / f"out-{c}.jsonl", c)
+            results.append(r)
+            show(f"batch c={c}", r)
+
+        # レート制限の注入: 429 を返すモデルに差し替える
+        c = max(args.concurrency)
+        limited = get_llm(failure_rate=args.rate_limit_rate, failure_status=429, seed=0)
+        original = module.llm_with_tools
+        module.llm_with_tools = CachedPrefix(limited, module.SYSTEM_PROMPT, module.tools)
+        try:
+            r = run_batch(agent, prompts, tmp / "out-429.jsonl", c, backoff=0.05)
+        finally:
+            module.llm_with_tools = original
+        r["mode"] = "batch+429"
+        results.append(r)
+        show(f"429 c={c}", r)
+        print(f"{'':>18s} 完了 {r['completed']}件 / 失敗 {r['failed']}件 / レート制限 {r['rate_limited']}回")
+
+        # 再開: 前半だけ処理した出力（末尾の行は書き込み途中で切れている）から続きを処理する
+        half = tmp / "prompts-half.jsonl"
+        write_prompts(half, args.prompts // 2)
+        resumed = tmp / "out-resume.jsonl"
+        BatchRunner(agent, concurrency=c).run(half, resumed)
+        with open(resumed, "a", encoding="utf-8") as f:
+            f.write('{"id": "q')
+        r = run_batch(agent, prompts, resumed, c)
+        ids = read_ids(resumed)
+        r.update({"mode": "resume", "unique_ids": len(set(ids)), "duplicate_ids": len(ids) - len(set(ids))})
+        results.append(r)
+        print(f"{'resume':>18s} スキップ {r['skipped']}件 / 追加 {r['completed']}件 / "
+              f"id {r['unique_ids']}件（重複 {r['duplicate_ids']}件）")
+
+    output = args.output or default_output("batch-runner")
+    write_results(output, {
+        "benchmark": "batch-runner",
+        "environment": environment_info(),
+        "settings": {"prompts": args.prompts, "ttft": args.ttft, "rate_limit_rate": args.rate_limit_rate},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
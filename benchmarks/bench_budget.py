@@ -0,0 +1,149 @@
+"""
+実行の予算（common/budget.py）: おかしな応答が続くターンを、どこで・どれだけの時間で止められるか
+
+chapter3/multi_tools.py のエージェントのLLMを「ツールを呼び続ける」応答に差し替え
+（get_current_time を毎回呼ぶ。ツールには --tool-latency 秒の待ち時間を加える）、予算ごとに --requests 件実行して、
+- 終わり方（使い切った予算の種類。予算の代わりに recursion_limit=25 で止めると GraphRecursionError）
+- 実行時間（p50 / 最大）と、締め切りを過ぎてから終わるまでの時間（超過）
+- 1件あたりのLLMの呼び出し回数
+を比較します。締め切りは、同期実行ではLLMの呼び出しが終わるまで待つのに対し、非同期実行では
+実行中の呼び出しを取り消すので、超過の差を見ます。最後にメトリクス（langgraph_budget_exhausted_total）を表示します。
+
+使い方:
+    python3 benchmarks/bench_budget.py
+    python3 benchmarks/bench_budget.py --ttft 0.3 --timeout 1.0
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langgraph.errors import GraphRecursionError
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.budget import budget_stats, with_budget
+from common.fake_llm import tool_loop_responder
+from common.llm import get_llm
+from common.tracing import disable_tracing, enable_tracing
+
+
+def cases(args):
+    """ケース名 -> with_budget の引数（None は予算を config に入れない = 既定の上限だけ）
+
+    recursion_limit=25 は予算の代わりに langgraph の recursion_limit で止める（以前の langgraph の既定値）。
+    """
+    return {
+        "recursion_limit=25": {"max_iterations": 10 ** 6},
+        "default": None,
+        "iterations=3": {"max_iterations": 3},
+        f"deadline={args.timeout:g}s": {"timeout": args.timeout},
+        f"tokens={args.max_tokens}": {"max_tokens": args.max_tokens},
+    }
+
+
+def run_case(module, name, budget, api, requests):
+    elapsed, overshoot, llm_calls, outcomes = [], [], 0, {}
+    for i in range(requests):
+        config = {"configurable": {"thread_id": f"{name}-{api}-{i}"}}
+        if budget is not None:
+            config = with_budget(config, **budget)
+        if name.startswith("recursion_limit"):
+            config["recursion_limit"] = 25
+        deadline = config["configurable"].get("budget", {}).get("deadline")
+        inputs = {"messages": [("user", "今何時？")]}
+        t0 = time.perf_counter()
+        try:
+            result = module.agent.invoke(inputs, config) if api == "sync" else asyncio.run(
+                module.agent.ainvoke(inputs, config))
+        except GraphRecursionError:
+            outcome = "GraphRecursionError"
+        else:
+            last = result["messages"][-1]
+            outcome = last.response_metadata.get("budget_exhausted", "answered")
+            llm_calls += sum(1 for m in result["messages"] if getattr(m, "usage_metadata", None))
+        elapsed.append(time.perf_counter() - t0)
+        if deadline is not None:
+            overshoot.append(max(0.0, time.time() - deadline))
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return {
+        "case": name,
+        "api": api,
+        "outcomes": outcomes,
+        "latency": summarize(elapsed),
+        "max_ms": max(elapsed) * 1000,
+        "overshoot_max_ms": max(overshoot) * 1000 if overshoot else None,
+        "llm_calls_per_request": llm_calls / requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--ttft", type=float, default=0.1)
+    parser.add_argument("--tool-latency", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=0.5, help="deadline のケースの締め切り（秒）")
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    parser.add_argument("--api", nargs="+", default=["sync", "async"], choices=["sync", "async"])
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft)
+    module = load_chapter("chapter3/multi_tools.py")
+    fake = get_llm()
+    fake.responder = tool_loop_responder(10 ** 6, "get_current_time", {})
+    tool = module.get_current_time
+    func, coroutine = tool.func, tool.coroutine
+
+    def slow():
+        time.sleep(args.tool_latency)
+        return func()
+
+    async def aslow():
+        await asyncio.sleep(args.tool_latency)
+        return await coroutine()
+
+    tool.func, tool.coroutine = slow, aslow
+    tracer = enable_tracing()
+    results = []
+    try:
+        for api in args.api:
+            for name, budget in cases(args).items():
+                r = run_case(module, name, budget, api, args.requests)
+                results.append(r)
+                overshoot = "" if r["overshoot_max_ms"] is None else f"  超過 最大 {r['overshoot_max_ms']:6.1f}ms"
+                print(f"{api:>5s} {name:>14s}: {', '.join(f'{k} {v}' for k, v in r['outcomes'].items()):28s}  "
+                      f"p50 {r['latency']['p50_ms']:7.1f}ms  最大 {r['max_ms']:7.1f}ms  "
+                      f"LLM {r['llm_calls_per_request']:5.1f}回/件{overshoot}")
+    finally:
+        tool.func, tool.coroutine = func, coroutine
+        fake.responder = None
+        disable_tracing()
+
+    metrics = [line for line in tracer.metrics_text().splitlines()
+               if line.startswith("langgraph_budget_exhausted_total")]
+    print("\n" + "\n".join(metrics))
+
+    output = args.output or default_output("budget")
+    write_results(output, {
+        "benchmark": "budget",
+        "environment": environment_info(),
+        "settings": {"requests": args.requests, "ttft": args.ttft, "tool_latency": args.tool_latency,
+                     "timeout": args.timeout, "max_tokens": args.max_tokens, "api": args.api},
+        "results": results,
+        "budget_stats": budget_stats(),
+        "metrics": metrics,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+チェックポインターのソークテスト（thread_id を次々に作り続けたときのメモリ）
+
+chapter4/memory_saver.py のグラフで、新しい thread_id ごとに --turns ターン会話する処理を
+--threads スレッド分繰り返し、一定間隔で
+- 現在のRSS
+- チェックポインターが保持しているスレッド数・バイト数（BoundedMemorySaver のみ）
+を記録します。MemorySaver は増え続け、BoundedMemorySaver は上限で頭打ちになります。
+各チェックポインターは子プロセスで実行します。
+
+使い方:
+    python3 benchmarks/bench_checkpoint_soak.py
+    python3 benchmarks/bench_checkpoint_soak.py --threads 50000 --max-bytes 16000000
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    current_rss_kb,
+    default_output,
+    environment_info,
+    load_chapter,
+    run_isolated,
+    use_fake_backend,
+    write_results,
+)
+from common.checkpointer import create_checkpointer
+
+
+def run_case(kind, n_threads, turns, samples, opts):
+    use_fake_backend()
+    builder = load_chapter("chapter4/memory_saver.py").builder
+    checkpointer = create_checkpointer(kind, **opts)
+    agent = builder.compile(checkpointer=checkpointer)
+
+    every = max(1, n_threads // samples)
+    timeline = []
+    t0 = time.perf_counter()
+    for i in range(n_threads):
+        config = {"configurable": {"thread_id": f"churn-{i}"}}
+        for turn in range(turns):
+            agent.invoke({"messages": [("user", f"私の名前はユーザー{i}です。質問{turn}")]}, config)
+        if (i + 1) % every == 0:
+            gc.collect()
+            point = {"threads_created": i + 1, "rss_kb": current_rss_kb(), "elapsed_sec": time.perf_counter() - t0}
+            if hasattr(checkpointer, "stats"):
+                point["checkpointer"] = checkpointer.stats()
+            timeline.append(point)
+    return {"kind": kind, "options": opts, "timeline": timeline}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--max-bytes", type=int, default=8 * 1024 * 1024)
+    parser.add_argument("--ttl", type=float)
+    parser.add_argument("--keep-last", type=int, default=2)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    cases = {
+        "memory": {},
+        "bounded": {"max_bytes": args.max_bytes, "ttl": args.ttl, "keep_last": args.keep_last},
+    }
+    if args.case:
+        print(json.dumps(run_case(args.case, args.threads, args.turns, args.samples, cases[args.case])))
+        return
+
+    results = []
+    for kind in cases:
+        result = run_isolated(__file__, [
+            "--case", kind, "--threads", str(args.threads), "--turns", str(args.turns),
+            "--samples", str(args.samples), "--max-bytes", str(args.max_bytes),
+            "--keep-last", str(args.keep_last), *(["--ttl", str(args.ttl)] if args.ttl else []),
+        ])
+        results.append(result)
+        print(f"\n{kind}")
+        print(f"{'threads':>9s} {'RSS':>10s} {'held':>8s} {'bytes':>10s} {'evicted':>10s}")
+        for point in result["timeline"]:
+            stats = point.get("checkpointer")
+            held = (f"{stats['threads']:8d} {stats['bytes'] / 1e6:8.1f}MB {stats['evicted_bytes'] / 1e6:8.1f}MB"
+                    if stats else f"{point['threads_created']:8d} {'-':>10s} {'-':>10s}")
+            print(f"{point['threads_created']:9d} {point['rss_kb'] / 1024:8.1f}MB {held}")
+
+    output = args.output or default_output("checkpoint-soak")
+    write_results(output, {
+        "benchmark": "checkpoint-soak",
+        "environment": environment_info(),
+        "settings": {"threads": args.threads, "turns": args.turns},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+チェックポインターのベンチマーク（MemorySaver / SqliteSaver）
+
+chapter4/memory_saver.py のグラフで、スレッド数を増やしながら
+- get_state(config) のレイテンシ（p50 / p99）
+- 1ターンの invoke のレイテンシ
+を計測します。スレッドは実際のチェックポイントを複製して事前に作成します。
+
+使い方:
+    python3 benchmarks/bench_checkpointer.py
+    python3 benchmarks/bench_checkpointer.py --threads 1000 100000 --kind sqlite
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.checkpointer import create_checkpointer
+
+
+def _config(thread_id):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+def populate(builder, checkpointer, n_threads):
+    """1スレッド分を実際に実行し、そのチェックポイントを n_threads 個に複製する"""
+    agent = builder.compile(checkpointer=checkpointer)
+    agent.invoke({"messages": [("user", "私の名前はGemini太郎です。")]}, _config("seed"))
+    template = checkpointer.get_tuple(_config("seed"))
+    checkpoint = template.checkpoint
+    for i in range(n_threads):
+        checkpointer.put(_config(f"t{i}"), checkpoint, template.metadata, checkpoint["channel_versions"])
+    return agent
+
+
+def bench(kind, n_threads, lookups, turns, db_path):
+    builder = load_chapter("chapter4/memory_saver.py").builder
+    opts = {"path": db_path} if kind == "sqlite" else {}
+    checkpointer = create_checkpointer(kind, **opts)
+
+    t0 = time.perf_counter()
+    agent = populate(builder, checkpointer, n_threads)
+    populate_sec = time.perf_counter() - t0
+
+    rng = random.Random(0)
+    get_state = []
+    for _ in range(lookups):
+        config = _config(f"t{rng.randrange(n_threads)}")
+        t0 = time.perf_counter()
+        state = agent.get_state(config)
+        get_state.append(time.perf_counter() - t0)
+        assert len(state.values["messages"]) == 2
+
+    invoke = []
+    for _ in range(turns):
+        config = _config(f"t{rng.randrange(n_threads)}")
+        t0 = time.perf_counter()
+        agent.invoke({"messages": [("user", "私の名前を覚えていますか？")]}, config)
+        invoke.append(time.perf_counter() - t0)
+
+    result = {
+        "kind": kind,
+        "threads": n_threads,
+        "populate_sec": populate_sec,
+        "get_state": summarize(get_state),
+        "invoke": summarize(invoke),
+    }
+    if kind == "sqlite":
+        result["db_bytes"] = sum(
+            os.path.getsize(p) for p in (db_path, db_path + "-wal") if os.path.exists(p)
+        )
+        checkpointer.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--kind", nargs="+", default=["memory", "sqlite"], choices=["memory", "sqlite"])
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend()
+    results = []
+    print(f"{'kind':>7s} {'threads':>8s} {'populate':>9s} {'get p50':>9s} {'get p99':>9s} {'inv p50':>9s} {'inv p99':>9s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.threads:
+            for kind in args.kind:
+                r = bench(kind, n, args.lookups, args.turns, os.path.join(tmp, f"bench-{n}.sqlite"))
+                results.append(r)
+                print(f"{kind:>7s} {n:8d} {r['populate_sec']:8.1f}s "
+                      f"{r['get_state']['p50_ms']:7.3f}ms {r['get_state']['p99_ms']:7.3f}ms "
+                      f"{r['invoke']['p50_ms']:7.3f}ms {r['invoke']['p99_ms']:7.3f}ms")
+
+    output = args.output or default_output("checkpointer")
+    write_results(output, {
+        "benchmark": "checkpointer",
+        "environment": environment_info(),
+        "settings": {"lookups": args.lookups, "turns": args.turns},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
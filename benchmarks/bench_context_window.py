@@ -0,0 +1,121 @@
+"""
+コンテキストウィンドウ（ContextWindow）のベンチマーク
+
+1つのスレッドで --turns ターン会話し、ターンごとの
+- LLMに送ったプロンプトのトークン数（フェイクモデルの usage_metadata）
+- invoke のレイテンシ
+を、履歴全体を送る場合と chapter4/memory_saver.py（予算内に畳み込む）で比較します。
+
+フェイクモデルは要約を作れないので、ContextWindow の summarizer には会話から名前だけを抜き出す
+応答関数のモデルを渡し、チャットのモデルには要約（システムプロンプト）に残った名前も答えられる応答関数を設定します。
+
+使い方:
+    python3 benchmarks/bench_context_window.py
+    python3 benchmarks/bench_context_window.py --turns 1000 --max-tokens 2000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.fake_llm import message_text, rule_based_responder
+
+NAME = re.compile(r"私の名前は(.+?)です")
+
+
+def summarize_facts(messages, tools):
+    """要約の代わりに、依頼（これまでの要約 + 新しい会話）から名前を名乗った文だけを抜き出す"""
+    facts = dict.fromkeys(m.group(0) for m in NAME.finditer(message_text(messages[-1])))
+    return AIMessage(content="。".join(facts) or "特記事項なし")
+
+
+def recall_responder(messages, tools):
+    """名前の確認では、要約されたシステムプロンプトに残った名前も見る（それ以外はルールベース）"""
+    if re.search(r"名前を覚えて", message_text(messages[-1])):
+        for m in messages:
+            if m.type in ("system", "human") and (name := NAME.search(message_text(m))):
+                return AIMessage(content=f"はい、あなたの名前は{name.group(1)}さんです。")
+    return rule_based_responder(messages, tools)
+
+
+def full_history_builder(module):
+    """ContextWindow を使わず、毎ターン履歴全体を送るグラフ"""
+    def chatbot(state):
+        return {"messages": [module.llm.invoke(state["messages"])]}
+
+    builder = StateGraph(module.State)
+    builder.add_node("chatbot", chatbot)
+    builder.add_edge(START, "chatbot")
+    builder.add_edge("chatbot", END)
+    return builder
+
+
+def run(builder, turns):
+    agent = builder.compile(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "long"}}
+    per_turn = []
+    agent.invoke({"messages": [("user", "私の名前はGemini太郎です。")]}, config)
+    for i in range(turns):
+        t0 = time.perf_counter()
+        result = agent.invoke({"messages": [("user", f"質問{i}: 今日の予定を教えてください。")]}, config)
+        elapsed = time.perf_counter() - t0
+        per_turn.append((result["messages"][-1].usage_metadata["input_tokens"], elapsed))
+    answer = agent.invoke({"messages": [("user", "私の名前を覚えていますか？")]}, config)
+    return per_turn, answer["messages"][-1].content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend()
+    os.environ["CONTEXT_MAX_TOKENS"] = str(args.max_tokens)
+    module = load_chapter("chapter4/memory_saver.py")
+    from common.llm import default_llm, get_llm
+    default_llm().responder = recall_responder
+    module.window.summarizer = get_llm(responder=summarize_facts)
+    marks = [m for m in (10, 100, 250, 500, 1000, 2000) if m <= args.turns]
+
+    results = []
+    for label, builder in (("full_history", full_history_builder(module)), ("context_window", module.builder)):
+        per_turn, answer = run(builder, args.turns)
+        by_turn = {
+            str(m): {"prompt_tokens": per_turn[m - 1][0], "latency": summarize([t for _, t in per_turn[max(0, m - 10):m]])}
+            for m in marks
+        }
+        results.append({"graph": label, "by_turn": by_turn, "recall_answer": answer})
+        print(f"{label:15s} " + "  ".join(
+            f"@{m}: {w['prompt_tokens']:6d}tok {w['latency']['p50_ms']:6.2f}ms" for m, w in by_turn.items()
+        ))
+        print(f"{'':15s} 名前の確認: {answer}")
+
+    output = args.output or default_output("context-window")
+    write_results(output, {
+        "benchmark": "context-window",
+        "environment": environment_info(),
+        "settings": {"turns": args.turns, "max_tokens": args.max_tokens},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
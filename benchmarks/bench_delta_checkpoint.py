@@ -0,0 +1,115 @@
+"""
+差分チェックポイントのベンチマーク
+
+chapter4/memory_saver.py のグラフで1つのスレッドを --turns ターン会話させ、
+ターンごとの「チェックポインターがシリアライズしたバイト数」と invoke のレイテンシを
+通常の保存（全体）と差分保存（DeltaCheckpointSaver）で比較します。
+各値は指定ターンまでの直近50ターンの平均です（差分保存では定期的な全体保存も含みます）。
+差分保存のバイト数は会話の長さによらずほぼ一定になりますが、レイテンシには
+State の add_messages がメッセージ一覧全体を処理する分（O(n)）が残ります。
+
+使い方:
+    python3 benchmarks/bench_delta_checkpoint.py
+    python3 benchmarks/bench_delta_checkpoint.py --turns 2000 --kind sqlite
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.checkpointer import create_checkpointer
+
+
+class CountingSerializer(JsonPlusSerializer):
+    """シリアライズしたバイト数を数えるシリアライザ"""
+
+    def __init__(self):
+        super().__init__()
+        self.bytes_written = 0
+
+    def dumps_typed(self, obj):
+        type_, data = super().dumps_typed(obj)
+        self.bytes_written += len(data) if data else 0
+        return type_, data
+
+
+def run(builder, kind, delta, turns, db_path):
+    serde = CountingSerializer()
+    opts = {"path": db_path} if kind == "sqlite" else {}
+    checkpointer = create_checkpointer(kind, delta=delta, serde=serde, **opts)
+    agent = builder.compile(checkpointer=checkpointer)
+    config = {"configurable": {"thread_id": "long"}}
+
+    per_turn = []
+    for i in range(turns):
+        before = serde.bytes_written
+        t0 = time.perf_counter()
+        agent.invoke({"messages": [("user", f"質問{i}: 今日の予定を教えてください。")]}, config)
+        per_turn.append((serde.bytes_written - before, time.perf_counter() - t0))
+
+    assert len(agent.get_state(config).values["messages"]) == turns * 2
+    return per_turn
+
+
+def _window(per_turn, end, size=50):
+    window = per_turn[max(0, end - size):end]
+    return {
+        "bytes": sum(b for b, _ in window) / len(window),
+        "latency": summarize([t for _, t in window]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--kind", nargs="+", default=["memory", "sqlite"], choices=["memory", "sqlite"])
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend()
+    builder = load_chapter("chapter4/memory_saver.py").builder
+    marks = [m for m in (10, 100, 250, 500, 1000, 2000, 5000) if m <= args.turns]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in args.kind:
+            for delta in (False, True):
+                label = f"{kind}{'+delta' if delta else ''}"
+                per_turn = run(builder, kind, delta, args.turns, os.path.join(tmp, f"{label}.sqlite"))
+                windows = {m: _window(per_turn, m) for m in marks}
+                results.append({
+                    "checkpointer": label,
+                    "turns": args.turns,
+                    "total_bytes": sum(b for b, _ in per_turn),
+                    "by_turn": {str(m): w for m, w in windows.items()},
+                })
+                print(f"{label:14s} total={sum(b for b, _ in per_turn) / 1e6:8.1f}MB  " + "  ".join(
+                    f"@{m}: {w['bytes'] / 1024:7.1f}KB {w['latency']['p50_ms']:6.2f}ms"
+                    for m, w in windows.items()
+                ))
+
+    output = args.output or default_output("delta-checkpoint")
+    write_results(output, {
+        "benchmark": "delta-checkpoint",
+        "environment": environment_info(),
+        "settings": {"turns": args.turns},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+各チャプターのグラフのエンドツーエンドベンチマーク
+
+フェイクモデル（common/fake_llm.py）で各グラフを実行し、以下を計測します。
+- 1秒あたりの実行回数（invocations/sec）
+- ノードごとの処理時間（p50 / p99）
+- 1回あたりのメモリ割り当て量（tracemalloc）とピークRSS
+
+会話履歴の長さ（history）とツールループの深さ（tool_depth）を変えながら計測し、
+結果をJSONに保存します。langgraphのバージョン間の比較には compare.py を使います。
+
+使い方:
+    python3 benchmarks/bench_graphs.py
+    python3 benchmarks/bench_graphs.py --scenario chapter4_memory --iterations 50
+    python3 benchmarks/bench_graphs.py --ttft 0.01 --output results.json
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    NodeTimer,
+    default_output,
+    environment_info,
+    load_chapter,
+    make_history,
+    measure_allocations,
+    peak_rss_kb,
+    run_isolated,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+
+
+# ========================================
+# シナリオ定義
+# setup(value, iterations) -> run_once(i, callbacks) を返す
+# ========================================
+
+def _fake_model(responder=None):
+    from common.llm import get_llm
+    model = get_llm()
+    model.responder = responder
+    return model
+
+
+def setup_chapter2_chatbot(history, iterations):
+    graph = load_chapter("chapter2/simple_chat.py").graph
+    _fake_model()
+    messages = make_history(history)
+
+    def run_once(i, callbacks=None):
+        graph.invoke({"messages": messages + [("user", "こんにちは！")]}, {"callbacks": callbacks or []})
+    return run_once
+
+
+def _setup_tool_loop(relpath, tool_name, args):
+    def setup(depth, iterations):
+        from common.fake_llm import tool_loop_responder
+        agent = load_chapter(relpath).agent
+        _fake_model(tool_loop_responder(depth, tool_name, args))
+        config = {"recursion_limit": 2 * depth + 10}
+
+        def run_once(i, callbacks=None):
+            agent.invoke({"messages": [("user", "計算して")]}, {**config, "callbacks": callbacks or []})
+        return run_once
+    return setup
+
+
+def _prefilled_threads(agent, history, count):
+    """履歴を事前に書き込んだスレッドを count 個用意する（計測対象外）"""
+    messages = make_history(history)
+    configs = []
+    for _ in range(count):
+        config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+        if messages:
+            agent.update_state(config, {"messages": messages})
+        configs.append(config)
+    return configs
+
+
+def setup_chapter4_memory(history, iterations):
+    agent = load_chapter("chapter4/memory_saver.py").agent_with_memory
+    _fake_model()
+    configs = _prefilled_threads(agent, history, iterations)
+
+    def run_once(i, callbacks=None):
+        config = {**configs[i % len(configs)], "callbacks": callbacks or []}
+        agent.invoke({"messages": [("user", "私の名前を覚えていますか？")]}, config)
+    return run_once
+
+
+def setup_chapter5_interrupt_resume(history, iterations):
+    agent = load_chapter("chapter5/human_in_loop.py").agent
+    _fake_model()
+    configs = _prefilled_threads(agent, history, iterations)
+
+    def run_once(i, callbacks=None):
+        config = {**configs[i % len(configs)], "callbacks": callbacks or []}
+        # get_info は自動承認されて止まらないので、承認が必要な send_email を呼ばせる
+        for _ in agent.stream({"messages": [("user", "test@example.comに「定例」という件名でメールを送って")]}, config):
+            pass
+        if agent.get_state(config).next:
+            for _ in agent.stream(None, config):
+                pass
+    return run_once
+
+
+# シナリオ名 -> (setup関数, 変化させるパラメータ名, 値のリスト)
+SCENARIOS = {
+    "chapter2_chatbot": (setup_chapter2_chatbot, "history", [0, 10, 100, 1000]),
+    "chapter3_multiply_tool": (
+        _setup_tool_loop("chapter3/multiply_tool.py", "multiply", {"a": 3, "b": 4}),
+        "tool_depth", [1, 2, 4, 8],
+    ),
+    "chapter3_multi_tools": (
+        _setup_tool_loop("chapter3/multi_tools.py", "add", {"a": 1, "b": 2}),
+        "tool_depth", [1, 2, 4, 8],
+    ),
+    "chapter4_memory": (setup_chapter4_memory, "history", [0, 10, 100, 1000]),
+    "chapter5_interrupt_resume": (setup_chapter5_interrupt_resume, "history", [0, 10, 100, 1000]),
+}
+
+
+# ========================================
+# 計測（子プロセス側）
+# ========================================
+
+def run_case(scenario, value, iterations, warmup):
+    setup, param, _ = SCENARIOS[scenario]
+    # 履歴スレッドは計測パスごとに使い回すので、全パス分を用意する
+    alloc_repeat = max(1, iterations // 10)
+    run_once = setup(value, warmup + iterations * 2 + alloc_repeat)
+
+    for i in range(warmup):
+        run_once(i)
+
+    # 1) スループット（コールバックなし）
+    offset = warmup
+    start = time.perf_counter()
+    for i in range(iterations):
+        run_once(offset + i)
+    elapsed = time.perf_counter() - start
+
+    # 2) ノードごとの処理時間
+    offset += iterations
+    timer = NodeTimer()
+    for i in range(iterations):
+        run_once(offset + i, [timer])
+
+    # 3) メモリ割り当て
+    offset += iterations
+    alloc = measure_allocations(lambda i: run_once(offset + i), alloc_repeat)
+
+    return {
+        "scenario": scenario,
+        "param": param,
+        "value": value,
+        "iterations": iterations,
+        "invocations_per_sec": iterations / elapsed,
+        "mean_invoke_ms": elapsed / iterations * 1000,
+        "nodes": {node: summarize(d) for node, d in timer.durations.items()},
+        "alloc": alloc,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+# ========================================
+# 実行（親プロセス側）
+# ========================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="実行するシナリオ（複数指定可、省略時はすべて）")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--ttft", type=float, default=0.0, help="フェイクモデルの初回トークン遅延（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="フェイクモデルのトークンごとの遅延（秒）")
+    parser.add_argument("--output", type=Path, help="結果JSONの出力先")
+    parser.add_argument("--case", nargs=2, metavar=("SCENARIO", "VALUE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft, per_token_latency=args.token_latency)
+
+    if args.case:
+        scenario, value = args.case
+        print(json.dumps(run_case(scenario, int(value), args.iterations, args.warmup)))
+        return
+
+    results = []
+    for scenario in args.scenario or SCENARIOS:
+        _, param, values = SCENARIOS[scenario]
+        for value in values:
+            result = run_isolated(__file__, [
+                "--case", scenario, str(value),
+                "--iterations", str(args.iterations), "--warmup", str(args.warmup),
+                "--ttft", str(args.ttft), "--token-latency", str(args.token_latency),
+            ])
+            nodes = ", ".join(
+                f"{node} p50={s['p50_ms']:.2f}ms p99={s['p99_ms']:.2f}ms"
+                for node, s in result["nodes"].items()
+            )
+            print(f"{scenario:28s} {param}={value:<5d} "
+                  f"{result['invocations_per_sec']:8.1f} inv/s  rss={result['peak_rss_kb'] // 1024}MB  {nodes}")
+            results.append(result)
+
+    output = args.output or default_output("graphs")
+    write_results(output, {
+        "benchmark": "graphs",
+        "environment": environment_info(),
+        "settings": {"iterations": args.iterations, "warmup": args.warmup,
+                     "ttft": args.ttft, "token_latency": args.token_latency},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
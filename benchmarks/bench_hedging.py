@@ -0,0 +1,156 @@
+"""
+LLM呼び出しのヘッジ（common/hedging.py）での裾のレイテンシ
+
+chapter2/simple_chat.py のグラフ（chatbot ノード1つ）に --requests 件を --concurrency 件ずつ同時に送り、
+- off: これまでどおり
+- hedged: HEDGE=1（最初のトークンが p95 のしきい値までに届かなければ、同じリクエストをもう1つ送る）
+のレイテンシ（p50 / p95 / p99 / 最大）と、ヘッジで増えたリクエストの割合・ヘッジが勝った回数を比較します。
+
+フェイクモデルの初回トークンまでの遅延は --ttft に対数正規分布のばらつき（--ttft-jitter）をかけ、
+--slow-rate の割合の呼び出しに --slow-latency 秒を加えます（まれに極端に遅い呼び出し）。
+しきい値の履歴と予算がたまるまでの --warmup 件は、どちらのモードでも計測から除きます。
+ヘッジの予算としきい値の履歴はプロセス全体で共有するので、ケースごとに子プロセスで実行します。
+
+使い方:
+    python3 benchmarks/bench_hedging.py
+    python3 benchmarks/bench_hedging.py --slow-rate 0.05 --hedge-budget 0.1 --api async
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    percentile,
+    run_isolated,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+
+MODES = ("off", "hedged")
+
+
+def run_sync(graph, prompts, concurrency):
+    def one(prompt):
+        t0 = time.perf_counter()
+        graph.invoke({"messages": [("user", prompt)]})
+        return time.perf_counter() - t0
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(one, prompts))
+
+
+async def run_async(graph, prompts, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(prompt):
+        async with semaphore:
+            t0 = time.perf_counter()
+            await graph.ainvoke({"messages": [("user", prompt)]})
+            return time.perf_counter() - t0
+
+    return await asyncio.gather(*(one(p) for p in prompts))
+
+
+def run_case(mode, api, args):
+    """子プロセス側: 1つのモード・APIで全件を実行する"""
+    os.environ["HEDGE"] = "1" if mode == "hedged" else ""
+    os.environ["HEDGE_BUDGET"] = str(args.hedge_budget)
+    os.environ["HEDGE_PERCENTILE"] = str(args.percentile)
+    from common.llm import get_llm
+
+    module = load_chapter("chapter2/simple_chat.py")
+    run = (lambda prompts: run_sync(module.graph, prompts, args.concurrency)) if api == "sync" else (
+        lambda prompts: asyncio.run(run_async(module.graph, prompts, args.concurrency)))
+    run([f"ウォームアップ{i}" for i in range(args.warmup)])
+    model = get_llm()
+    before = model.stats() if mode == "hedged" else None
+
+    t0 = time.perf_counter()
+    latencies = run([f"質問{i}: LangGraphとは？" for i in range(args.requests)])
+    wall = time.perf_counter() - t0
+
+    hedging = None
+    if mode == "hedged":
+        stats = model.stats()
+        hedging = {k: stats[k] - before[k] for k in ("requests", "hedged", "hedge_wins", "primary_wins")}
+        hedging["extra_ratio"] = hedging["hedged"] / hedging["requests"]
+        hedging["threshold_ms"] = stats["threshold_ms"]
+        hedging["budget"] = stats["budget"]
+    return {
+        "mode": mode,
+        "api": api,
+        "latency": summarize(latencies),
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "throughput_rps": len(latencies) / wall,
+        "hedging": hedging,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ttft", type=float, default=0.1)
+    parser.add_argument("--ttft-jitter", type=float, default=0.25, help="初回トークンまでの遅延のばらつき（sigma）")
+    parser.add_argument("--token-latency", type=float, default=0.002)
+    parser.add_argument("--slow-rate", type=float, default=0.02, help="極端に遅い呼び出しの割合")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="遅い呼び出しに加わる遅延（秒）")
+    parser.add_argument("--percentile", type=float, default=95.0, help="ヘッジのしきい値のパーセンタイル")
+    parser.add_argument("--hedge-budget", type=float, default=0.05, help="ヘッジで増えるリクエストの割合の上限")
+    parser.add_argument("--api", nargs="+", default=["sync", "async"], choices=["sync", "async"])
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft, per_token_latency=args.token_latency, ttft_jitter=args.ttft_jitter,
+                     slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+
+    if args.case:
+        mode, api = args.case.split(":")
+        print(json.dumps(run_case(mode, api, args)))
+        return
+
+    results = []
+    for api in args.api:
+        for mode in MODES:
+            r = run_isolated(__file__, [
+                "--case", f"{mode}:{api}", "--requests", str(args.requests), "--warmup", str(args.warmup),
+                "--concurrency", str(args.concurrency), "--ttft", str(args.ttft),
+                "--ttft-jitter", str(args.ttft_jitter), "--token-latency", str(args.token_latency),
+                "--slow-rate", str(args.slow_rate), "--slow-latency", str(args.slow_latency),
+                "--percentile", str(args.percentile), "--hedge-budget", str(args.hedge_budget),
+            ])
+            results.append(r)
+            line = (f"{api:>5s} {mode:>6s}: p50 {r['latency']['p50_ms']:6.1f}ms  p95 {r['p95_ms']:6.1f}ms  "
+                    f"p99 {r['latency']['p99_ms']:7.1f}ms  最大 {r['max_ms']:7.1f}ms")
+            if h := r["hedging"]:
+                line += (f"  ヘッジ {h['hedged']}件（+{h['extra_ratio']:.1%}）  ヘッジが勝った {h['hedge_wins']}件  "
+                         f"しきい値 {h['threshold_ms']:.1f}ms")
+            print(line)
+
+    output = args.output or default_output("hedging")
+    write_results(output, {
+        "benchmark": "hedging",
+        "environment": environment_info(),
+        "settings": {k: getattr(args, k) for k in (
+            "requests", "warmup", "concurrency", "ttft", "ttft_jitter", "token_latency", "slow_rate",
+            "slow_latency", "percentile", "hedge_budget", "api")},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+ローカルのルーター（common/local_router.py）のショートカットの効果
+
+chapter3/multiply_tool.py のエージェントに、
+- simple: 「AかけるBは？」（ツールだけで答えられる）
+- chain: 「AかけるBの結果にCをかけた結果は？」（ツールを2回使う。ルーターは確信が持てないので任せる）
+- general: ツールの要らない質問
+を混ぜて --requests 件ずつ順番に送り、
+- off: ルーターなし（これまでどおり chatbot から始まる）
+- llm: LOCAL_ROUTER=llm（ルーターが tool_call を作り、LLMは結果の文章化の1回だけ）
+- template: LOCAL_ROUTER=template（ルーターがツールを実行してテンプレートで答える。LLMは呼ばない）
+のショートカットした割合・1件あたりのLLMの呼び出し回数・レイテンシ（全体と質問の種類ごと）を比較します。
+グラフはスクリプトの読み込み時に組み立てるので、モードごとに子プロセスで実行します。
+
+使い方:
+    python3 benchmarks/bench_local_router.py
+    python3 benchmarks/bench_local_router.py --requests 300 --simple-ratio 0.8 --ttft 0.2
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    run_isolated,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+
+MODES = ("off", "llm", "template")
+
+
+def messages(n, simple_ratio, seed=0):
+    """(種類, 発話) のリスト。simple 以外は chain と general を半分ずつ"""
+    rng = random.Random(seed)
+    items = []
+    for i in range(n):
+        a, b, c = rng.randint(2, 999), rng.randint(2, 999), rng.randint(2, 9)
+        r = rng.random()
+        if r < simple_ratio:
+            items.append(("simple", f"{a}かける{b}は？"))
+        elif r < simple_ratio + (1 - simple_ratio) / 2:
+            items.append(("chain", f"{a}かける{b}の結果に{c}をかけた結果は？"))
+        else:
+            items.append(("general", f"質問{i}: LangGraphとは何ですか？"))
+    return items
+
+
+def run_mode(mode, args):
+    """子プロセス側: 1つのモードで全件を実行する"""
+    os.environ["LOCAL_ROUTER"] = "" if mode == "off" else mode
+    module = load_chapter("chapter3/multiply_tool.py")
+    items = messages(args.requests, args.simple_ratio)
+    module.agent.invoke({"messages": [("user", "こんにちは")]})  # ウォームアップ
+
+    latencies, by_kind, llm_calls, routed = [], {}, 0, 0
+    for kind, text in items:
+        t0 = time.perf_counter()
+        result = module.agent.invoke({"messages": [("user", text)]})
+        elapsed = time.perf_counter() - t0
+        latencies.append(elapsed)
+        by_kind.setdefault(kind, []).append(elapsed)
+        # LLMが返したメッセージには使用量が付く（ルーターが作った tool_call には付かない）
+        llm_calls += sum(1 for m in result["messages"] if getattr(m, "usage_metadata", None))
+        routed += result["messages"][1].usage_metadata is None
+    return {
+        "mode": mode,
+        "routed_ratio": routed / len(items),
+        "llm_calls_per_request": llm_calls / len(items),
+        "latency": summarize(latencies),
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "by_kind": {kind: summarize(v) for kind, v in sorted(by_kind.items())},
+        "router": module.router.stats() if module.router.enabled else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--simple-ratio", type=float, default=0.6, help="ツールだけで答えられる質問の割合")
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.002)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft, per_token_latency=args.token_latency)
+
+    if args.case:
+        print(json.dumps(run_mode(args.case, args)))
+        return
+
+    results = []
+    for mode in MODES:
+        results.append(run_isolated(__file__, [
+            "--case", mode, "--requests", str(args.requests), "--simple-ratio", str(args.simple_ratio),
+            "--ttft", str(args.ttft), "--token-latency", str(args.token_latency),
+        ]))
+    base = results[0]["mean_ms"]
+    for r in results:
+        r["saved_ms_per_request"] = base - r["mean_ms"]
+        kinds = "  ".join(f"{k} p50 {s['p50_ms']:6.1f}ms" for k, s in r["by_kind"].items())
+        print(f"{r['mode']:>8s}: ショートカット {r['routed_ratio']:6.1%}  LLM呼び出し {r['llm_calls_per_request']:.2f}回/件  "
+              f"平均 {r['mean_ms']:6.1f}ms（off との差 {-r['saved_ms_per_request']:+6.1f}ms）  {kinds}")
+
+    output = args.output or default_output("local_router")
+    write_results(output, {
+        "benchmark": "local_router",
+        "environment": environment_info(),
+        "settings": {"requests": args.requests, "simple_ratio": args.simple_ratio,
+                     "ttft": args.ttft, "token_latency": args.token_latency},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
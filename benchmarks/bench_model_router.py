@@ -0,0 +1,181 @@
+"""
+モデルのルーティング（common/model_router.py）での料金・レイテンシ・エスカレーションの割合
+
+chapter3/multi_tools.py のエージェントに、
+- greeting: 「こんにちは！」のような挨拶
+- tool: ツールを1つ使う質問（掛け算・天気）
+- multi: ツールを2つ使う質問（ルーターは2番目の tier から始める）
+- long: 長い質問（ルーターは2番目の tier から始める）
+を混ぜて --requests 件ずつ順番に送り、
+- single: これまでどおり、すべて gemini-2.0-flash
+- routed: MODEL_ROUTER=1（gemini-2.0-flash-lite から始め、必要なときだけ gemini-2.0-flash）
+の1件あたりのLLMの呼び出し回数・料金（1000件あたりのドル）・レイテンシ（全体と質問の種類ごと）を比較します。
+
+フェイクモデルの tier ごとの速さは --light-ttft / --light-token-latency と --ttft / --token-latency で指定します。
+軽いモデルの弱さの代わりに、軽いモデルの tool_call の --light-error-rate の割合で引数を壊します
+（ルーターはそれを検出して通常のモデルで呼び直す）。料金は PRICES の公開価格の例で計算します。
+llm はスクリプトの読み込み時ではなく最初の呼び出しで作るので、モードごとに子プロセスで実行します。
+
+使い方:
+    python3 benchmarks/bench_model_router.py
+    python3 benchmarks/bench_model_router.py --requests 500 --light-error-rate 0.3
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    run_isolated,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+
+MODES = ("single", "routed")
+CITIES = ("東京", "大阪", "福岡")
+LONG_QUESTION = ("LangGraphでエージェントを作るときに、状態の設計・ノードの分け方・条件付きエッジの使い方・"
+                 "チェックポインターの選び方について、それぞれ気をつけることを初心者にもわかるように説明してください。") * 2
+
+
+def messages(n, seed=0):
+    """(種類, 発話) のリスト（greeting 30% / tool 40% / multi 20% / long 10%）"""
+    rng = random.Random(seed)
+    items = []
+    for i in range(n):
+        a, b, city = rng.randint(2, 99), rng.randint(2, 99), rng.choice(CITIES)
+        r = rng.random()
+        if r < 0.3:
+            items.append(("greeting", f"こんにちは！（{i}）"))
+        elif r < 0.7:
+            items.append(("tool", f"{a}かける{b}は？" if rng.random() < 0.5 else f"{city}の天気を教えて"))
+        elif r < 0.9:
+            items.append(("multi", f"{a}かける{b}は？あと{city}の天気も"))
+        else:
+            items.append(("long", f"（{i}）{LONG_QUESTION}"))
+    return items
+
+
+def weak_responder(error_rate, seed=0):
+    """ルールベースの応答のうち、tool_call の引数を error_rate の割合で壊す（軽いモデルの代わり）"""
+    from common.fake_llm import rule_based_responder
+
+    rng = random.Random(seed)
+
+    def respond(messages, tools):
+        message = rule_based_responder(messages, tools)
+        if message.tool_calls and rng.random() < error_rate:
+            message.tool_calls = [{**tc, "args": {}} for tc in message.tool_calls]
+        return message
+
+    return respond
+
+
+def run_mode(mode, args):
+    """子プロセス側: 1つのモードで全件を実行する"""
+    os.environ["MODEL_ROUTER"] = "1" if mode == "routed" else ""
+    from common.llm import DEFAULT_MODEL, default_llm
+    from common.model_router import PRICES
+
+    module = load_chapter("chapter3/multi_tools.py")
+    model = default_llm()
+    if mode == "routed":
+        for tier, fake in model.models().items():
+            if tier != DEFAULT_MODEL:
+                fake.ttft, fake.per_token_latency = args.light_ttft, args.light_token_latency
+                fake.responder = weak_responder(args.light_error_rate)
+    items = messages(args.requests)
+    module.agent.invoke({"messages": [("user", "こんにちは")]})  # ウォームアップ
+    before = model.stats() if mode == "routed" else None
+
+    input_price, output_price = PRICES[DEFAULT_MODEL]
+    latencies, by_kind, llm_calls, cost = [], {}, 0, 0.0
+    for kind, text in items:
+        t0 = time.perf_counter()
+        result = module.agent.invoke({"messages": [("user", text)]})
+        elapsed = time.perf_counter() - t0
+        latencies.append(elapsed)
+        by_kind.setdefault(kind, []).append(elapsed)
+        for m in result["messages"]:
+            if usage := getattr(m, "usage_metadata", None):
+                llm_calls += 1 + len(m.response_metadata.get("model_routing", {}).get("escalations", ()))
+                cost += (usage["input_tokens"] * input_price + usage["output_tokens"] * output_price) / 1_000_000
+
+    routing = None
+    if mode == "routed":
+        stats = model.stats()
+        requests = stats["requests"] - before["requests"]
+        routing = {
+            "escalation_rate": (stats["escalations"] - before["escalations"]) / requests,
+            "routes": {k: v - before["routes"].get(k, 0) for k, v in stats["routes"].items()},
+            "escalation_reasons": stats["escalation_reasons"],
+            "tiers": {tier: {k: s[k] - before["tiers"][tier][k] for k in ("calls", "answered", "cost_usd")}
+                      for tier, s in stats["tiers"].items()},
+        }
+        cost = sum(s["cost_usd"] for s in routing["tiers"].values())
+    return {
+        "mode": mode,
+        "llm_calls_per_request": llm_calls / len(items),
+        "cost_per_1k_usd": cost / len(items) * 1000,
+        "latency": summarize(latencies),
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "by_kind": {kind: summarize(v) for kind, v in sorted(by_kind.items())},
+        "routing": routing,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--ttft", type=float, default=0.12, help="通常のモデルの初回トークンまでの遅延（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.004)
+    parser.add_argument("--light-ttft", type=float, default=0.05, help="軽いモデルの初回トークンまでの遅延（秒）")
+    parser.add_argument("--light-token-latency", type=float, default=0.0015)
+    parser.add_argument("--light-error-rate", type=float, default=0.1, help="軽いモデルが tool_call を壊す割合")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft, per_token_latency=args.token_latency)
+
+    if args.case:
+        print(json.dumps(run_mode(args.case, args)))
+        return
+
+    results = []
+    for mode in MODES:
+        results.append(run_isolated(__file__, [
+            "--case", mode, "--requests", str(args.requests), "--ttft", str(args.ttft),
+            "--token-latency", str(args.token_latency), "--light-ttft", str(args.light_ttft),
+            "--light-token-latency", str(args.light_token_latency), "--light-error-rate", str(args.light_error_rate),
+        ]))
+    for r in results:
+        kinds = "  ".join(f"{k} p50 {s['p50_ms']:6.1f}ms" for k, s in r["by_kind"].items())
+        print(f"{r['mode']:>7s}: LLM呼び出し {r['llm_calls_per_request']:.2f}回/件  料金 ${r['cost_per_1k_usd']:.4f}/1000件  "
+              f"平均 {r['mean_ms']:6.1f}ms  p99 {r['latency']['p99_ms']:6.1f}ms  {kinds}")
+        if r["routing"]:
+            routing = r["routing"]
+            tiers = "  ".join(f"{tier} {s['answered']}件（料金 ${s['cost_usd']:.4f}）" for tier, s in routing["tiers"].items())
+            print(f"         エスカレーション（LLM呼び出しあたり） {routing['escalation_rate']:.1%}  分類 {routing['routes']}  {tiers}")
+
+    output = args.output or default_output("model_router")
+    write_results(output, {
+        "benchmark": "model_router",
+        "environment": environment_info(),
+        "settings": {"requests": args.requests, "ttft": args.ttft, "token_latency": args.token_latency,
+                     "light_ttft": args.light_ttft, "light_token_latency": args.light_token_latency,
+                     "light_error_rate": args.light_error_rate},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+ツールノードの並列実行ベンチマーク
+
+1つの AIMessage に K 個の tool_calls がある状態で、I/O待ちのあるツール
+（--tool-latency 秒スリープ）を実行するのにかかる時間を比較します。
+
+- sequential: ParallelToolNode(max_concurrency=1)（1つずつ順番に実行）
+- parallel-N: ParallelToolNode(max_concurrency=N)
+- ToolNode: langgraph.prebuilt.ToolNode
+
+使い方:
+    python3 benchmarks/bench_parallel_tools.py
+    python3 benchmarks/bench_parallel_tools.py --calls 1 4 16 --tool-latency 0.2
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from typing import Annotated
+from typing_extensions import TypedDict
+from langchain_core.messages import AIMessage
+from langchain_core.tools import StructuredTool
+from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages
+from langgraph.prebuilt import ToolNode
+
+from benchmarks.harness import default_output, environment_info, summarize, write_results
+from common.tool_node import ParallelToolNode
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+def tools_graph(node):
+    """ツールノードだけのグラフ（START -> tools -> END）"""
+    builder = StateGraph(State)
+    builder.add_node("tools", node)
+    builder.add_edge(START, "tools")
+    builder.add_edge("tools", END)
+    return builder.compile()
+
+
+def make_io_tool(latency):
+    """latency 秒のI/O待ちがある検索ツール（同期版・非同期版）"""
+    def search_weather(city: str) -> str:
+        """指定した都市の天気を検索します。"""
+        time.sleep(latency)
+        return f"{city}: 晴れ"
+
+    async def asearch_weather(city: str) -> str:
+        await asyncio.sleep(latency)
+        return f"{city}: 晴れ"
+
+    return StructuredTool.from_function(func=search_weather, coroutine=asearch_weather)
+
+
+def _state(k):
+    calls = [{"name": "search_weather", "args": {"city": f"都市{i}"}, "id": f"call_{i}"} for i in range(k)]
+    return {"messages": [AIMessage(content="", tool_calls=calls)]}
+
+
+def _check_order(result, k):
+    ids = [m.tool_call_id for m in result["messages"][1:]]
+    assert ids == [f"call_{i}" for i in range(k)], ids
+
+
+def bench(graph, k, repeat, mode):
+    state = _state(k)
+    durations = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = graph.invoke(state) if mode == "sync" else asyncio.run(graph.ainvoke(state))
+        durations.append(time.perf_counter() - t0)
+        _check_order(result, k)
+    return summarize(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--tool-latency", type=float, default=0.1)
+    parser.add_argument("--max-concurrency", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    tools = [make_io_tool(args.tool_latency)]
+    nodes = {"sequential": ParallelToolNode(tools, max_concurrency=1)}
+    for n in args.max_concurrency:
+        nodes[f"parallel-{n}"] = ParallelToolNode(tools, max_concurrency=n)
+    nodes["ToolNode"] = ToolNode(tools)
+    graphs = {name: tools_graph(node) for name, node in nodes.items()}
+
+    results = []
+    print(f"{'K':>3s} {'mode':>6s} " + " ".join(f"{name:>13s}" for name in nodes))
+    for k in args.calls:
+        for mode in ("sync", "async"):
+            row = []
+            for name, graph in graphs.items():
+                stats = bench(graph, k, args.repeat, mode)
+                results.append({"calls": k, "mode": mode, "node": name, "wall": stats})
+                row.append(f"{stats['p50_ms']:11.1f}ms")
+            print(f"{k:3d} {mode:>6s} " + " ".join(row))
+
+    output = args.output or default_output("parallel-tools")
+    write_results(output, {
+        "benchmark": "parallel-tools",
+        "environment": environment_info(),
+        "settings": {"tool_latency": args.tool_latency, "repeat": args.repeat},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
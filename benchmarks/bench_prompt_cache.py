@@ -0,0 +1,92 @@
+"""
+プレフィックスキャッシュ（CachedPrefix）のベンチマーク
+
+chapter3/multi_tools.py のエージェントで「ツール呼び出し → 回答」の会話を --conversations 件実行し、
+LLM呼び出し1回あたりの
+- プロンプトのトークン数（うちキャッシュから読まれた分と、実際に処理された分）
+- chatbot ノードのレイテンシ
+をキャッシュあり（PROMPT_CACHE=1）/ なしで比較します。
+フェイクモデルには入力トークンあたりの処理時間（--input-token-latency）を設定し、
+キャッシュ済みのプレフィックスは処理時間に含めません。
+
+使い方:
+    python3 benchmarks/bench_prompt_cache.py
+    python3 benchmarks/bench_prompt_cache.py --conversations 500 --input-token-latency 0.0001
+"""
+import argparse
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    NodeTimer,
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.prompt_cache import CachedPrefix
+
+QUESTIONS = ["25と75を足すといくつ？", "12かける8は？", "東京の天気を教えて", "LangGraphとは何ですか？"]
+
+
+def run(prompt_cache, conversations):
+    module = load_chapter("chapter3/multi_tools.py")
+    # chatbot ノードが参照するモデルを差し替える（PROMPT_CACHE の切り替えと同じ）
+    module.llm_with_tools = CachedPrefix(module.llm, module.SYSTEM_PROMPT, module.tools, enabled=prompt_cache)
+    agent = module.agent
+    timer = NodeTimer()
+    calls = []
+    for i in range(conversations):
+        result = agent.invoke({"messages": [("user", QUESTIONS[i % len(QUESTIONS)])]}, {"callbacks": [timer]})
+        for m in result["messages"]:
+            if m.type == "ai" and m.usage_metadata:
+                usage = m.usage_metadata
+                cached = usage.get("input_token_details", {}).get("cache_read", 0)
+                calls.append((usage["input_tokens"], cached))
+    n = len(calls)
+    return {
+        "prompt_cache": prompt_cache,
+        "llm_calls": n,
+        "input_tokens_per_call": sum(t for t, _ in calls) / n,
+        "cached_tokens_per_call": sum(c for _, c in calls) / n,
+        "processed_tokens_per_call": sum(t - c for t, c in calls) / n,
+        "chatbot": summarize(timer.durations["chatbot"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--input-token-latency", type=float, default=0.00005)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend(per_input_token_latency=args.input_token_latency)
+    results = [run(False, args.conversations), run(True, args.conversations)]
+
+    print(f"{'cache':>6s} {'calls':>6s} {'input':>8s} {'cached':>8s} {'processed':>10s} {'p50':>9s} {'p99':>9s}")
+    for r in results:
+        print(f"{'on' if r['prompt_cache'] else 'off':>6s} {r['llm_calls']:6d} "
+              f"{r['input_tokens_per_call']:8.1f} {r['cached_tokens_per_call']:8.1f} "
+              f"{r['processed_tokens_per_call']:10.1f} "
+              f"{r['chatbot']['p50_ms']:7.3f}ms {r['chatbot']['p99_ms']:7.3f}ms")
+    off, on = results
+    saved = off["processed_tokens_per_call"] - on["processed_tokens_per_call"]
+    print(f"\n1回あたりの処理トークン: -{saved:.1f} ({saved / off['processed_tokens_per_call']:.0%})  "
+          f"chatbot p50: {on['chatbot']['p50_ms'] - off['chatbot']['p50_ms']:+.3f}ms")
+
+    output = args.output or default_output("prompt-cache")
+    write_results(output, {
+        "benchmark": "prompt-cache",
+        "environment": environment_info(),
+        "settings": {"conversations": args.conversations, "input_token_latency": args.input_token_latency},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+クライアント側のレート制限（RateLimitedChatModel）のベンチマーク
+
+1秒あたり --quota 件までしか受け付けない（超えると 429 を返す）フェイクのプロバイダに対して、
+chapter3/multi_tools.py のエージェントで --conversations 件の会話を同時に ainvoke し、
+- 制限なし（429 を受けた会話を呼び出し側ですぐに再試行する）
+- AIMD（同時実行数を 429 で半分にし、成功で少しずつ増やす）
+- AIMD + requests/min のトークンバケット（クォータの9割に設定）
+で、完了件数・プロバイダが返した 429 の数・経過時間・会話あたりのレイテンシを比較します。
+
+使い方:
+    python3 benchmarks/bench_rate_limit.py
+    python3 benchmarks/bench_rate_limit.py --conversations 1000 --quota 100 --ttft 0.1
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.llm import get_llm
+from common.prompt_cache import CachedPrefix
+from common.rate_limit import RateLimitedChatModel, RateLimiter, status_code
+
+QUESTIONS = ["25と75を足すといくつ？", "12かける8は？", "東京の天気を教えて", "LangGraphとは何ですか？"]
+
+
+async def converse(agent, question, retries, counter):
+    """1件の会話。429 で失敗したら（制限なしの場合）少し待ってやり直す"""
+    t0 = time.perf_counter()
+    for _ in range(retries + 1):
+        try:
+            await agent.ainvoke({"messages": [("user", question)]})
+            return time.perf_counter() - t0
+        except Exception as e:
+            if status_code(e) != 429:
+                raise
+            counter["429"] += 1
+            await asyncio.sleep(0.05)
+    return None
+
+
+async def run_case(module, label, model, args):
+    module.llm_with_tools = CachedPrefix(model, module.SYSTEM_PROMPT, module.tools)
+    counter = {"429": 0}
+    # 制限ありのモデルは自分で再試行するので、呼び出し側では再試行しない
+    retries = 0 if isinstance(model, RateLimitedChatModel) else args.caller_retries
+    t0 = time.perf_counter()
+    latencies = await asyncio.gather(*(
+        converse(module.agent, QUESTIONS[i % len(QUESTIONS)], retries, counter)
+        for i in range(args.conversations)
+    ), return_exceptions=True)
+    elapsed = time.perf_counter() - t0
+    done = [x for x in latencies if isinstance(x, float)]
+    result = {
+        "limiter": label,
+        "completed": len(done),
+        "failed": args.conversations - len(done),
+        "elapsed_s": elapsed,
+        "goodput_per_s": len(done) / elapsed,
+        "latency": summarize(done),
+        "provider_429": counter["429"],
+    }
+    if isinstance(model, RateLimitedChatModel):
+        stats = model.stats()
+        result["provider_429"] += stats["throttled"]
+        result["limiter_stats"] = stats
+    return result
+
+
+async def main_async(args):
+    module = load_chapter("chapter3/multi_tools.py")
+    provider = get_llm(rate_limit=args.quota)
+
+    def limited(rpm=None):
+        limiter = RateLimiter(rpm=rpm, max_concurrency=args.max_concurrency)
+        return RateLimitedChatModel(inner=provider, limiter=limiter, backoff=args.backoff)
+
+    cases = [
+        ("none", provider),
+        ("aimd", limited()),
+        ("aimd+rpm", limited(rpm=args.quota * 60 * 0.9)),
+    ]
+    results = []
+    print(f"{'limiter':>10s} {'done':>6s} {'failed':>6s} {'429s':>6s} {'elapsed':>9s} {'conv/s':>8s} "
+          f"{'p50':>9s} {'p99':>9s}")
+    for label, model in cases:
+        r = await run_case(module, label, model, args)
+        results.append(r)
+        lat = r["latency"]
+        print(f"{label:>10s} {r['completed']:6d} {r['failed']:6d} {r['provider_429']:6d} {r['elapsed_s']:8.2f}s "
+              f"{r['goodput_per_s']:8.1f} {lat.get('p50_ms', 0):7.0f}ms {lat.get('p99_ms', 0):7.0f}ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=300)
+    parser.add_argument("--quota", type=float, default=50, help="プロバイダが1秒あたりに受け付けるリクエスト数")
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--backoff", type=float, default=0.2)
+    parser.add_argument("--caller-retries", type=int, default=20)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft)
+    results = asyncio.run(main_async(args))
+
+    output = args.output or default_output("rate-limit")
+    write_results(output, {
+        "benchmark": "rate-limit",
+        "environment": environment_info(),
+        "settings": {
+            "conversations": args.conversations, "quota": args.quota, "ttft": args.ttft,
+            "max_concurrency": args.max_concurrency, "backoff": args.backoff,
+            "caller_retries": args.caller_retries,
+        },
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+応答キャッシュ（CachedChatModel）のベンチマーク
+
+chapter3/multi_tools.py のエージェントに、同じ質問が繰り返し来るトラフィック
+（質問の出現頻度がZipf分布に従い、一部は毎回異なる質問）を --requests 件流し、
+キャッシュなし / 完全一致（メモリ・SQLite）/ 完全一致 + 類似検索 で
+- 1件あたりのレイテンシ（p50 / p99）
+- ヒット率、キャッシュしなかった件数（get_current_time を含む会話）
+- ヒットによって省けたLLMの時間（推定）
+- キャッシュなしと最終回答が異なった件数（類似検索の誤ヒットの確認。時刻の質問は除く）
+を比較します。
+
+使い方:
+    python3 benchmarks/bench_response_cache.py
+    python3 benchmarks/bench_response_cache.py --requests 2000 --ttft 0.1
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.llm import get_llm
+from common.prompt_cache import CachedPrefix
+from common.response_cache import CachedChatModel, MemoryStore, SemanticIndex, SqliteStore
+
+QUESTIONS = [
+    "東京の天気を教えて", "今何時？", "25と75を足すといくつ？", "12かける8は？",
+    "大阪の天気を教えて", "LangGraphとは何ですか？", "福岡の天気を教えて", "3と4を足すといくつ？",
+]
+# 表記ゆれ（類似検索でヒットさせたい質問）
+VARIANTS = {"東京の天気を教えて": "東京の天気を教えてください", "12かける8は？": "12かける8は?"}
+
+
+def traffic(n, unique_rate, seed=0):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(QUESTIONS))]
+    for i in range(n):
+        if rng.random() < unique_rate:
+            yield f"質問{i}について教えて"
+            continue
+        question = rng.choices(QUESTIONS, weights)[0]
+        if question in VARIANTS and rng.random() < 0.3:
+            question = VARIANTS[question]
+        yield question
+
+
+def run(label, model, requests):
+    module = load_chapter("chapter3/multi_tools.py")
+    module.llm_with_tools = CachedPrefix(model, module.SYSTEM_PROMPT, module.tools)
+    latencies, answers = [], []
+    for question in requests:
+        t0 = time.perf_counter()
+        result = module.agent.invoke({"messages": [("user", question)]})
+        latencies.append(time.perf_counter() - t0)
+        answers.append(result["messages"][-1].content)
+    result = {"cache": label, "latency": summarize(latencies)}
+    if isinstance(model, CachedChatModel):
+        result["stats"] = model.stats()
+    return result, answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--unique-rate", type=float, default=0.1)
+    parser.add_argument("--ttft", type=float, default=0.02)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft)
+    requests = list(traffic(args.requests, args.unique_rate))
+    inner = get_llm()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [
+            ("none", inner),
+            ("memory", CachedChatModel(inner=inner, store=MemoryStore())),
+            ("sqlite", CachedChatModel(inner=inner, store=SqliteStore(os.path.join(tmp, "cache.sqlite")))),
+            ("memory+semantic", CachedChatModel(
+                inner=inner, store=MemoryStore(), semantic=SemanticIndex(threshold=args.threshold),
+            )),
+        ]
+        print(f"{'cache':>16s} {'p50':>9s} {'p99':>9s} {'hit rate':>9s} {'exact':>6s} {'similar':>7s} "
+              f"{'bypass':>6s} {'saved':>8s} {'mismatch':>8s}")
+        baseline = None
+        for label, model in cases:
+            r, answers = run(label, model, requests)
+            baseline = baseline or answers
+            r["mismatches"] = sum(
+                a != b for q, a, b in zip(requests, answers, baseline) if q != "今何時？"
+            )
+            results.append(r)
+            s = r.get("stats")
+            line = f"{label:>16s} {r['latency']['p50_ms']:7.2f}ms {r['latency']['p99_ms']:7.2f}ms"
+            if s:
+                line += (f" {s['hit_rate']:8.1%} {s['exact_hits']:6d} {s['semantic_hits']:7d} "
+                         f"{s['bypassed']:6d} {s['saved_seconds']:7.1f}s {r['mismatches']:8d}")
+            print(line)
+            if label == "sqlite":
+                model.store.close()
+
+    output = args.output or default_output("response-cache")
+    write_results(output, {
+        "benchmark": "response-cache",
+        "environment": environment_info(),
+        "settings": {"requests": args.requests, "unique_rate": args.unique_rate, "ttft": args.ttft},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
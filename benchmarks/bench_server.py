@@ -0,0 +1,209 @@
+"""
+ASGI サーバー（common/server.py）の負荷試験
+
+フェイクモデルのエージェントを公開した AgentServer に、プロセス内で直接（ネットワークなしで）
+ASGI のリクエストを送り、次の3つを確認します。--url を指定すると起動済みのサーバーに HTTP で送ります。
+
+- spread: --clients 件のクライアントがそれぞれ別の thread_id に invoke / stream を交互に送る
+  （スループット、レイテンシ、SSE の初回トークンまでの時間）
+- hot: 全クライアントが同じ thread_id に送る（同じスレッドは1つずつ実行され、
+  待ち行列を超えた分は 429 になる。最後に会話履歴のメッセージ数で取りこぼしがないかを確認）
+- keepalive: LLMの初回トークンが遅いときに、SSE のコメント行が届くか
+
+使い方:
+    python3 benchmarks/bench_server.py
+    python3 benchmarks/bench_server.py --clients 64 --requests 20
+    python3 common/server.py & python3 benchmarks/bench_server.py --url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+
+AGENT = "memory"
+
+
+class InProcessClient:
+    """ASGI アプリを直接呼ぶクライアント。応答本文の断片を届いた時刻と一緒に返す"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method, path, body=None):
+        t0 = time.perf_counter()
+        data = json.dumps(body).encode() if body is not None else b""
+        scope = {"type": "http", "method": method, "path": path, "headers": [], "query_string": b""}
+        sent = False
+        done = asyncio.Event()
+        response = {"status": None, "chunks": []}
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": data, "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message.get("body"):
+                response["chunks"].append((time.perf_counter() - t0, message["body"]))
+
+        await self.app(scope, receive, send)
+        done.set()
+        return response["status"], response["chunks"], time.perf_counter() - t0
+
+
+class HTTPClient:
+    """起動済みのサーバーに httpx で送るクライアント"""
+
+    def __init__(self, url):
+        import httpx
+        self.client = httpx.AsyncClient(base_url=url, timeout=None)
+
+    async def request(self, method, path, body=None):
+        t0 = time.perf_counter()
+        chunks = []
+        async with self.client.stream(method, path, json=body) as r:
+            async for chunk in r.aiter_raw():
+                chunks.append((time.perf_counter() - t0, chunk))
+        return r.status_code, chunks, time.perf_counter() - t0
+
+
+def first_token_s(chunks):
+    for t, chunk in chunks:
+        if b"event: token" in chunk:
+            return t
+    return None
+
+
+async def scenario_spread(client, args):
+    latencies, ttfts, statuses = [], [], {}
+
+    async def user(i):
+        for n in range(args.requests):
+            action = "stream" if n % 2 else "invoke"
+            status, chunks, elapsed = await client.request(
+                "POST", f"/agents/{AGENT}/threads/spread-{i}/{action}", {"message": f"質問{n}です"})
+            statuses[status] = statuses.get(status, 0) + 1
+            latencies.append(elapsed)
+            if action == "stream" and (ttft := first_token_s(chunks)) is not None:
+                ttfts.append(ttft)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(args.clients)))
+    elapsed = time.perf_counter() - t0
+    total = args.clients * args.requests
+    return {
+        "scenario": "spread", "requests": total, "statuses": statuses,
+        "throughput_per_s": total / elapsed, "latency": summarize(latencies), "stream_ttft": summarize(ttfts),
+    }
+
+
+async def scenario_hot(client, args):
+    statuses = {}
+    thread = f"hot-{time.time_ns()}"
+
+    async def user(i):
+        status, _, _ = await client.request("POST", f"/agents/{AGENT}/threads/{thread}/invoke", {"message": f"発言{i}"})
+        statuses[status] = statuses.get(status, 0) + 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(args.clients)))
+    elapsed = time.perf_counter() - t0
+    _, chunks, _ = await client.request("GET", f"/agents/{AGENT}/threads/{thread}/state")
+    messages = json.loads(b"".join(c for _, c in chunks))["values"]["messages"]
+    accepted = statuses.get(200, 0)
+    return {
+        "scenario": "hot", "requests": args.clients, "statuses": statuses, "elapsed_s": elapsed,
+        # 1回の invoke でユーザー発話と応答の2件が増える。並行に実行されると更新が失われて減る
+        "messages": len(messages), "expected_messages": 2 * accepted,
+    }
+
+
+async def scenario_keepalive(client, args):
+    status, chunks, elapsed = await client.request(
+        "POST", f"/agents/{AGENT}/threads/keepalive/stream", {"message": "こんにちは"})
+    pings = sum(c.count(b": keep-alive") for _, c in chunks)
+    return {"scenario": "keepalive", "status": status, "elapsed_s": elapsed, "keepalive_comments": pings,
+            "first_token_s": first_token_s(chunks)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=10, help="spread でクライアント1件あたりに送る数")
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.002)
+    parser.add_argument("--max-queue", type=int, default=4)
+    parser.add_argument("--url", help="起動済みのサーバー（省略時はプロセス内で実行）")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft, per_token_latency=args.token_latency)
+
+    async def run():
+        if args.url:
+            client = HTTPClient(args.url)
+            return [await scenario_spread(client, args), await scenario_hot(client, args)], None
+        from common.server import AgentServer, load_agents
+        agents = load_agents([AGENT])
+        server = AgentServer(agents, max_queue=args.max_queue)
+        results = [await scenario_spread(InProcessClient(server), args),
+                   await scenario_hot(InProcessClient(server), args)]
+        # keepalive: 初回トークンまで 0.5 秒かかるように共有のLLMの遅延を一時的に変え、
+        # 0.1 秒ごとにコメント行を送る
+        from common.llm import get_llm
+        model = get_llm()
+        original, model.ttft = model.ttft, 0.5
+        try:
+            slow = AgentServer(agents, keepalive=0.1)
+            results.append(await scenario_keepalive(InProcessClient(slow), args))
+        finally:
+            model.ttft = original
+        return results, server.stats()
+
+    results, server_stats = asyncio.run(run())
+    for r in results:
+        if r["scenario"] == "spread":
+            print(f"spread:    {r['requests']}件 {r['statuses']} {r['throughput_per_s']:.1f}件/秒 "
+                  f"p50 {r['latency']['p50_ms']:.0f}ms p99 {r['latency']['p99_ms']:.0f}ms "
+                  f"SSE初回トークン p50 {r['stream_ttft']['p50_ms']:.0f}ms")
+        elif r["scenario"] == "hot":
+            print(f"hot:       {r['requests']}件 {r['statuses']} {r['elapsed_s']:.2f}秒 "
+                  f"メッセージ {r['messages']}件（期待値 {r['expected_messages']}件）")
+        else:
+            print(f"keepalive: status {r['status']} コメント行 {r['keepalive_comments']}件 "
+                  f"初回トークン {r['first_token_s']:.2f}秒")
+    if server_stats:
+        print(f"server:    {server_stats}")
+
+    output = args.output or default_output("server")
+    write_results(output, {
+        "benchmark": "server",
+        "environment": environment_info(),
+        "settings": {
+            "clients": args.clients, "requests": args.requests, "ttft": args.ttft,
+            "token_latency": args.token_latency, "max_queue": args.max_queue, "url": args.url,
+        },
+        "results": results,
+        "server_stats": server_stats,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+ツールの投機実行（common/speculative.py）でループ1回あたりに短くなる時間
+
+chapter3/multi_tools.py のエージェントに、ツールを呼ぶ質問を --requests 件ずつ順番に送り、
+- off: 応答を受け取り終わってから tools ノードでツールを実行する（これまでの動作）
+- speculative: ストリーミング中に引数がそろったツールを実行し始める（SPECULATIVE_TOOLS=1 と同じ）
+のエンドツーエンドのレイテンシを比較し、差をツールを呼んだループの回数で割って
+「ループ1回あたりに短くなった時間」を求めます。
+
+search_weather には --tool-latency 秒の待ち時間を加えます（外部APIの代わり。計算のツールはすぐ終わる）。
+tools ノードはすべての呼び出しを待つので、短くなるのは「遅いツールの引数がそろってから応答を受け取り終わるまで」の分です。
+
+質問の種類:
+- single: 天気検索だけ（引数がそろうのは応答の最後なので、短くなるのは最後のチャンクとノードの切り替えの分だけ）
+- parallel: 天気検索と掛け算（天気検索を先に返す。掛け算の引数を受け取っている間に天気検索を進めておける）
+
+ツールのキャッシュはモードごとに空にし、質問ごとに引数を変えるので、キャッシュの効果は入りません。
+
+使い方:
+    python3 benchmarks/bench_speculative.py
+    python3 benchmarks/bench_speculative.py --token-latency 0.02 --tool-latency 0.3 --api async
+"""
+import argparse
+import asyncio
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.fake_llm import rule_based_responder
+from common.llm import get_llm
+from common.tool_cache import tool_cache
+
+QUESTIONS = {
+    "single": lambda i: f"都市{i}の天気を教えて",
+    "parallel": lambda i: f"{i}かける{i + 7}は？あと都市{i}の天気も",
+}
+
+
+def weather_first(messages, tools):
+    """ルールベースの応答のうち、天気検索の呼び出しを先頭にする（LLMが返す呼び出しの順番は決まっていない）"""
+    message = rule_based_responder(messages, tools)
+    message.tool_calls = sorted(message.tool_calls, key=lambda tc: tc["name"] != "search_weather")
+    return message
+
+
+@contextmanager
+def slow_tools(tools, latency):
+    """ツールの同期版・非同期版の両方に latency 秒の待ち時間を加える（終わったら元に戻す）"""
+    originals = [(t, t.func, t.coroutine) for t in tools]
+    for t, func, coroutine in originals:
+        def slow(*args, _func=func, **kwargs):
+            time.sleep(latency)
+            return _func(*args, **kwargs)
+
+        async def aslow(*args, _coroutine=coroutine, **kwargs):
+            await asyncio.sleep(latency)
+            return await _coroutine(*args, **kwargs)
+
+        t.func, t.coroutine = slow, aslow
+    try:
+        yield
+    finally:
+        for t, func, coroutine in originals:
+            t.func, t.coroutine = func, coroutine
+
+
+def run_mode(module, mode, kind, api, requests, offset):
+    module.speculation.enabled = mode == "speculative"
+    for t in module.tools:
+        if (cache := tool_cache(t)) is not None:
+            cache.clear()
+    stats_before = module.speculation.stats()
+    latencies, loops = [], 0
+    for i in range(requests):
+        state = {"messages": [("user", QUESTIONS[kind](offset + i))]}
+        t0 = time.perf_counter()
+        result = module.agent.invoke(state) if api == "sync" else asyncio.run(module.agent.ainvoke(state))
+        latencies.append(time.perf_counter() - t0)
+        loops += sum(1 for m in result["messages"] if getattr(m, "tool_calls", None))
+    stats = module.speculation.stats()
+    return {
+        "mode": mode,
+        "kind": kind,
+        "api": api,
+        "loops": loops,
+        "latency": summarize(latencies),
+        "mean_s": sum(latencies) / len(latencies),
+        "speculation": {k: stats[k] - stats_before[k] for k in ("started", "used", "discarded", "head_start_seconds")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--ttft", type=float, default=0.02)
+    parser.add_argument("--token-latency", type=float, default=0.005, help="1トークン（引数の断片）あたりの遅延（秒）")
+    parser.add_argument("--tool-latency", type=float, default=0.1, help="search_weather 1回あたりの待ち時間（秒）")
+    parser.add_argument("--api", nargs="+", default=["sync", "async"], choices=["sync", "async"])
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft, per_token_latency=args.token_latency)
+    module = load_chapter("chapter3/multi_tools.py")
+    default_enabled = module.speculation.enabled
+    fake = get_llm()
+    fake.responder = weather_first
+
+    results = []
+    try:
+        with slow_tools([module.search_weather], args.tool_latency):
+            for api in args.api:
+                for kind in QUESTIONS:
+                    # 引数をモードごとに変える（桁数をそろえて、応答のトークン数を同じにする）
+                    off = run_mode(module, "off", kind, api, args.requests, 100000)
+                    on = run_mode(module, "speculative", kind, api, args.requests, 200000)
+                    saved = (off["mean_s"] - on["mean_s"]) * args.requests / max(on["loops"], 1)
+                    on["saved_per_loop_ms"] = saved * 1000
+                    on["saved_ratio"] = 1 - on["mean_s"] / off["mean_s"]
+                    results += [off, on]
+                    used = on["speculation"]["used"] or 1
+                    print(f"{api:>5s} {kind:>8s}: off p50 {off['latency']['p50_ms']:6.1f}ms  "
+                          f"speculative p50 {on['latency']['p50_ms']:6.1f}ms  "
+                          f"ループ1回あたり {on['saved_per_loop_ms']:+6.1f}ms（{on['saved_ratio']:+.1%}）  "
+                          f"先行 平均 {on['speculation']['head_start_seconds'] / used * 1000:5.1f}ms  "
+                          f"使った {on['speculation']['used']} / 捨てた {on['speculation']['discarded']}")
+    finally:
+        module.speculation.enabled = default_enabled
+        fake.responder = None
+
+    output = args.output or default_output("speculative")
+    write_results(output, {
+        "benchmark": "speculative",
+        "environment": environment_info(),
+        "settings": {"requests": args.requests, "ttft": args.ttft, "token_latency": args.token_latency,
+                     "tool_latency": args.tool_latency, "api": args.api},
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+起動時間とリクエストごとの準備コスト（common/graph_registry.py）
+
+1) 起動（ケースごとに子プロセスで実行）
+- cold: グラフを読み込んだらすぐに最初のリクエストを実行する
+- warm: registry.warm_up(sample=...) を済ませてから最初のリクエストを実行する
+  （サーバーの起動時に払うコスト。最初のリクエストのレイテンシが定常状態に近づくか）
+  プロセスの起動から結果を返すまでの時間・読み込み・ウォームアップ・最初のリクエスト・定常状態のレイテンシを比較します。
+
+2) リクエストごとにグラフを用意するコスト（同じプロセス内）
+- exec: スクリプトを読み込み直す（以前の load_graph の動作）
+- compile: builder.compile() し直す
+- registry: registry.get() でキャッシュから取り出す
+
+使い方:
+    python3 benchmarks/bench_startup.py
+    python3 benchmarks/bench_startup.py --graph memory --requests 50
+"""
+import argparse
+import importlib.util
+import json
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    ROOT,
+    default_output,
+    environment_info,
+    run_isolated,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.graph_registry import CHAPTER_GRAPHS, load_module, registry
+
+SAMPLE = "こんにちは"
+
+
+def run_startup(case, name, requests):
+    """子プロセス側: 読み込み・（ウォームアップ）・最初のリクエスト・定常状態のレイテンシ"""
+    t0 = time.perf_counter()
+    graph = registry.get(name)
+    load_s = time.perf_counter() - t0
+    warm_up_s = registry.warm_up([name], sample=SAMPLE) if case == "warm" else 0.0
+
+    latencies = []
+    for i in range(requests + 1):
+        config = {"configurable": {"thread_id": f"startup-{i}"}}
+        t1 = time.perf_counter()
+        graph.invoke({"messages": [("user", SAMPLE)]}, config)
+        latencies.append(time.perf_counter() - t1)
+    return {
+        "case": case,
+        "load_s": load_s,
+        "warm_up_s": warm_up_s,
+        "ready_s": load_s + warm_up_s + latencies[0],  # 最初のリクエストに応答し終わるまで
+        "first_request_ms": latencies[0] * 1000,
+        "steady_request": summarize(latencies[1:]),
+        "registry": registry.stats(),
+    }
+
+
+def _exec_script(path, attr):
+    """以前の load_graph と同じく、スクリプトを毎回実行し直してグラフを取り出す"""
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, attr)
+
+
+def run_setup(name, repeat):
+    """同じプロセス内で、リクエストごとにグラフを用意する方法ごとの1回あたりの時間"""
+    path, builder_attr, graph_attr = CHAPTER_GRAPHS[name]
+    registry.get(name)
+    builder = getattr(load_module(path), builder_attr)
+    methods = {
+        "exec": (lambda: _exec_script(ROOT / path, graph_attr), max(1, repeat // 20)),
+        "compile": (builder.compile, repeat),
+        "registry": (lambda: registry.get(name), repeat),
+    }
+    results = []
+    for method, (prepare, n) in methods.items():
+        prepare()
+        t0 = time.perf_counter()
+        for _ in range(n):
+            prepare()
+        results.append({"method": method, "repeat": n, "mean_us": (time.perf_counter() - t0) / n * 1e6})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--graph", default="multi_tools", choices=sorted(CHAPTER_GRAPHS))
+    parser.add_argument("--requests", type=int, default=20, help="定常状態のレイテンシを測るリクエスト数")
+    parser.add_argument("--repeat", type=int, default=1000, help="準備コストを測る回数")
+    parser.add_argument("--runs", type=int, default=3, help="起動のケースごとに子プロセスを起動する回数")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    use_fake_backend()
+
+    if args.case:
+        print(json.dumps(run_startup(args.case, args.graph, args.requests)))
+        return
+
+    startup = []
+    for case in ("cold", "warm"):
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            result = run_isolated(__file__, ["--case", case, "--graph", args.graph, "--requests", str(args.requests)])
+            result["process_s"] = time.perf_counter() - t0
+            startup.append(result)
+            print(f"{case:>5s}: プロセス {result['process_s']:.2f}秒  読み込み {result['load_s'] * 1000:6.1f}ms  "
+                  f"ウォームアップ {result['warm_up_s'] * 1000:6.1f}ms  "
+                  f"最初のリクエスト {result['first_request_ms']:6.1f}ms  "
+                  f"定常 p50 {result['steady_request']['p50_ms']:.1f}ms")
+
+    setup = run_setup(args.graph, args.repeat)
+    print()
+    for r in setup:
+        print(f"{r['method']:>9s}: リクエストごとの準備 {r['mean_us']:10.1f}µs（{r['repeat']}回）")
+
+    output = args.output or default_output("startup")
+    write_results(output, {
+        "benchmark": "startup",
+        "environment": environment_info(),
+        "settings": {"graph": args.graph, "requests": args.requests, "repeat": args.repeat, "runs": args.runs},
+        "startup": startup,
+        "setup": setup,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
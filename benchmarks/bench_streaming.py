@@ -0,0 +1,121 @@
+"""
+トークン単位のストリーミング（ChatStream）のベンチマーク
+
+chapter2/simple_chat.py と chapter3/multi_tools.py のグラフを --runs 回ずつ実行し、
+- ノード単位（graph.stream の既定の updates。応答はノードの完了時にまとめて届く）
+- トークン単位（ChatStream。stream_mode=["messages", "updates"]）
+で、最初の応答テキストが表示できるまでの時間と全体の所要時間を比較します。
+
+使い方:
+    python3 benchmarks/bench_streaming.py
+    python3 benchmarks/bench_streaming.py --ttft 0.5 --token-latency 0.03 --async
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.streaming import ChatStream
+
+GRAPHS = [
+    ("chapter2/simple_chat.py", "graph", "こんにちは！東京都で一番有名な会社を教えて"),
+    ("chapter3/multi_tools.py", "agent", "東京の天気を教えて"),
+]
+
+
+def _first_text(update):
+    for value in update.values():
+        for message in (value or {}).get("messages", []):
+            if message.type == "ai" and message.content:
+                return True
+    return False
+
+
+def run_updates(graph, inputs):
+    """ノード単位: AIの応答テキストを含む最初のノードの完了までの時間"""
+    t0 = time.perf_counter()
+    first = None
+    for update in graph.stream(inputs):
+        if first is None and _first_text(update):
+            first = time.perf_counter() - t0
+    return first, time.perf_counter() - t0
+
+
+async def arun_updates(graph, inputs):
+    t0 = time.perf_counter()
+    first = None
+    async for update in graph.astream(inputs):
+        if first is None and _first_text(update):
+            first = time.perf_counter() - t0
+    return first, time.perf_counter() - t0
+
+
+def run_tokens(graph, inputs):
+    stream = ChatStream(graph, inputs)
+    for _ in stream:
+        pass
+    return stream.stats["ttft_s"], stream.stats["total_s"]
+
+
+async def arun_tokens(graph, inputs):
+    stream = ChatStream(graph, inputs)
+    async for _ in stream:
+        pass
+    return stream.stats["ttft_s"], stream.stats["total_s"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="astream で実行する")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft, per_token_latency=args.token_latency)
+    if args.use_async:
+        modes = {"updates": lambda g, i: asyncio.run(arun_updates(g, i)),
+                 "tokens": lambda g, i: asyncio.run(arun_tokens(g, i))}
+    else:
+        modes = {"updates": run_updates, "tokens": run_tokens}
+
+    results = []
+    print(f"{'graph':>26s} {'mode':>8s} {'first p50':>10s} {'first p99':>10s} {'total p50':>10s}")
+    for relpath, attr, question in GRAPHS:
+        graph = getattr(load_chapter(relpath), attr)
+        for mode, run in modes.items():
+            firsts, totals = [], []
+            for _ in range(args.runs):
+                first, total = run(graph, {"messages": [("user", question)]})
+                firsts.append(first)
+                totals.append(total)
+            r = {"graph": relpath, "mode": mode, "first_text": summarize(firsts), "total": summarize(totals)}
+            results.append(r)
+            print(f"{relpath:>26s} {mode:>8s} {r['first_text']['p50_ms']:8.0f}ms "
+                  f"{r['first_text']['p99_ms']:8.0f}ms {r['total']['p50_ms']:8.0f}ms")
+
+    output = args.output or default_output("streaming")
+    write_results(output, {
+        "benchmark": "streaming",
+        "environment": environment_info(),
+        "settings": {
+            "runs": args.runs, "ttft": args.ttft, "token_latency": args.token_latency, "async": args.use_async,
+        },
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
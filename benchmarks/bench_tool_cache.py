@@ -0,0 +1,140 @@
+"""
+ツール結果のキャッシュ（cacheable）のベンチマーク
+
+LLMが1回の会話で同じ引数のツールを --depth 回呼ぶエージェント（chatbot -> tools のループ）で、
+I/O待ちのあるツール（--tool-latency 秒スリープ）を使った会話を --conversations 件実行し、
+キャッシュなし / cacheable で
+- 1会話（ループ全体）のレイテンシ
+- ツールノード1回あたりのレイテンシ
+- キャッシュの統計（ヒット・ミス・省けた実行時間）
+を比較します。キャッシュはスレッド（会話）をまたいで共有されます。
+
+使い方:
+    python3 benchmarks/bench_tool_cache.py
+    python3 benchmarks/bench_tool_cache.py --depth 8 --tool-latency 0.05 --async
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from typing import Annotated
+from typing_extensions import TypedDict
+from langchain_core.tools import StructuredTool
+from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages
+
+from benchmarks.harness import (
+    NodeTimer,
+    default_output,
+    environment_info,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.async_support import async_node
+from common.fake_llm import tool_loop_responder
+from common.llm import get_llm
+from common.tool_cache import cacheable
+from common.tool_node import ParallelToolNode
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+def make_tool(latency, cached):
+    def search_weather(city: str) -> str:
+        """指定した都市の天気を検索します。"""
+        time.sleep(latency)
+        return f"{city}: 晴れ"
+
+    async def asearch_weather(city: str) -> str:
+        await asyncio.sleep(latency)
+        return f"{city}: 晴れ"
+
+    tool = StructuredTool.from_function(search_weather, coroutine=asearch_weather)
+    return cacheable(tool, ttl=600) if cached else tool
+
+
+def make_agent(tool, depth):
+    model = get_llm()
+    model.responder = tool_loop_responder(depth, "search_weather", {"city": "東京"})
+    llm = model.bind_tools([tool])
+    node = ParallelToolNode([tool])
+
+    def chatbot(state):
+        return {"messages": [llm.invoke(state["messages"])]}
+
+    async def achatbot(state):
+        return {"messages": [await llm.ainvoke(state["messages"])]}
+
+    def should_continue(state):
+        return "tools" if state["messages"][-1].tool_calls else END
+
+    builder = StateGraph(State)
+    builder.add_node("chatbot", async_node(chatbot, achatbot))
+    builder.add_node("tools", node)
+    builder.add_edge(START, "chatbot")
+    builder.add_conditional_edges("chatbot", should_continue, ["tools", END])
+    builder.add_edge("tools", "chatbot")
+    return builder.compile(), node
+
+
+def run(cached, args):
+    agent, node = make_agent(make_tool(args.tool_latency, cached), args.depth)
+    timer = NodeTimer()
+    config = {"recursion_limit": 2 * args.depth + 10, "callbacks": [timer]}
+    conversations = []
+    for _ in range(args.conversations):
+        t0 = time.perf_counter()
+        if args.use_async:
+            asyncio.run(agent.ainvoke({"messages": [("user", "天気を調べて")]}, config))
+        else:
+            agent.invoke({"messages": [("user", "天気を調べて")]}, config)
+        conversations.append(time.perf_counter() - t0)
+    return {
+        "cached": cached,
+        "conversation": summarize(conversations),
+        "tools_node": summarize(timer.durations["tools"]),
+        "cache_stats": node.cache_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--tool-latency", type=float, default=0.05)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="ainvoke で実行する")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend()
+    results = [run(False, args), run(True, args)]
+
+    print(f"{'cache':>6s} {'conv p50':>10s} {'conv p99':>10s} {'tools p50':>10s} {'hits':>6s} {'misses':>6s} {'saved':>8s}")
+    for r in results:
+        stats = r["cache_stats"].get("search_weather", {})
+        print(f"{'on' if r['cached'] else 'off':>6s} {r['conversation']['p50_ms']:8.1f}ms "
+              f"{r['conversation']['p99_ms']:8.1f}ms {r['tools_node']['p50_ms']:8.2f}ms "
+              f"{stats.get('hits', '-'):>6} {stats.get('misses', '-'):>6} "
+              f"{stats['saved_seconds'] if stats else 0:7.2f}s")
+
+    output = args.output or default_output("tool-cache")
+    write_results(output, {
+        "benchmark": "tool-cache",
+        "environment": environment_info(),
+        "settings": {
+            "conversations": args.conversations, "depth": args.depth,
+            "tool_latency": args.tool_latency, "async": args.use_async,
+        },
+        "results": results,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
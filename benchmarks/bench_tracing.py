@@ -0,0 +1,142 @@
+"""
+トレース（common/tracing.py）のオーバーヘッドと、ノードごとの時間の内訳
+
+chapter3/multi_tools.py のグラフをチェックポインター付きでコンパイルし、ツールを使う質問と使わない質問を
+--requests 件実行して、
+- off: トレースなし（環境変数を設定しないときと同じ。コールバックもラッパーもない）
+- metrics: メトリクスだけ集計する（ファイルに書かない）
+- file: スパンを OTLP/JSON でファイルに書き、メトリクスも集計する
+のレイテンシを比較します。最後に、file で書いたスパンを読み直して、種類（ノード・LLM・ツール・
+チェックポイント）ごとの時間の内訳を表示します。
+
+使い方:
+    python3 benchmarks/bench_tracing.py
+    python3 benchmarks/bench_tracing.py --requests 500 --ttft 0.05
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from benchmarks.harness import (
+    default_output,
+    environment_info,
+    load_chapter,
+    summarize,
+    use_fake_backend,
+    write_results,
+)
+from common.tracing import FileSpanExporter, TracedCheckpointer, disable_tracing, enable_tracing
+
+QUESTIONS = ["東京の天気を教えて", "25と75を足すといくつ？", "12かける8は？", "LangGraphとは何ですか？"]
+
+
+async def run_mode(builder, mode, args, trace_path):
+    if mode == "off":
+        agent = builder.compile(checkpointer=MemorySaver())
+        tracer = None
+    else:
+        agent = builder.compile(checkpointer=TracedCheckpointer(MemorySaver()))
+        tracer = enable_tracing(exporter=FileSpanExporter(trace_path) if mode == "file" else None)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            config = {"configurable": {"thread_id": f"{mode}-{i}"}}
+            t0 = time.perf_counter()
+            await agent.ainvoke({"messages": [("user", QUESTIONS[i % len(QUESTIONS)])]}, config)
+            latencies.append(time.perf_counter() - t0)
+
+    try:
+        await one(-1)  # ウォームアップ
+        latencies.clear()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - t0
+    finally:
+        disable_tracing()
+    result = {"mode": mode, "elapsed_s": elapsed, "latency": summarize(latencies)}
+    if tracer is not None:
+        result["metrics_lines"] = tracer.metrics_text().count("\n")
+    return result
+
+
+def breakdown(path):
+    """OTLP/JSON のファイルを読み、スパンの種類ごとの合計時間・件数と、トレースの属性の平均を返す"""
+    kinds, traces = {}, []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for resource in json.loads(line)["resourceSpans"]:
+                for scope in resource["scopeSpans"]:
+                    for span in scope["spans"]:
+                        attrs = {a["key"]: next(iter(a["value"].values())) for a in span["attributes"]}
+                        seconds = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e9
+                        kind = attrs["langgraph.span.kind"]
+                        if kind == "node":
+                            kind = f"node:{span['name']}"
+                        total, count = kinds.get(kind, (0.0, 0))
+                        kinds[kind] = (total + seconds, count + 1)
+                        if attrs["langgraph.span.kind"] == "graph":
+                            traces.append(attrs)
+    n = len(traces) or 1
+    return {
+        "traces": len(traces),
+        "spans": {k: {"count": c, "total_ms": t * 1000, "mean_ms": t / c * 1000} for k, (t, c) in sorted(kinds.items())},
+        "mean_llm_calls": sum(int(t["langgraph.llm_calls"]) for t in traces) / n,
+        "mean_input_tokens": sum(int(t["gen_ai.usage.input_tokens"]) for t in traces) / n,
+        "mean_output_tokens": sum(int(t["gen_ai.usage.output_tokens"]) for t in traces) / n,
+        "mean_checkpoint_ms": sum(float(t["langgraph.checkpoint.seconds"]) for t in traces) / n * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ttft", type=float, default=0.0, help="0 にするとグラフ自体の処理に対するオーバーヘッドが見える")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    use_fake_backend(ttft=args.ttft)
+    builder = load_chapter("chapter3/multi_tools.py").builder
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_path = Path(tmp) / "traces.jsonl"
+
+        async def run():
+            return [await run_mode(builder, mode, args, trace_path) for mode in ("off", "metrics", "file")]
+
+        results = asyncio.run(run())
+        spans = breakdown(trace_path)
+
+    base = results[0]["latency"]["p50_ms"]
+    for r in results:
+        r["overhead_p50"] = r["latency"]["p50_ms"] / base - 1
+        print(f"{r['mode']:>8s}: 全件 {r['elapsed_s']:5.2f}秒  p50 {r['latency']['p50_ms']:6.2f}ms  "
+              f"p99 {r['latency']['p99_ms']:6.2f}ms  （off との差 {r['overhead_p50']:+.1%}）")
+    print(f"\nトレース {spans['traces']}件: LLM呼び出し 平均 {spans['mean_llm_calls']:.2f}回  "
+          f"トークン 入力 {spans['mean_input_tokens']:.0f} / 出力 {spans['mean_output_tokens']:.0f}  "
+          f"チェックポイント 平均 {spans['mean_checkpoint_ms']:.2f}ms")
+    for kind, s in spans["spans"].items():
+        print(f"  {kind:>14s}: {s['count']:5d}件  平均 {s['mean_ms']:7.3f}ms  合計 {s['total_ms']:8.1f}ms")
+
+    output = args.output or default_output("tracing")
+    write_results(output, {
+        "benchmark": "tracing",
+        "environment": environment_info(),
+        "settings": {"requests": args.requests, "concurrency": args.concurrency, "ttft": args.ttft},
+        "results": results,
+        "breakdown": spans,
+    })
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+ベンチマーク結果（JSON）の比較
+
+2つの結果ファイルを (scenario, param, value) で突き合わせ、
+invocations/sec とノードごとの p50 / p99 の変化率を表示します。
+
+使い方:
+    python3 benchmarks/compare.py benchmarks/results/graphs-langgraph-0.2.60.json \\
+                                  benchmarks/results/graphs-langgraph-1.0.0.json
+"""
+import argparse
+import json
+from pathlib import Path
+
+
+def _load(path):
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    return data, {(r["scenario"], r["param"], r["value"]): r for r in data["results"]}
+
+
+def _delta(before, after):
+    if not before or after is None:
+        return "    n/a"
+    return f"{(after - before) / before * 100:+6.1f}%"
+
+
+def _ms(value):
+    # 呼び出されなかったノードなどは None になる
+    return f"{value:10.3f}" if value is not None else f"{'-':>10s}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="2つのベンチマーク結果を比較します")
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    args = parser.parse_args()
+
+    base_data, base = _load(args.baseline)
+    cand_data, cand = _load(args.candidate)
+    print(f"baseline : {base_data['environment']['packages']}")
+    print(f"candidate: {cand_data['environment']['packages']}")
+    print()
+
+    for key in sorted(base.keys() & cand.keys(), key=str):
+        b, c = base[key], cand[key]
+        scenario, param, value = key
+        print(f"{scenario} {param}={value}")
+        print(f"  invocations/sec {b['invocations_per_sec']:10.1f} -> {c['invocations_per_sec']:10.1f}"
+              f"  {_delta(b['invocations_per_sec'], c['invocations_per_sec'])}")
+        for node in sorted(b["nodes"].keys() & c["nodes"].keys()):
+            for stat in ("p50_ms", "p99_ms"):
+                before, after = b["nodes"][node].get(stat), c["nodes"][node].get(stat)
+                print(f"  {node:8s} {stat:6s}  {_ms(before)} -> {_ms(after)}  {_delta(before, after)}")
+
+    missing = sorted(base.keys() ^ cand.keys(), key=str)
+    if missing:
+        print("\n片方にしかないケース:", ", ".join(f"{s} {p}={v}" for s, p, v in missing))
+
+
+if __name__ == "__main__":
+    main()
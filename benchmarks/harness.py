@@ -0,0 +1,179 @@
+"""
+ベンチマーク共通ユーティリティ
+
+- フェイクモデルへの切り替えとチャプターモジュールの読み込み
+- ノードごとの処理時間の計測（コールバック）
+- パーセンタイル・メモリ割り当て・ピークRSSの集計
+- 結果のJSON出力と、ケースごとの子プロセス実行
+"""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from importlib import metadata
+from pathlib import Path
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+ROOT = Path(__file__).parent.parent
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def use_fake_backend(ttft=None, per_token_latency=None, failure_rate=None, per_input_token_latency=None,
+                     failure_status=None, rate_limit=None, ttft_jitter=None, slow_rate=None, slow_latency=None):
+    """common.llm の既定バックエンドをフェイクモデルにする（チャプターの読み込み前に呼ぶ）"""
+    os.environ["LLM_BACKEND"] = "fake"
+    for env, value in (
+        ("FAKE_LLM_TTFT", ttft),
+        ("FAKE_LLM_TOKEN_LATENCY", per_token_latency),
+        ("FAKE_LLM_INPUT_TOKEN_LATENCY", per_input_token_latency),
+        ("FAKE_LLM_FAILURE_RATE", failure_rate),
+        ("FAKE_LLM_FAILURE_STATUS", failure_status),
+        ("FAKE_LLM_RATE_LIMIT", rate_limit),
+        ("FAKE_LLM_TTFT_JITTER", ttft_jitter),
+        ("FAKE_LLM_SLOW_RATE", slow_rate),
+        ("FAKE_LLM_SLOW_LATENCY", slow_latency),
+    ):
+        if value is not None:
+            os.environ[env] = str(value)
+
+
+def load_chapter(relpath):
+    """チャプターのスクリプト（例: "chapter3/multi_tools.py"）をモジュールとして読み込む
+
+    common/graph_registry.py と同じモジュールを共有します（スクリプトは1度だけ実行される）。
+    """
+    from common.graph_registry import load_module
+    return load_module(relpath)
+
+
+def make_history(n):
+    """ユーザー/アシスタントが交互に並ぶ n 件の会話履歴を作る"""
+    return [
+        ("user", f"質問{i // 2}です。") if i % 2 == 0 else ("assistant", f"回答{i // 2}です。")
+        for i in range(n)
+    ]
+
+
+class NodeTimer(BaseCallbackHandler):
+    """グラフのノードごとの処理時間（秒）を記録するコールバック"""
+
+    def __init__(self):
+        self.durations = {}
+        self._started = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node is not None and kwargs.get("name") == node:
+            self._started[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            node, t0 = started
+            self.durations.setdefault(node, []).append(time.perf_counter() - t0)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.on_chain_end(None, run_id=run_id)
+
+
+def percentile(values, q):
+    """最近傍法によるパーセンタイル（q は 0〜100）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    """秒のリストをミリ秒の統計値にまとめる"""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) * 1000,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+    }
+
+
+def measure_allocations(run_once, repeat):
+    """tracemalloc で1回あたりのピーク割り当てバイト数と、残ったメモリブロック数を測る"""
+    tracemalloc.start()
+    peaks = []
+    blocks_before = sys.getallocatedblocks()
+    try:
+        for i in range(repeat):
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            run_once(i)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - base)
+    finally:
+        tracemalloc.stop()
+    return {
+        "repeat": repeat,
+        "peak_bytes_per_invoke": sum(peaks) / len(peaks),
+        "live_blocks_per_invoke": (sys.getallocatedblocks() - blocks_before) / repeat,
+    }
+
+
+def peak_rss_kb():
+    """このプロセスのピークRSS（KB）"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def current_rss_kb():
+    """このプロセスの現在のRSS（KB）。/proc がない環境ではピークRSSを返す"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return peak_rss_kb()
+
+
+def environment_info():
+    """結果と一緒に保存する実行環境の情報"""
+    versions = {}
+    for package in ("langgraph", "langgraph-checkpoint", "langchain-core"):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packages": versions,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def run_isolated(script, args):
+    """ベンチマークのケースを子プロセスで実行し、標準出力の最終行のJSONを返す
+
+    ピークRSSをケースごとに独立して測るため、1ケース1プロセスで実行します。
+    """
+    proc = subprocess.run(
+        [sys.executable, str(script), *args],
+        capture_output=True, text=True, check=True, cwd=ROOT,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def default_output(prefix):
+    """langgraphのバージョンを含む既定の出力先（バージョン間の比較用）"""
+    version = environment_info()["packages"]["langgraph"] or "unknown"
+    return RESULTS_DIR / f"{prefix}-langgraph-{version}.json"
+
+
+def write_results(path, results):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    return path
@@ -7,6 +7,8 @@ from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from common.llm import llm
+from common.async_support import async_node
+from common.streaming import print_stream
 
 # 1. Stateの定義（メッセージを追記していく形式）
 class State(TypedDict):
@@ -16,9 +18,13 @@ class State(TypedDict):
 def chatbot(state: State):
     return {"messages": [llm.invoke(state["messages"])]}
 
+# 非同期版（graph.ainvoke / graph.astream で実行したときに使われる）
+async def achatbot(state: State):
+    return {"messages": [await llm.ainvoke(state["messages"])]}
+
 # 3. Graphの構築
 graph_builder = StateGraph(State)
-graph_builder.add_node("chatbot", chatbot)
+graph_builder.add_node("chatbot", async_node(chatbot, achatbot))
 
 # エッジの定義 (Start -> chatbot -> End)
 graph_builder.add_edge(START, "chatbot")
@@ -28,10 +34,11 @@ graph_builder.add_edge("chatbot", END)
 graph = graph_builder.compile()
 
 # 実行
-user_input = "こんにちは！"
-# user_input = "こんにちは！東京都で一番有名な会社を教えて"
-for event in graph.stream({"messages": [("user", user_input)]}):
-    for value in event.values():
-        print("Assistant:", value["messages"][-1].content)
-
-# print(graph.get_graph().draw_mermaid())
+if __name__ == "__main__":
+    user_input = "こんにちは！"
+    # user_input = "こんにちは！東京都で一番有名な会社を教えて"
+    # LLMのトークンを届いた順に表示する（ノードの完了と、初回トークンまでの時間も表示）
+    # ノード単位で結果だけを受け取る場合は graph.stream({"messages": [...]}) をそのまま回す
+    print_stream(graph, {"messages": [("user", user_input)]})
+
+    # print(graph.get_graph().draw_mermaid())
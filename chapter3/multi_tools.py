@@ -15,26 +15,35 @@ from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langchain_core.tools import tool
-from langchain_core.messages import SystemMessage
-from langgraph.prebuilt import ToolNode
 
 from common.llm import llm
+from common.async_support import with_async
+from common.budget import budgeted
+from common.tool_node import ParallelToolNode
+from common.speculative import SpeculativeToolCalls
+from common.prompt_cache import CachedPrefix
+from common.tool_cache import cacheable
 
 # 1. Stateの定義
 class State(TypedDict):
     messages: Annotated[list, add_messages]
 
 # 2. 複数のツールを定義
+# @cacheable: 同じ引数なら同じ結果を返すツールは、2回目以降の呼び出しをキャッシュから返す
+# （ttl を指定すると、その秒数が過ぎたら実行し直す）
+@cacheable
 @tool
 def add(a: int, b: int) -> int:
     """2つの整数を足し算します。"""
     return a + b
 
+@cacheable
 @tool
 def multiply(a: int, b: int) -> int:
     """2つの整数を掛け算します。"""
     return a * b
 
+@cacheable(ttl=600)
 @tool
 def search_weather(city: str) -> str:
     """指定した都市の天気を検索します（デモ用ダミーデータ）。"""
@@ -46,15 +55,20 @@ def search_weather(city: str) -> str:
     }
     return weather_data.get(city, f"{city}の天気情報は見つかりませんでした")
 
+# 呼び出すたびに結果が変わるのでキャッシュしない
 @tool
 def get_current_time() -> str:
     """現在の日時を取得します。"""
     from datetime import datetime
     return datetime.now().strftime("%Y年%m月%d日 %H時%M分")
 
-# 3. ツールをリストにまとめてLLMにバインド
+# 非同期版を設定（agent.ainvoke / agent.astream で実行したときに使われる）
+# どれもブロックしない軽い処理なので、イベントループ上でそのまま実行する
+for t in (add, multiply, search_weather, get_current_time):
+    with_async(t)
+
+# 3. ツールをリストにまとめる
 tools = [add, multiply, search_weather, get_current_time]
-llm_with_tools = llm.bind_tools(tools)
 
 # 4. Nodeの定義
 SYSTEM_PROMPT = """あなたは親切なアシスタントです。
@@ -67,14 +81,30 @@ SYSTEM_PROMPT = """あなたは親切なアシスタントです。
 ツールが必要な質問にはツールを使用してください。
 ツールが不要な一般的な質問（例：概念の説明、アドバイスなど）には、あなた自身の知識で回答してください。"""
 
+# システムプロンプトとツール定義をLLMにバインド
+# 毎回変わらないこのプレフィックスはプロバイダのコンテキストキャッシュに1度だけ登録し、
+# 以降の呼び出しでは会話（state["messages"]）だけを送る（PROMPT_CACHE=1 で有効）
+llm_with_tools = CachedPrefix(llm, SYSTEM_PROMPT, tools)
+
+# 複数の tool_calls を並列に実行する（ToolNode(tools) の置き換え）
+tool_node = ParallelToolNode(tools, max_concurrency=4)
+
+# 副作用のないツールは、LLMの応答をストリーミングで受け取っている間に引数がそろった時点で実行し始め、
+# 結果を tools ノードに渡す（SPECULATIVE_TOOLS=1 で有効。承認が必要なツールは決して入れない）
+speculation = SpeculativeToolCalls(tool_node, safe=[add, multiply, search_weather])
+
 def chatbot(state: State):
-    messages = [SystemMessage(content=SYSTEM_PROMPT)] + state["messages"]
-    return {"messages": [llm_with_tools.invoke(messages)]}
+    return {"messages": [speculation.invoke(llm_with_tools, state["messages"])]}
+
+async def achatbot(state: State):
+    return {"messages": [await speculation.ainvoke(llm_with_tools, state["messages"])]}
 
 # 5. Graphの構築
 builder = StateGraph(State)
-builder.add_node("chatbot", chatbot)
-builder.add_node("tools", ToolNode(tools))
+# ループの回数・締め切り・トークン数の予算（config の configurable["budget"]。common/budget.py）を
+# 使い切ったら、LLMを呼ばずにここまでの結果で回答して終える
+builder.add_node("chatbot", budgeted(chatbot, achatbot))
+builder.add_node("tools", tool_node)
 
 builder.add_edge(START, "chatbot")
 
@@ -91,6 +121,8 @@ builder.add_edge("tools", "chatbot")
 agent = builder.compile()
 
 # 7. 実行テスト
+# 大量のプロンプトをまとめて処理する場合は、1件ずつ invoke せずに
+# common/batch_runner.py（同時実行・再開・レート制限の待機付き）を使う
 if __name__ == "__main__":
     # テスト1: 計算（加算）
     print("=== テスト1: 計算（加算） ===")
@@ -10,6 +10,8 @@ from langchain_core.tools import tool
 from langgraph.prebuilt import ToolNode
 
 from common.llm import llm
+from common.async_support import async_node, with_async
+from common.local_router import LocalRouter
 
 # 1. Stateの定義（メッセージを追記していく形式）
 class State(TypedDict):
@@ -21,6 +23,8 @@ def multiply(a: int, b: int) -> int:
     """2つの整数を掛け算します。"""
     return a * b
 
+with_async(multiply)  # 非同期版（イベントループ上でそのまま計算）
+
 tools = [multiply]
 llm_with_tools = llm.bind_tools(tools) # Geminiにツールを教える
 
@@ -28,12 +32,26 @@ llm_with_tools = llm.bind_tools(tools) # Geminiにツールを教える
 def chatbot_with_tools(state: State):
     return {"messages": [llm_with_tools.invoke(state["messages"])]}
 
+# 非同期版（agent.ainvoke / agent.astream で実行したときに使われる）
+async def achatbot_with_tools(state: State):
+    return {"messages": [await llm_with_tools.ainvoke(state["messages"])]}
+
+# 「123かける456は？」のようにツールだけで答えられる質問は、chatbot の前のルーターで処理する
+# （LOCAL_ROUTER=template でLLMを呼ばずに答え、LOCAL_ROUTER=llm で結果の文章化だけLLMに任せる。既定は無効）
+# 確信が持てない質問はこれまでどおり chatbot に任せる
+router = LocalRouter(tools, intents={"multiply": (r"かける|掛ける|×|\*", "{a}×{b}は{result}です。")})
+
 # 4. Graphの構築
 builder = StateGraph(State)
-builder.add_node("chatbot", chatbot_with_tools)
+builder.add_node("chatbot", async_node(chatbot_with_tools, achatbot_with_tools))
 builder.add_node("tools", ToolNode(tools)) # ツール実行用ノード
 
-builder.add_edge(START, "chatbot")
+if router.enabled:
+    builder.add_node("router", router.node)
+    builder.add_edge(START, "router")
+    builder.add_conditional_edges("router", router.next_node, ["tools", "chatbot", END])
+else:
+    builder.add_edge(START, "chatbot")
 
 # 5. 条件付きエッジの定義
 def should_continue(state: State):
@@ -51,10 +69,11 @@ agent = builder.compile()
 
 # 実行（計算が必要な問いかけ）
 # Geminiは自分でmultiplyツールを選び、実行結果を受け取って回答します
-inputs = {"messages": [("user", "123かける456は？")]}
-# inputs = {"messages": [("user", "999かける567の結果に3をかけた結果は？")]}
-for event in agent.stream(inputs):
-    for key, value in event.items():
-        print(f"Node '{key}':") 
-        print(value)
-        print("---")
+if __name__ == "__main__":
+    inputs = {"messages": [("user", "123かける456は？")]}
+    # inputs = {"messages": [("user", "999かける567の結果に3をかけた結果は？")]}
+    for event in agent.stream(inputs):
+        for key, value in event.items():
+            print(f"Node '{key}':")
+            print(value)
+            print("---")
@@ -10,48 +10,15 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from typing import Annotated
-from typing_extensions import TypedDict
-from langgraph.graph import StateGraph, START, END
-from langgraph.graph.message import add_messages
-from langchain_core.tools import tool
-from langgraph.prebuilt import ToolNode
-
-from common.llm import llm
+from common.graph_registry import registry
 
 # ========================================
-# グラフの定義（Chapter 3と同様の構造）
+# グラフの取得（Chapter 3-2 の multi_tools.py のグラフ）
 # ========================================
 
-class State(TypedDict):
-    messages: Annotated[list, add_messages]
-
-@tool
-def multiply(a: int, b: int) -> int:
-    """2つの整数を掛け算します。"""
-    return a * b
-
-tools = [multiply]
-llm_with_tools = llm.bind_tools(tools)
-
-def chatbot(state: State):
-    return {"messages": [llm_with_tools.invoke(state["messages"])]}
-
-def should_continue(state: State):
-    last_message = state["messages"][-1]
-    if last_message.tool_calls:
-        return "tools"
-    return END
-
-# グラフの構築
-builder = StateGraph(State)
-builder.add_node("chatbot", chatbot)
-builder.add_node("tools", ToolNode(tools))
-builder.add_edge(START, "chatbot")
-builder.add_conditional_edges("chatbot", should_continue, ["tools", END])
-builder.add_edge("tools", "chatbot")
-
-graph = builder.compile()
+# 同じグラフを組み立て直さず、レジストリからコンパイル済みのものを取り出す
+# （multi_tools.py は1度だけ読み込まれ、そこで compile した agent がそのまま返る）
+graph = registry.get("multi_tools")
 
 # ========================================
 # グラフの可視化
@@ -3,48 +3,65 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
 from typing import Annotated
 from typing_extensions import TypedDict
 from langgraph.graph.message import add_messages
 from common.llm import llm
+from common.async_support import async_node
+from common.checkpointer import create_checkpointer
+from common.context_window import ContextWindow
 
 class State(TypedDict):
     messages: Annotated[list, add_messages]
+    summary: str  # 古いターンの要約
+    summary_until: str  # 要約に含めた最後のメッセージのid
+
+# プロンプトのトークン予算（環境変数 CONTEXT_MAX_TOKENS、既定 4000）
+# 超えた古いターンは要約に畳み込み、LLMには「要約 + 直近のターン」だけを送る
+window = ContextWindow()
 
 def chatbot(state: State):
-    return {"messages": [llm.invoke(state["messages"])]}
+    return {"messages": [llm.invoke(window.prompt(state))]}
+
+# 非同期版（agent.ainvoke / agent.astream で実行したときに使われる）
+async def achatbot(state: State):
+    return {"messages": [await llm.ainvoke(window.prompt(state))]}
 
 builder = StateGraph(State)
 
-builder.add_node("chatbot", chatbot)
-builder.add_edge(START, "chatbot")
+builder.add_node("trim", async_node(window.trim, window.atrim))
+builder.add_node("chatbot", async_node(chatbot, achatbot))
+builder.add_edge(START, "trim")
+builder.add_edge("trim", "chatbot")
 builder.add_edge("chatbot", END)
 
-agent = builder.compile()
-
-memory = MemorySaver()
+# 既定は MemorySaver（メモリに保存）
+# 環境変数 CHECKPOINTER=sqlite でSQLiteファイルに保存（再起動後も会話を再開できる）
+memory = create_checkpointer()
 # checkpointerを指定してコンパイル
+# （別の設定のグラフが必要なときは compile し直さず、common/graph_registry.py の
+#   registry.get("memory", checkpointer=None) などで設定ごとに1度だけコンパイルしたものを使う）
 agent_with_memory = builder.compile(checkpointer=memory)
 
-# thread_idを指定して会話
-config = {"configurable": {"thread_id": "1"}}
-
-# 1回目の会話
-print("--- Round 1 ---")
-input1 = {"messages": [("user", "私の名前はGemini太郎です。")]}
-result1 = agent_with_memory.invoke(input1, config=config)
-print(result1["messages"][-1].content)
-
-# 2回目の会話（前の会話を覚えているか？）
-print("--- Round 2 ---")
-input2 = {"messages": [("user", "私の名前を覚えていますか？")]}
-result2 = agent_with_memory.invoke(input2, config=config)
-print(result2["messages"][-1].content)
-
-# 3回目の会話（別の会話）
-print("--- Round 3 ---")
-config3 = {"configurable": {"thread_id": "3"}}
-input3 = {"messages": [("user", "私の名前を覚えていますか？")]}
-result3 = agent_with_memory.invoke(input3, config=config3)
-print(result3["messages"][-1].content)
+if __name__ == "__main__":
+    # thread_idを指定して会話
+    config = {"configurable": {"thread_id": "1"}}
+
+    # 1回目の会話
+    print("--- Round 1 ---")
+    input1 = {"messages": [("user", "私の名前はGemini太郎です。")]}
+    result1 = agent_with_memory.invoke(input1, config=config)
+    print(result1["messages"][-1].content)
+
+    # 2回目の会話（前の会話を覚えているか？）
+    print("--- Round 2 ---")
+    input2 = {"messages": [("user", "私の名前を覚えていますか？")]}
+    result2 = agent_with_memory.invoke(input2, config=config)
+    print(result2["messages"][-1].content)
+
+    # 3回目の会話（別の会話）
+    print("--- Round 3 ---")
+    config3 = {"configurable": {"thread_id": "3"}}
+    input3 = {"messages": [("user", "私の名前を覚えていますか？")]}
+    result3 = agent_with_memory.invoke(input3, config=config3)
+    print(result3["messages"][-1].content)
@@ -0,0 +1,82 @@
+"""
+Chapter 5-2: 承認待ちキュー（ブロックしない Human-in-the-loop）
+
+学習目標:
+- interrupt で止まったスレッドをチェックポインターに残したまま、他のリクエストを処理し続ける方法
+- 複数のスレッドの承認待ちを一覧にして、まとめて承認・拒否する方法
+- 承認・拒否を受けてワーカーが agent.astream(None, config) で再開する仕組み
+
+human_in_loop.py は input("y/n: ") で承認を待つ間、プロセス全体が止まります。
+ここでは同じエージェントを ApprovalQueue（common/approval.py）で動かします。
+
+使い方:
+    python3 chapter5/approval_queue.py
+    python3 chapter5/approval_queue.py decisions.jsonl   # 決定をファイルから読み込む
+"""
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import asyncio
+
+from common.approval import ApprovalQueue
+from common.graph_registry import registry
+
+# human_in_loop.py のエージェント（レジストリから取り出すので、スクリプトは1度だけ読み込まれ、
+# ベンチマークやサーバーと同じエージェント・同じチェックポインターを使う）
+agent = registry.get("human_in_loop")
+
+# 1. 複数のユーザーからのリクエスト（thread_id ごとに別の会話）
+REQUESTS = {
+    "user-1": "test@example.comに「会議の件」という件名でメールを送って",
+    "user-2": "report.txtを削除して",
+    "user-3": "LangGraphの情報を調べて",
+    "user-4": "boss@example.comに「週報」という件名でメールを送って",
+    "user-5": "こんにちは",
+}
+
+
+def show_result(thread_id, message):
+    print(f"  [{thread_id}] アシスタント: {message.content}")
+
+
+async def main(decisions_file=None):
+    queue = ApprovalQueue(agent, workers=4, on_resumed=show_result)
+    await queue.start()
+
+    # 2. リクエストを並行に実行する（ツールの前で止まったものは承認待ちになり、待たずに次へ進む）
+    print("=== リクエストを実行 ===")
+    results = await asyncio.gather(*(queue.submit(tid, text) for tid, text in REQUESTS.items()))
+    for thread_id, pending in zip(REQUESTS, results):
+        if pending is None:
+            state = agent.get_state({"configurable": {"thread_id": thread_id}})
+            show_result(thread_id, state.values["messages"][-1])
+
+    # 3. 全スレッドの承認待ちを一覧にする
+    print("\n=== 承認待ち ===")
+    for item in queue.pending():
+        for tc in item.tool_calls:
+            print(f"  [{item.thread_id}] {tc['name']}: {tc['args']}")
+
+    # 4. 承認・拒否（ファイルがあればそれに従う）
+    print("\n=== 承認・拒否して再開 ===")
+    if decisions_file:
+        print(f"  {queue.apply_file(decisions_file)}件の決定を適用しました")
+    else:
+        # 安全なツール（ポリシーで自動承認されなかった get_info）はまとめて承認し、ファイル削除は拒否、メールは1件ずつ承認
+        queue.approve_all(lambda item: all(tc["name"] == "get_info" for tc in item.tool_calls))
+        for item in queue.pending(tool="delete_file"):
+            queue.reject(item.thread_id, "ファイルの削除は許可されていません。")
+        for item in queue.pending(tool="send_email"):
+            queue.approve(item.thread_id)
+
+    # 5. 再開した実行が終わるのを待って、統計を表示する
+    await queue.join()
+    stats = queue.stats()
+    print(f"\n承認: {stats['approved']}件 / 拒否: {stats['rejected']}件 / 残りの承認待ち: {stats['pending']}件")
+    print(f"止まってから再開までの時間: p50 {stats['interrupt_to_resume'].get('p50_ms', 0):.0f}ms")
+    await queue.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else None))
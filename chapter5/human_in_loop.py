@@ -5,6 +5,7 @@ Chapter 5: Human-in-the-loop（人間による承認）
 - interrupt_beforeを使った実行の一時停止
 - ユーザー承認後に処理を再開する方法
 - 重要な操作の前に確認を挟むパターン
+- 安全なツールは承認なしで実行するポリシー（自動承認）
 """
 import sys
 from pathlib import Path
@@ -14,11 +15,15 @@ from typing import Annotated
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.tools import tool
-from langgraph.prebuilt import ToolNode
 
 from common.llm import llm
+from common.async_support import with_async
+from common.budget import budgeted
+from common.tool_node import ParallelToolNode
+from common.checkpointer import create_checkpointer
+from common.approval_policy import ApprovalPolicy, load_policy, thread_id
+from common.streaming import print_stream
 
 # 1. Stateの定義
 class State(TypedDict):
@@ -40,6 +45,10 @@ def get_info(query: str) -> str:
     """情報を検索します（安全なツール）。"""
     return f"'{query}' に関する情報: これはサンプルデータです。"
 
+# 非同期版を設定（agent.ainvoke / agent.astream で実行したときに使われる）
+for t in (send_email, delete_file, get_info):
+    with_async(t)
+
 # 3. ツール設定
 tools = [send_email, delete_file, get_info]
 llm_with_tools = llm.bind_tools(tools)
@@ -48,30 +57,49 @@ llm_with_tools = llm.bind_tools(tools)
 def chatbot(state: State):
     return {"messages": [llm_with_tools.invoke(state["messages"])]}
 
-# 5. Graphの構築
+async def achatbot(state: State):
+    return {"messages": [await llm_with_tools.ainvoke(state["messages"])]}
+
+# 5. 自動承認のポリシー
+# get_info のような無害なツールは承認なしで実行する（止まるたびにチェックポイントの書き込みと再開が必要なため）
+# 環境変数 APPROVAL_POLICY にJSONファイルを指定すると、引数のパターンやスレッドごとの信頼も設定できる
+policy = load_policy(default=ApprovalPolicy(allow={"get_info"}))
+
+# 6. Graphの構築
 builder = StateGraph(State)
-builder.add_node("chatbot", chatbot)
-builder.add_node("tools", ToolNode(tools))
+# ループの回数・締め切り・トークン数の予算（config の configurable["budget"]。common/budget.py）を
+# 使い切ったら、LLMを呼ばずにここまでの結果で回答して終える
+builder.add_node("chatbot", budgeted(chatbot, achatbot))
+# 複数の tool_calls を並列に実行する（ToolNode(tools) の置き換え）
+tool_node = ParallelToolNode(tools, max_concurrency=4)
+builder.add_node("tools", tool_node)       # 承認が必要なツール（実行前に止まる）
+builder.add_node("safe_tools", tool_node)  # ポリシーで自動承認されたツール（止まらない）
 
 builder.add_edge(START, "chatbot")
 
-def should_continue(state: State):
+def should_continue(state: State, config):
     last_message = state["messages"][-1]
-    if last_message.tool_calls:
-        return "tools"
-    return END
-
-builder.add_conditional_edges("chatbot", should_continue, ["tools", END])
+    if not last_message.tool_calls:
+        return END
+    # すべての tool_calls が自動承認できるときだけ、止めずに実行する
+    if policy.allows(last_message.tool_calls, thread_id(config)):
+        return "safe_tools"
+    return "tools"
+
+builder.add_conditional_edges("chatbot", should_continue, ["tools", "safe_tools", END])
 builder.add_edge("tools", "chatbot")
+builder.add_edge("safe_tools", "chatbot")
 
-# 6. Human-in-the-loop: toolsノードの実行前に一時停止
-memory = MemorySaver()
+# 7. Human-in-the-loop: toolsノードの実行前に一時停止
+# 既定は MemorySaver（メモリに保存）
+# 環境変数 CHECKPOINTER=sqlite でSQLiteファイルに保存（再起動後も承認待ちから再開できる）
+memory = create_checkpointer()
 agent = builder.compile(
     checkpointer=memory,
     interrupt_before=["tools"]  # toolsノードの前で停止
 )
 
-# 7. 実行デモ（ループ対応版）
+# 8. 実行デモ（ループ対応版）
 if __name__ == "__main__":
     config = {"configurable": {"thread_id": "demo-1"}}
 
@@ -98,11 +126,8 @@ if __name__ == "__main__":
             if not user_input:
                 continue
 
-        # グラフを実行
-        for event in agent.stream({"messages": [("user", user_input)]}, config):
-            for key, value in event.items():
-                if key != "__end__":
-                    print(f"[{key}] 処理中...")
+        # グラフを実行（応答はトークン単位で表示し、ノードの完了も表示する）
+        print_stream(agent, {"messages": [("user", user_input)]}, config, label="\nアシスタント")
 
         # 現在の状態を確認
         state = agent.get_state(config)
@@ -122,16 +147,10 @@ if __name__ == "__main__":
 
             if approval == "y":
                 print("\n--- 承認されました。処理を再開します ---\n")
-                for event in agent.stream(None, config):
-                    for key, value in event.items():
-                        if key != "__end__":
-                            print(f"[{key}] 処理中...")
-
-                # 再開後の状態を取得
-                final_state = agent.get_state(config)
-                print(f"\nアシスタント: {final_state.values['messages'][-1].content}\n")
+                print_stream(agent, None, config, label="\nアシスタント")
+                print()
             else:
                 print("\n--- 操作がキャンセルされました ---\n")
         else:
-            # ツール呼び出しがない場合は通常の応答を表示
-            print(f"\nアシスタント: {last_message.content}\n")
+            # ツール呼び出しがない場合、応答は表示済み
+            print()
@@ -0,0 +1,284 @@
+"""
+Human-in-the-loop の承認待ちキュー
+
+chapter5/human_in_loop.py は interrupt_before=["tools"] で止まったところで input("y/n: ") を待つため、
+1件の承認待ちでプロセス全体が止まります。ApprovalQueue は止まったスレッドをチェックポインターに
+残したまま（待たずに）次のリクエストを処理し、全スレッドの承認待ちの tool_calls を一覧にします。
+承認・拒否はいつ届いてもよく（API から直接、またはファイルからまとめて）、
+ワーカーが agent.astream(None, config) で再開します。
+
+- submit(thread_id, message): 実行して、ツールの前で止まったら承認待ちに入れる
+- pending(): 承認待ちの一覧（スレッド・tool_calls・止まった時刻）
+- approve / reject / approve_all: 決定を受け付ける（再開はワーカーが行う）
+- 拒否したツールは実行せず、「拒否されました」という ToolMessage を返して会話を続ける
+- recover(): 再起動後に、チェックポインターに残っている承認待ちを読み直す
+- stats(): 承認・拒否の件数と、止まってから再開するまでの時間
+
+決定のファイル（JSONL）の各行:
+    {"thread_id": "t1", "decision": "approve"}
+    {"thread_id": "t2", "decision": "reject", "reason": "宛先が違う"}
+    {"thread_id": "*", "decision": "approve", "tool": "get_info"}   # 条件に合うものをまとめて承認
+
+例:
+    queue = ApprovalQueue(agent, workers=4)
+    await queue.start()
+    await queue.submit("t1", "test@example.comにメールを送って")
+    for item in queue.pending():
+        print(item.thread_id, item.tool_calls)
+    queue.approve("t1")
+    await queue.join()
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+
+from langchain_core.messages import ToolMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+logger = logging.getLogger(__name__)
+
+_STAT_KEYS = ("submitted", "interrupted", "approved", "rejected", "resumed", "errors")
+_DECISIONS = ("approve", "reject")
+
+
+class PendingApproval:
+    """承認待ちの1スレッド
+
+    Attributes:
+        thread_id: 会話のID
+        tool_calls: 実行の承認を待っている tool_calls
+        interrupted_at: 止まった時刻（time.time()）
+    """
+
+    def __init__(self, thread_id, tool_calls, interrupted_at):
+        self.thread_id = thread_id
+        self.tool_calls = tool_calls
+        self.interrupted_at = interrupted_at
+
+    def __repr__(self):
+        names = ", ".join(tc["name"] for tc in self.tool_calls)
+        return f"<PendingApproval {self.thread_id}: {names}>"
+
+
+def _thread_ids(checkpointer):
+    """保存されているスレッドの id（チェックポイントの中身は読まない）。調べられなければ None"""
+    # ラッパー（DeltaCheckpointSaver など）は inner に実際のチェックポインターを持つ
+    while getattr(checkpointer, "inner", None) is not None:
+        checkpointer = checkpointer.inner
+    if hasattr(checkpointer, "thread_ids"):
+        return checkpointer.thread_ids()
+    if isinstance(checkpointer, InMemorySaver):
+        return list(checkpointer.storage)
+    return None
+
+
+def _created_at(state):
+    """チェックポイントの作成時刻（止まった時刻）を time.time() の値で返す"""
+    if state.created_at:
+        try:
+            return datetime.fromisoformat(state.created_at).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
+class ApprovalQueue:
+    """interrupt で止まったスレッドの承認待ちキュー
+
+    Args:
+        agent: interrupt_before=["tools"] とチェックポインター付きでコンパイルしたグラフ
+        workers: 承認・拒否されたスレッドを再開するワーカーの数
+        on_resumed: 再開した実行が終わったら呼ぶ関数 (thread_id, 最後のメッセージ)
+    """
+
+    def __init__(self, agent, workers=4, on_resumed=None):
+        if agent.checkpointer is None:
+            raise ValueError("ApprovalQueue requires an agent compiled with a checkpointer")
+        self.agent = agent
+        self.workers = workers
+        self.on_resumed = on_resumed
+        self._pending = {}
+        self._decisions = asyncio.Queue()
+        self._tasks = []
+        self._stats = dict.fromkeys(_STAT_KEYS, 0)
+        # 止まってから再開を始めるまでの秒数 / 再開した実行にかかった秒数
+        self._wait_seconds = []
+        self._resume_seconds = []
+
+    @staticmethod
+    def _config(thread_id):
+        return {"configurable": {"thread_id": thread_id}}
+
+    # ---------- ワーカー ----------
+
+    async def start(self):
+        """再開用のワーカーを起動する"""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def join(self):
+        """受け付けた決定がすべて再開し終わるまで待つ"""
+        await self._decisions.join()
+
+    async def close(self):
+        """ワーカーを止める（処理中の再開は取り消す）"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            item, decision, reason = await self._decisions.get()
+            try:
+                await self._resume(item, decision, reason)
+            except Exception:
+                self._stats["errors"] += 1
+                logger.exception("Failed to resume thread %r after %s", item.thread_id, decision)
+                # まだツールの前で止まっていれば、承認待ちに戻す（決定をやり直せるように）
+                try:
+                    await self._check(item.thread_id)
+                except Exception:
+                    logger.exception("Failed to reload the state of thread %r", item.thread_id)
+            finally:
+                self._decisions.task_done()
+
+    async def _resume(self, item, decision, reason):
+        config = self._config(item.thread_id)
+        self._wait_seconds.append(time.time() - item.interrupted_at)
+        t0 = time.perf_counter()
+        if decision == "reject":
+            # ツールを実行した代わりに「拒否された」という結果を入れ、LLMに続きを答えさせる
+            await self.agent.aupdate_state(config, {"messages": [
+                ToolMessage(content=f"ユーザーがこの操作を拒否しました。{reason or ''}".strip(),
+                            tool_call_id=tc["id"], name=tc["name"])
+                for tc in item.tool_calls
+            ]}, as_node="tools")
+        async for _ in self.agent.astream(None, config):
+            pass
+        self._resume_seconds.append(time.perf_counter() - t0)
+        self._stats["resumed"] += 1
+        state = await self._check(item.thread_id)
+        if self.on_resumed is not None:
+            self.on_resumed(item.thread_id, state.values["messages"][-1])
+
+    async def _check(self, thread_id):
+        """スレッドの状態を見て、ツールの前で止まっていれば承認待ちに入れる"""
+        state = await self.agent.aget_state(self._config(thread_id))
+        if "tools" in state.next:
+            tool_calls = state.values["messages"][-1].tool_calls
+            self._pending[thread_id] = PendingApproval(thread_id, tool_calls, _created_at(state))
+            self._stats["interrupted"] += 1
+        return state
+
+    # ---------- 受け付け ----------
+
+    async def submit(self, thread_id, message):
+        """ユーザーの発話で実行し、承認待ちになったら PendingApproval を返す（最後まで進んだら None）"""
+        if thread_id in self._pending:
+            raise ValueError(f"thread {thread_id!r} is waiting for approval")
+        self._stats["submitted"] += 1
+        await self.agent.ainvoke({"messages": [("user", message)]}, self._config(thread_id))
+        await self._check(thread_id)
+        return self._pending.get(thread_id)
+
+    async def recover(self):
+        """チェックポインターに残っている承認待ちを読み直す（再起動後に呼ぶ）。見つけた件数を返す
+
+        スレッドごとに最新のチェックポイントだけを読みます。
+        """
+        thread_ids = await asyncio.to_thread(_thread_ids, self.agent.checkpointer)
+        if thread_ids is None:
+            # スレッドの一覧を持たないチェックポインターでは、全チェックポイントをたどって集める
+            thread_ids = set()
+            async for checkpoint in self.agent.checkpointer.alist(None):
+                thread_ids.add(checkpoint.config["configurable"]["thread_id"])
+        before = len(self._pending)
+        for thread_id in thread_ids - self._pending.keys():
+            await self._check(thread_id)
+        return len(self._pending) - before
+
+    def pending(self, tool=None):
+        """承認待ちの一覧（止まった順）。tool を指定するとそのツールを含むものだけ"""
+        items = sorted(self._pending.values(), key=lambda item: item.interrupted_at)
+        if tool is not None:
+            items = [item for item in items if any(tc["name"] == tool for tc in item.tool_calls)]
+        return items
+
+    def _decide(self, thread_id, decision, reason=None):
+        item = self._pending.pop(thread_id, None)
+        if item is None:
+            raise KeyError(f"thread {thread_id!r} is not waiting for approval")
+        self._stats["approved" if decision == "approve" else "rejected"] += 1
+        self._decisions.put_nowait((item, decision, reason))
+        return item
+
+    def approve(self, thread_id):
+        """承認する（ワーカーがツールを実行して続きを処理する）"""
+        return self._decide(thread_id, "approve")
+
+    def reject(self, thread_id, reason=None):
+        """拒否する（ツールは実行せず、拒否されたことをLLMに伝えて続きを処理する）"""
+        return self._decide(thread_id, "reject", reason)
+
+    def approve_all(self, predicate=None):
+        """承認待ちをまとめて承認する。predicate(PendingApproval) で絞り込める。承認した件数を返す"""
+        items = [item for item in self.pending() if predicate is None or predicate(item)]
+        for item in items:
+            self.approve(item.thread_id)
+        return len(items)
+
+    def apply_file(self, path):
+        """決定のファイル（JSONL）を読み込んで適用する。適用した件数を返す
+
+        thread_id が "*" の行は、tool（省略可）を含む承認待ちすべてに適用します。
+        承認待ちでないスレッドの行は無視します。
+        decision が "approve" / "reject" 以外の行があれば、どの行も適用せずに ValueError を送出します。
+        """
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                if row.get("decision") not in _DECISIONS:
+                    raise ValueError(
+                        f"{path}:{lineno}: unknown decision {row.get('decision')!r} (expected one of {_DECISIONS})"
+                    )
+                rows.append(row)
+        applied = 0
+        for row in rows:
+            if row["thread_id"] == "*":
+                targets = [item.thread_id for item in self.pending(row.get("tool"))]
+            else:
+                targets = [row["thread_id"]] if row["thread_id"] in self._pending else []
+            for thread_id in targets:
+                if row["decision"] == "approve":
+                    self.approve(thread_id)
+                else:
+                    self.reject(thread_id, row.get("reason"))
+                applied += 1
+        return applied
+
+    # ---------- 統計 ----------
+
+    def stats(self):
+        """件数と、止まってから再開するまでの時間・再開した実行の時間（ミリ秒の p50 / p99）"""
+        def summary(values):
+            if not values:
+                return {"count": 0}
+            ordered = sorted(values)
+            return {
+                "count": len(ordered),
+                "p50_ms": ordered[len(ordered) // 2] * 1000,
+                "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+            }
+
+        return {
+            **self._stats,
+            "pending": len(self._pending),
+            "interrupt_to_resume": summary(self._wait_seconds),
+            "resume_run": summary(self._resume_seconds),
+        }
@@ -0,0 +1,109 @@
+"""
+ツール呼び出しの自動承認ポリシー
+
+interrupt_before=["tools"] は、get_info のような無害なツールでも毎回止まります。
+1回止まるごとに、チェックポイントの書き込み・get_state の読み込み・2回目の stream が必要です。
+ApprovalPolicy で安全と判断できる呼び出しは、止めずにそのまま実行するノードへ振り分けます。
+
+- allow: 常に自動承認するツール名
+- rules: ツール名 -> 引数のパターン（正規表現で完全一致）のリスト。どれか1つに合えば自動承認
+- trusted: thread_id -> 自動承認するツール名の集合（"*" ですべて）。スレッドごとの信頼
+- 1回の応答の tool_calls がすべて自動承認できるときだけ止めずに実行する（1つでも承認が必要なら全体を止める）
+
+例:
+    policy = ApprovalPolicy(
+        allow={"get_info"},
+        rules={"send_email": [{"to": r".+@example\\.com"}]},
+        trusted={"admin-1": "*"},
+    )
+
+    def should_continue(state, config):
+        tool_calls = state["messages"][-1].tool_calls
+        if not tool_calls:
+            return END
+        return "safe_tools" if policy.allows(tool_calls, thread_id(config)) else "tools"
+
+ポリシーは JSON ファイルからも読み込めます（load_policy / 環境変数 APPROVAL_POLICY）。
+    {"allow": ["get_info"], "rules": {"send_email": [{"to": ".+@example\\\\.com"}]}, "trusted": {"admin-1": "*"}}
+"""
+import json
+import os
+import re
+import threading
+
+
+def thread_id(config):
+    """config から thread_id を取り出す（なければ None）"""
+    return (config or {}).get("configurable", {}).get("thread_id")
+
+
+class ApprovalPolicy:
+    """ツール呼び出しを承認なしで実行してよいかを判断する
+
+    Args:
+        allow: 常に自動承認するツール名
+        rules: ツール名 -> [{引数名: 正規表現, ...}, ...]
+        trusted: thread_id -> 自動承認するツール名の集合、または "*"
+    """
+
+    def __init__(self, allow=(), rules=None, trusted=None):
+        self.allow = set(allow)
+        self.rules = {
+            name: [{arg: re.compile(pattern) for arg, pattern in rule.items()} for rule in rule_list]
+            for name, rule_list in (rules or {}).items()
+        }
+        self.trusted = {}
+        for tid, tools in (trusted or {}).items():
+            self.trust(tid, None if tools == "*" else tools)
+        self._stats = dict.fromkeys(("auto_approved", "paused"), 0)
+        self._lock = threading.Lock()
+
+    def trust(self, thread_id, tools=None):
+        """スレッドを信頼する。tools を省略するとすべてのツールを自動承認する"""
+        self.trusted[thread_id] = "*" if tools is None else set(tools)
+
+    def untrust(self, thread_id):
+        self.trusted.pop(thread_id, None)
+
+    def _matches(self, rule, args):
+        return all(
+            arg in args and pattern.fullmatch(str(args[arg])) is not None
+            for arg, pattern in rule.items()
+        )
+
+    def is_safe(self, tool_call, thread_id=None):
+        """1つの tool_call を承認なしで実行してよいか"""
+        name = tool_call["name"]
+        if name in self.allow:
+            return True
+        tools = self.trusted.get(thread_id) if thread_id is not None else None
+        if tools == "*" or (tools and name in tools):
+            return True
+        return any(self._matches(rule, tool_call["args"]) for rule in self.rules.get(name, ()))
+
+    def allows(self, tool_calls, thread_id=None):
+        """1回の応答の tool_calls がすべて承認なしで実行できるか"""
+        safe = all(self.is_safe(tc, thread_id) for tc in tool_calls)
+        with self._lock:
+            self._stats["auto_approved" if safe else "paused"] += 1
+        return safe
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(allow=data.get("allow", ()), rules=data.get("rules"), trusted=data.get("trusted"))
+
+
+def load_policy(path=None, default=None):
+    """JSON ファイル（省略時は環境変数 APPROVAL_POLICY）からポリシーを読み込む
+
+    ファイルが指定されていなければ default（省略時は何も自動承認しないポリシー）を返します。
+    """
+    path = path or os.environ.get("APPROVAL_POLICY")
+    if not path:
+        return default if default is not None else ApprovalPolicy()
+    with open(path, encoding="utf-8") as f:
+        return ApprovalPolicy.from_dict(json.load(f))
@@ -0,0 +1,34 @@
+"""
+同期・非同期の両方で実行できるノードとツールを作るヘルパー
+
+グラフを agent.invoke / agent.stream で実行すると同期版、
+agent.ainvoke / agent.astream で実行すると非同期版が使われます。
+非同期版では1つのイベントループで多数の会話を同時に処理できます。
+"""
+from langchain_core.runnables import RunnableLambda
+
+
+def async_node(func, afunc):
+    """同期版 func と非同期版 afunc を持つノードを作る
+
+    例:
+        builder.add_node("chatbot", async_node(chatbot, achatbot))
+    """
+    return RunnableLambda(func, afunc=afunc, name=func.__name__)
+
+
+def with_async(tool, coroutine=None):
+    """ツールに非同期版を設定して返す
+
+    coroutine を省略した場合は、同期関数をイベントループ上でそのまま実行します。
+    ブロックしない軽い処理（計算やダミーデータの参照）のツール向けです。
+    I/Oを伴うツールには、await するコルーチンを明示的に渡してください。
+    """
+    if coroutine is None:
+        func = tool.func
+
+        async def coroutine(*args, **kwargs):
+            return func(*args, **kwargs)
+
+    tool.coroutine = coroutine
+    return tool
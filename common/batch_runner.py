@@ -0,0 +1,233 @@
+"""
+大量のプロンプトをエージェントで一括処理するバッチランナー
+
+JSONL（1行に {"id": ..., "prompt": ...}）を読み込み、コンパイル済みのグラフを
+agent.ainvoke で同時実行数を制限しながら実行します。
+
+- 結果は完了した順に JSONL へ1行ずつ追記する（途中で落ちても完了分は残る）
+- 出力ファイルに成功した id があればスキップする（再実行で続きから再開）
+- 429（レート制限）を受けたら全ワーカーの新しい呼び出しを待たせ、指数バックオフで再試行する
+- 件数・失敗数・再試行数・スループット・レイテンシを集計する
+
+入力の各行:
+    {"id": "q1", "prompt": "25と75を足すといくつ？"}
+    （id を省略した場合は行番号。"thread_id" を指定するとチェックポインター付きのグラフで使う）
+
+出力の各行:
+    {"id": "q1", "output": "...", "latency_ms": 812.3, "attempts": 1}
+    {"id": "q2", "error": "...", "status_code": 500, "attempts": 6}
+
+使い方:
+    python3 common/batch_runner.py prompts.jsonl results.jsonl
+    python3 common/batch_runner.py prompts.jsonl results.jsonl --graph chapter3/multi_tools.py --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from common.rate_limit import status_code
+
+# 再試行する status_code（429 はレート制限として全体を待たせる）
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def read_items(path):
+    """入力の JSONL を1件ずつ読む（空行は無視）"""
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", lineno)
+            yield item
+
+
+def completed_ids(path, retry_failed=True):
+    """出力の JSONL から処理済みの id を集める
+
+    書き込み途中で落ちた最後の行のような、読めない行は無視します。
+    retry_failed=True なら、エラーで終わった id は処理済みに含めません。
+    """
+    done = set()
+    if not Path(path).exists():
+        return done
+    # 最後の行が文字の途中で切れていることがあるので、デコードできないバイトは置き換える
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            key = str(record.get("id"))
+            if "error" in record and retry_failed:
+                done.discard(key)
+            else:
+                done.add(key)
+    return done
+
+
+def last_content(result):
+    """グラフの結果から最後のメッセージの本文を取り出す（既定の出力）"""
+    return result["messages"][-1].content
+
+
+class BatchRunner:
+    """プロンプトの JSONL をグラフで一括処理する
+
+    Args:
+        agent: コンパイル済みのグラフ（ainvoke を使う）
+        concurrency: 同時に実行する会話の数
+        max_retries: 1件あたりの再試行の上限
+        backoff: 再試行の待ち時間の基準（秒）。attempt 回目は backoff * 2**(attempt-1) 秒（ジッター付き）
+        max_backoff: 待ち時間の上限（秒）
+        config: 各実行に渡す config（thread_id は1件ごとに設定する）
+        extract: グラフの結果を出力の "output" に変換する関数
+        progress_every: この件数ごとに進捗を表示する（0 で表示しない）
+    """
+
+    def __init__(self, agent, concurrency=8, max_retries=5, backoff=1.0, max_backoff=60.0,
+                 config=None, extract=last_content, progress_every=0):
+        self.agent = agent
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.config = config or {}
+        self.extract = extract
+        self.progress_every = progress_every
+        # レート制限を受けたとき、この時刻（loop.time()）まで新しい呼び出しを待たせる
+        self._resume_at = 0.0
+
+    def run(self, input_path, output_path, retry_failed=True):
+        """同期版（asyncio.run で arun を実行する）"""
+        return asyncio.run(self.arun(input_path, output_path, retry_failed))
+
+    async def arun(self, input_path, output_path, retry_failed=True):
+        """input_path の未処理の項目を実行し、output_path に追記して集計を返す"""
+        done = completed_ids(output_path, retry_failed)
+        stats = dict.fromkeys(("completed", "failed", "skipped", "retries", "rate_limited"), 0)
+        latencies = []
+        items = read_items(input_path)
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+
+        # 前回の書き込みが行の途中（文字の途中のこともある）で止まっていたら改行してから追記する
+        # 末尾の確認はバイト単位で行う
+        with open(output_path, "ab+") as out:
+            if out.tell() > 0:
+                out.seek(-1, os.SEEK_END)
+                if out.read(1) != b"\n":
+                    out.write(b"\n")
+
+        with open(output_path, "a", encoding="utf-8") as out:
+            async def worker():
+                # ワーカーは1つのイテレーターを共有し、読み込みながら処理する（全件をメモリに載せない）
+                for item in items:
+                    if str(item["id"]) in done:
+                        stats["skipped"] += 1
+                        continue
+                    record = await self._run_item(item, stats)
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    if "error" in record:
+                        stats["failed"] += 1
+                    else:
+                        stats["completed"] += 1
+                        latencies.append(record["latency_ms"])
+                    processed = stats["completed"] + stats["failed"]
+                    if self.progress_every and processed % self.progress_every == 0:
+                        elapsed = time.perf_counter() - started
+                        print(f"[batch] {processed}件 完了（{processed / elapsed:.1f}件/秒）", file=sys.stderr)
+
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        stats.update({
+            "elapsed_s": elapsed,
+            "throughput_per_s": (stats["completed"] + stats["failed"]) / elapsed if elapsed else 0.0,
+            "latency_p50_ms": latencies[len(latencies) // 2] if latencies else None,
+            "latency_p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else None,
+        })
+        return stats
+
+    async def _wait_rate_limit(self):
+        loop = asyncio.get_running_loop()
+        while (delay := self._resume_at - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+    async def _run_item(self, item, stats):
+        loop = asyncio.get_running_loop()
+        thread_id = item.get("thread_id") or f"batch-{item['id']}"
+        config = {**self.config, "configurable": {**self.config.get("configurable", {}), "thread_id": thread_id}}
+        attempt = 0
+        while True:
+            attempt += 1
+            await self._wait_rate_limit()
+            t0 = time.perf_counter()
+            try:
+                result = await self.agent.ainvoke({"messages": [("user", item["prompt"])]}, config)
+                return {
+                    "id": item["id"],
+                    "output": self.extract(result),
+                    "latency_ms": (time.perf_counter() - t0) * 1000,
+                    "attempts": attempt,
+                }
+            except Exception as e:
+                code = status_code(e)
+                if code not in RETRYABLE_STATUS or attempt > self.max_retries:
+                    return {"id": item["id"], "error": str(e), "status_code": code, "attempts": attempt}
+                stats["retries"] += 1
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                if code == 429:
+                    # レート制限は全体の問題なので、他のワーカーの新しい呼び出しもまとめて待たせる
+                    stats["rate_limited"] += 1
+                    self._resume_at = max(self._resume_at, loop.time() + delay)
+                    await self._wait_rate_limit()
+                else:
+                    await asyncio.sleep(delay)
+
+
+def load_graph(path, attr="agent"):
+    """スクリプト（例: "chapter3/multi_tools.py"）を読み込み、コンパイル済みのグラフを返す
+
+    スクリプトは1度だけ実行します（common/graph_registry.py の load_module）。
+    """
+    from common.graph_registry import load_module
+    return getattr(load_module(path), attr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", type=Path, help="プロンプトの JSONL")
+    parser.add_argument("output", type=Path, help="結果を追記する JSONL（既にある id はスキップ）")
+    parser.add_argument("--graph", default="chapter3/multi_tools.py", help="グラフを定義したスクリプト")
+    parser.add_argument("--attr", default="agent", help="コンパイル済みグラフの変数名")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--backoff", type=float, default=1.0)
+    parser.add_argument("--no-retry-failed", dest="retry_failed", action="store_false",
+                        help="前回エラーになった id も再実行しない")
+    parser.add_argument("--progress-every", type=int, default=100)
+    args = parser.parse_args()
+
+    agent = load_graph(Path(__file__).parent.parent / args.graph, args.attr)
+    runner = BatchRunner(agent, concurrency=args.concurrency, max_retries=args.max_retries,
+                         backoff=args.backoff, progress_every=args.progress_every)
+    stats = runner.run(args.input, args.output, retry_failed=args.retry_failed)
+
+    print(f"完了: {stats['completed']}件 / 失敗: {stats['failed']}件 / スキップ: {stats['skipped']}件 "
+          f"/ 再試行: {stats['retries']}回（うちレート制限 {stats['rate_limited']}回）")
+    print(f"経過時間: {stats['elapsed_s']:.1f}秒 / スループット: {stats['throughput_per_s']:.1f}件/秒")
+    if stats["latency_p50_ms"] is not None:
+        print(f"レイテンシ: p50 {stats['latency_p50_ms']:.0f}ms / p99 {stats['latency_p99_ms']:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+1回の実行（ユーザーの発話1つ分のツールループ）の予算: ループの回数・締め切り・トークン数
+
+should_continue はLLMが tool_calls を返し続けるかぎり tools -> chatbot を繰り返すため、
+おかしな応答が続くとワーカーを使い続けます。予算は config（configurable["budget"]）で渡し、
+
+- chatbot ノード（budgeted で包む）は、LLMを呼ぶ前に予算を確認し、使い切っていれば
+  LLMを呼ばずにここまでの結果で部分的な回答を返す（tool_calls がないのでループはそこで終わる）
+- 非同期実行では、締め切りを過ぎた時点で実行中のLLMの呼び出しを取り消す（asyncio のキャンセル）。
+  同期実行では呼び出しを中断できないので、終わってから締め切りを確認し、tool_calls は実行しない
+- ParallelToolNode は、残り時間をツールのタイムアウトの上限にする（非同期では実行中のツールを取り消す）
+- 使い切った予算は、カスタムイベント budget_exhausted（common/tracing.py のメトリクス
+  langgraph_budget_exhausted_total）と budget_stats() に記録し、部分的な回答の
+  response_metadata["budget_exhausted"] にも入れる
+
+予算:
+- max_iterations: ツールを呼ぶループの回数（省略時は環境変数 AGENT_MAX_ITERATIONS、既定10。
+  langgraph 1.x の recursion_limit の既定は 10007 ステップで、ループはほぼ止まらない。
+  recursion_limit を小さくすると GraphRecursionError で終わり、それまでの結果は返らない）
+- deadline: 締め切りの時刻（time.time()）。with_budget(timeout=秒) で今からの秒数で指定できる
+- max_tokens: LLMの入出力トークンの合計（省略時は環境変数 AGENT_MAX_TOKENS、既定は無制限）
+
+ループの回数とトークン数は、最後のユーザーの発話より後のメッセージから数えます
+（チェックポイントから再開しても数え直しにならない）。
+
+例:
+    builder.add_node("chatbot", budgeted(chatbot, achatbot))
+
+    config = with_budget({"configurable": {"thread_id": "t1"}}, max_iterations=5, timeout=30, max_tokens=20000)
+    agent.invoke({"messages": [("user", "...")]}, config)
+"""
+import asyncio
+import os
+import threading
+import time
+
+from langchain_core.callbacks import adispatch_custom_event, dispatch_custom_event
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+BUDGETS = ("iterations", "deadline", "tokens")
+DEFAULT_MAX_ITERATIONS = 10
+
+_LABELS = {"iterations": "ループの回数の上限", "deadline": "締め切り", "tokens": "トークン数の上限"}
+
+_stats = {budget: 0 for budget in BUDGETS}
+_stats_lock = threading.Lock()
+
+
+def with_budget(config=None, max_iterations=None, timeout=None, max_tokens=None, deadline=None):
+    """config に予算を入れて返す（元の config は変更しない）
+
+    timeout は今からの秒数で、締め切りの時刻（deadline）にして入れます。
+    """
+    config = dict(config or {})
+    if timeout is not None:
+        deadline = time.time() + timeout if deadline is None else min(deadline, time.time() + timeout)
+    config["configurable"] = {
+        **config.get("configurable", {}),
+        "budget": {"max_iterations": max_iterations, "deadline": deadline, "max_tokens": max_tokens},
+    }
+    return config
+
+
+def remaining(config):
+    """締め切りまでの秒数（締め切りがなければ None。過ぎていれば0以下）"""
+    budget = (config or {}).get("configurable", {}).get("budget") or {}
+    deadline = budget.get("deadline")
+    return None if deadline is None else deadline - time.time()
+
+
+def budget_stats():
+    """使い切った予算の種類ごとの回数（プロセス全体）"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _turn(messages):
+    """最後のユーザーの発話より後のメッセージ"""
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return messages[i + 1:]
+    return list(messages)
+
+
+def _text(message):
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+
+
+class Budget:
+    """config から取り出した1回の実行の予算"""
+
+    def __init__(self, max_iterations=None, deadline=None, max_tokens=None):
+        self.max_iterations = max_iterations
+        self.deadline = deadline
+        self.max_tokens = max_tokens
+
+    @classmethod
+    def from_config(cls, config):
+        budget = (config or {}).get("configurable", {}).get("budget") or {}
+        max_iterations = budget.get("max_iterations")
+        if max_iterations is None:
+            max_iterations = int(os.environ.get("AGENT_MAX_ITERATIONS", DEFAULT_MAX_ITERATIONS))
+        max_tokens = budget.get("max_tokens")
+        if max_tokens is None and os.environ.get("AGENT_MAX_TOKENS"):
+            max_tokens = int(os.environ["AGENT_MAX_TOKENS"])
+        return cls(max_iterations, budget.get("deadline"), max_tokens)
+
+    def remaining(self):
+        return None if self.deadline is None else self.deadline - time.time()
+
+    def exhausted(self, messages, iterations=True):
+        """使い切った予算の種類（"deadline" / "iterations" / "tokens"）。残っていれば None
+
+        iterations=False ではループの回数を確認しない（LLMの応答の直後。その tool_calls はまだ実行していない）
+        """
+        if self.deadline is not None and time.time() >= self.deadline:
+            return "deadline"
+        turn = _turn(messages)
+        if iterations and self.max_iterations is not None:
+            if sum(1 for m in turn if isinstance(m, AIMessage) and m.tool_calls) >= self.max_iterations:
+                return "iterations"
+        if self.max_tokens is not None:
+            used = sum((m.usage_metadata or {}).get("total_tokens", 0) for m in turn if isinstance(m, AIMessage))
+            if used >= self.max_tokens:
+                return "tokens"
+        return None
+
+    def partial_answer(self, messages, reason):
+        """ここまでのツールの結果（なければ最後の応答）で作る部分的な回答"""
+        turn = _turn(messages)
+        results = [_text(m) for m in turn if isinstance(m, ToolMessage)]
+        if not results:
+            results = [_text(m) for m in turn if isinstance(m, AIMessage) and _text(m)][-1:]
+        body = "、".join(results) if results else "まだ結果がありません"
+        return AIMessage(
+            content=f"（{_LABELS[reason]}に達したため、ここまでの結果で回答します）{body}",
+            response_metadata={"budget_exhausted": reason},
+        )
+
+
+def _record(reason):
+    with _stats_lock:
+        _stats[reason] += 1
+
+
+def budgeted(func, afunc):
+    """chatbot ノードを予算付きにする（async_node の代わりに使う）
+
+    func / afunc は (state) -> {"messages": [AIMessage]} を返す同期版・非同期版のノード関数です。
+    """
+
+    def stop(state, config, reason, messages=()):
+        budget = Budget.from_config(config)
+        _record(reason)
+        return {"messages": [budget.partial_answer(list(state["messages"]) + list(messages), reason)]}
+
+    def after(state, config, result):
+        """LLMの呼び出しの後: 予算を使い切っていれば tool_calls を実行せずに終える"""
+        messages = result.get("messages", [])
+        if not any(isinstance(m, AIMessage) and m.tool_calls for m in messages):
+            return result, None
+        reason = Budget.from_config(config).exhausted(list(state["messages"]) + list(messages), iterations=False)
+        return (result, None) if reason is None else (stop(state, config, reason, messages), reason)
+
+    def run(state, config):
+        reason = Budget.from_config(config).exhausted(state["messages"])
+        if reason is None:
+            result, reason = after(state, config, func(state))
+            if reason is None:
+                return result
+        else:
+            result = stop(state, config, reason)
+        dispatch_custom_event("budget_exhausted", {"budget": reason}, config=config)
+        return result
+
+    async def arun(state, config):
+        budget = Budget.from_config(config)
+        reason = budget.exhausted(state["messages"])
+        if reason is None:
+            left = budget.remaining()
+            try:
+                # 締め切りを過ぎたら実行中のLLMの呼び出しを取り消す
+                result = await asyncio.wait_for(afunc(state), timeout=None if left is None else max(0.0, left))
+            except asyncio.TimeoutError:
+                result, reason = stop(state, config, "deadline"), "deadline"
+            else:
+                result, reason = after(state, config, result)
+                if reason is None:
+                    return result
+        else:
+            result = stop(state, config, reason)
+        await adispatch_custom_event("budget_exhausted", {"budget": reason}, config=config)
+        return result
+
+    return RunnableLambda(run, afunc=arun, name=func.__name__)
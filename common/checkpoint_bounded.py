@@ -0,0 +1,325 @@
+"""
+上限付きのインメモリチェックポインター（MemorySaver の置き換え）
+
+MemorySaver は一度使った thread_id をすべて保持し続けるため、thread_id を次々に作る
+長時間稼働のサービスではメモリが増え続けます。BoundedMemorySaver はスレッド単位で
+古いものから捨てていきます。
+
+- max_threads / max_bytes: 超えたら最後に使われてから最も時間が経ったスレッドを削除（LRU）
+  バイト数はシリアライズ後のサイズ（チェックポイント・チャネルの値・pending writes）で数える
+- ttl: 最後に使われてから ttl 秒経ったスレッドを削除
+- keep_last: スレッドごとに直近 K 個のチェックポイントだけを残す
+- stats(): ヒット・ミス・削除数・削除したバイト数などの統計
+
+例:
+    memory = BoundedMemorySaver(max_bytes=256 * 1024 * 1024, ttl=3600, keep_last=10)
+    agent = builder.compile(checkpointer=memory)
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+
+class _Thread:
+    """1スレッド分の保存内容"""
+
+    __slots__ = ("checkpoints", "latest", "blobs", "writes", "bytes", "last_access")
+
+    def __init__(self):
+        # (checkpoint_ns, checkpoint_id) -> (type, checkpoint, metadata_type, metadata, parent_id, channel_versions)
+        self.checkpoints = {}
+        # checkpoint_ns -> 最新の checkpoint_id
+        self.latest = {}
+        # (checkpoint_ns, channel, version) -> (type, blob)
+        self.blobs = {}
+        # (checkpoint_ns, checkpoint_id) -> {(task_id, idx): (task_id, channel, type, value, task_path)}
+        self.writes = {}
+        self.bytes = 0
+        self.last_access = 0.0
+
+
+def _size(*values):
+    return sum(len(v) for v in values if v)
+
+
+class BoundedMemorySaver(BaseCheckpointSaver):
+    """スレッド単位の LRU / TTL で古い会話を捨てるインメモリチェックポインター
+
+    Args:
+        max_threads: 保持するスレッド数の上限（None で無制限）
+        max_bytes: シリアライズ後の合計バイト数の上限（None で無制限）
+        ttl: 最後に使われてから削除するまでの秒数（None で無期限）
+        keep_last: スレッドごとに残すチェックポイント数（None で全部）
+        serde: シリアライザ（省略時はlanggraphの既定）
+        clock: 現在時刻を返す関数（TTLの判定に使う）
+    """
+
+    def __init__(self, max_threads=None, max_bytes=None, ttl=None, keep_last=None, *, serde=None, clock=time.monotonic):
+        super().__init__(serde=serde)
+        if keep_last is not None and keep_last < 1:
+            raise ValueError("keep_last must be >= 1")
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.keep_last = keep_last
+        self.clock = clock
+        # thread_id -> _Thread（最後に使われた順）
+        self._threads = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._stats = dict.fromkeys(
+            ("hits", "misses", "evicted_threads", "expired_threads", "pruned_checkpoints", "evicted_bytes"), 0,
+        )
+
+    # ---------- スレッドの管理 ----------
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry.last_access > self.ttl
+
+    def _drop(self, thread_id, reason):
+        entry = self._threads.pop(thread_id)
+        self._bytes -= entry.bytes
+        self._stats[reason] += 1
+        self._stats["evicted_bytes"] += entry.bytes
+
+    def _touch(self, thread_id, create=False):
+        """スレッドを取り出して最後に使われたことにする。期限切れなら削除して None"""
+        now = self.clock()
+        entry = self._threads.get(thread_id)
+        if entry is not None and self._expired(entry, now):
+            self._drop(thread_id, "expired_threads")
+            entry = None
+        if entry is None:
+            if not create:
+                return None
+            entry = self._threads[thread_id] = _Thread()
+        entry.last_access = now
+        self._threads.move_to_end(thread_id)
+        return entry
+
+    def _add_bytes(self, entry, n):
+        entry.bytes += n
+        self._bytes += n
+
+    def _evict(self, keep):
+        """期限切れのスレッドと上限を超えた分を、最後に使われた時刻の古い順に削除する"""
+        now = self.clock()
+        while self._threads:
+            thread_id, entry = next(iter(self._threads.items()))
+            if self._expired(entry, now):
+                self._drop(thread_id, "expired_threads")
+            elif thread_id != keep and (
+                (self.max_threads is not None and len(self._threads) > self.max_threads)
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                self._drop(thread_id, "evicted_threads")
+            else:
+                break
+
+    def _prune(self, entry, checkpoint_ns):
+        """keep_last を超えた古いチェックポイントと、参照されなくなったチャネルの値を削除する"""
+        ids = sorted(cid for ns, cid in entry.checkpoints if ns == checkpoint_ns)
+        if len(ids) <= self.keep_last:
+            return
+        freed = 0
+        for checkpoint_id in ids[:-self.keep_last]:
+            saved = entry.checkpoints.pop((checkpoint_ns, checkpoint_id))
+            freed += _size(saved[1], saved[3])
+            for write in entry.writes.pop((checkpoint_ns, checkpoint_id), {}).values():
+                freed += _size(write[3])
+            self._stats["pruned_checkpoints"] += 1
+        referenced = {
+            (ns, channel, version)
+            for (ns, _), saved in entry.checkpoints.items() if ns == checkpoint_ns
+            for channel, version in saved[5].items()
+        }
+        for key in [k for k in entry.blobs if k[0] == checkpoint_ns and k not in referenced]:
+            freed += _size(entry.blobs.pop(key)[1])
+        self._add_bytes(entry, -freed)
+        self._stats["evicted_bytes"] += freed
+
+    def stats(self):
+        """統計（ヒット・ミス・削除数・削除したバイト数・現在のスレッド数とバイト数）"""
+        with self._lock:
+            return {**self._stats, "threads": len(self._threads), "bytes": self._bytes}
+
+    # ---------- 読み込み ----------
+
+    def _to_tuple(self, thread_id, checkpoint_ns, checkpoint_id, entry):
+        type_, checkpoint_b, metadata_type, metadata_b, parent_id, versions = entry.checkpoints[
+            (checkpoint_ns, checkpoint_id)
+        ]
+        values = {}
+        for channel, version in versions.items():
+            blob = entry.blobs.get((checkpoint_ns, channel, str(version)))
+            if blob is not None and blob[0] != "empty":
+                values[channel] = self.serde.loads_typed(blob)
+        writes = sorted(
+            entry.writes.get((checkpoint_ns, checkpoint_id), {}).items(),
+            key=lambda item: writes_sort_key(item[1][4], item[0][0], item[0][1]),
+        )
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id,
+            }},
+            checkpoint={**self.serde.loads_typed((type_, checkpoint_b)), "channel_values": values},
+            metadata=self.serde.loads_typed((metadata_type, metadata_b)),
+            parent_config=(
+                {"configurable": {
+                    "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id,
+                }}
+                if parent_id else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((type_, value)))
+                for task_id, channel, type_, value, _ in (w for _, w in writes)
+            ],
+        )
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            entry = self._touch(thread_id)
+            checkpoint_id = get_checkpoint_id(config)
+            if entry is not None and checkpoint_id is None:
+                checkpoint_id = entry.latest.get(checkpoint_ns)
+            if entry is None or (checkpoint_ns, checkpoint_id) not in entry.checkpoints:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            return self._to_tuple(thread_id, checkpoint_ns, checkpoint_id, entry)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        with self._lock:
+            if config is not None:
+                thread_id = config["configurable"]["thread_id"]
+                entry = self._touch(thread_id)
+                threads = [(thread_id, entry)] if entry is not None else []
+            else:
+                self._evict(keep=None)
+                threads = list(self._threads.items())
+            checkpoint_ns = config["configurable"].get("checkpoint_ns") if config else None
+            checkpoint_id = get_checkpoint_id(config) if config else None
+            before_id = get_checkpoint_id(before) if before else None
+
+            results = []
+            for thread_id, entry in threads:
+                for ns, cid in sorted(entry.checkpoints, key=lambda k: k[1], reverse=True):
+                    if checkpoint_ns is not None and ns != checkpoint_ns:
+                        continue
+                    if (checkpoint_id and cid != checkpoint_id) or (before_id and cid >= before_id):
+                        continue
+                    if filter:
+                        saved = entry.checkpoints[(ns, cid)]
+                        metadata = self.serde.loads_typed((saved[2], saved[3]))
+                        if not all(metadata.get(k) == v for k, v in filter.items()):
+                            continue
+                    if limit is not None and len(results) >= limit:
+                        break
+                    results.append(self._to_tuple(thread_id, ns, cid, entry))
+        yield from results
+
+    # ---------- 書き込み ----------
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+        blobs = {
+            (checkpoint_ns, channel, str(version)):
+                self.serde.dumps_typed(values[channel]) if channel in values else ("empty", None)
+            for channel, version in new_versions.items()
+        }
+        type_, checkpoint_b = self.serde.dumps_typed(c)
+        metadata_type, metadata_b = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        saved = (type_, checkpoint_b, metadata_type, metadata_b,
+                 config["configurable"].get("checkpoint_id"), dict(checkpoint["channel_versions"]))
+
+        with self._lock:
+            entry = self._touch(thread_id, create=True)
+            added = _size(checkpoint_b, metadata_b)
+            if (old := entry.checkpoints.get((checkpoint_ns, checkpoint["id"]))) is not None:
+                added -= _size(old[1], old[3])
+            entry.checkpoints[(checkpoint_ns, checkpoint["id"])] = saved
+            if checkpoint["id"] > entry.latest.get(checkpoint_ns, ""):
+                entry.latest[checkpoint_ns] = checkpoint["id"]
+            for key, blob in blobs.items():
+                if (old := entry.blobs.get(key)) is not None:
+                    added -= _size(old[1])
+                entry.blobs[key] = blob
+                added += _size(blob[1])
+            self._add_bytes(entry, added)
+            if self.keep_last is not None:
+                self._prune(entry, checkpoint_ns)
+            self._evict(keep=thread_id)
+        return {"configurable": {
+            "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"],
+        }}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            rows.append((idx, (task_id, channel, *self.serde.dumps_typed(value), task_path)))
+
+        with self._lock:
+            entry = self._touch(thread_id, create=True)
+            stored = entry.writes.setdefault((checkpoint_ns, checkpoint_id), {})
+            added = 0
+            for idx, row in rows:
+                key = (task_id, idx)
+                # 特殊チャネル（エラー・割り込みなど、idxが負）は上書き、通常の書き込みは最初の1回のみ保存
+                if key in stored:
+                    if idx >= 0:
+                        continue
+                    added -= _size(stored[key][3])
+                stored[key] = row
+                added += _size(row[3])
+            self._add_bytes(entry, added)
+            self._evict(keep=thread_id)
+
+    def thread_ids(self):
+        """保持しているスレッドの id"""
+        with self._lock:
+            return list(self._threads)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            if (entry := self._threads.pop(thread_id, None)) is not None:
+                self._bytes -= entry.bytes
+
+    # MemorySaver と同じ形式（"連番.乱数"）。文字列のまま大小比較できる
+    get_next_version = InMemorySaver.get_next_version
+
+    # ---------- 非同期（メモリ上の処理なのでそのまま同期版を呼ぶ） ----------
+
+    async def aget_tuple(self, config):
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        self.delete_thread(thread_id)
@@ -0,0 +1,251 @@
+"""
+メッセージの差分だけを保存するチェックポインター
+
+add_messages の State では、チェックポイントのたびにメッセージ一覧全体が保存されるため、
+会話が長くなると保存量とシリアライズ時間が O(n²) で増えていきます。
+DeltaCheckpointSaver は別のチェックポインター（MemorySaver / SqliteSaver）を包み、
+messages チャネルを「親チェックポイントからの差分」として保存します。
+
+- 追加・更新されたメッセージ（message id で識別）と削除された id だけを保存
+- snapshot_every 個目の差分は、親ではなく直前の「区切り」（前の区切りの差分または全体保存）からの
+  差分として保存する（区切りの差分。親からの差分 snapshot_every 個分の大きさ）
+- 全体は区切りの差分が max(snapshot_every, メッセージ数 // snapshot_every) 個たまるごとに保存する。
+  会話が長くなるほど全体保存の間隔が広がるため、全体保存を含めても1チェックポイントあたりの
+  保存量はほぼ一定（メッセージ約1件分の上乗せ）になる
+- 読み込み時は、親からの差分を最大 snapshot_every 個たどって区切りに着き、そこからは区切りの差分だけを
+  たどって全体保存に着く（たどる数は、メッセージ数が snapshot_every**3 未満なら 2 * snapshot_every 以下）
+- 読み込み時に差分を適用して一覧を復元（直近の復元結果はキャッシュ）
+
+例:
+    memory = DeltaCheckpointSaver(MemorySaver(), snapshot_every=50)
+    agent = builder.compile(checkpointer=memory)
+"""
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+_DELTA = "__messages_delta__"
+
+
+class _Position(NamedTuple):
+    """チェックポイントが差分のつながりのどこにあるか"""
+
+    since: int    # 直前の区切りから、親からの差分がいくつ続いているか
+    anchors: int  # 直前の全体保存から、区切りの差分がいくつあるか
+    anchor: str   # 直前の区切り（区切りの差分または全体保存）の checkpoint_id
+
+    @classmethod
+    def snapshot(cls, checkpoint_id):
+        return cls(0, 0, checkpoint_id)
+
+    def next(self):
+        return self._replace(since=self.since + 1)
+
+    def anchored(self, checkpoint_id):
+        return _Position(0, self.anchors + 1, checkpoint_id)
+
+
+class DeltaCheckpointSaver(BaseCheckpointSaver):
+    """messages チャネルを差分で保存するチェックポインターのラッパー
+
+    Args:
+        inner: 実際に保存を行うチェックポインター
+        channel: 差分で保存するチャネル名
+        snapshot_every: 区切りの差分を保存する間隔（連続する親からの差分の数）。全体保存の間隔の最小値も兼ねる
+        cache_size: 復元済みの一覧をキャッシュするチェックポイント数
+    """
+
+    def __init__(self, inner, channel="messages", snapshot_every=50, cache_size=1024):
+        super().__init__(serde=inner.serde)
+        self.inner = inner
+        self.channel = channel
+        self.snapshot_every = snapshot_every
+        self.cache_size = cache_size
+        # (thread_id, checkpoint_ns, checkpoint_id) -> (メッセージ一覧, _Position)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ---------- キャッシュ ----------
+
+    def _cache_get(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        return None
+
+    def _cache_put(self, key, messages, position):
+        with self._lock:
+            self._cache[key] = (messages, position)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ---------- 差分の作成と適用 ----------
+
+    @staticmethod
+    def _apply(base, delta):
+        removed = set(delta["removed"])
+        index = {m.id: i for i, m in enumerate(base)}
+        merged = list(base)
+        for m in delta["upserts"]:
+            if m.id in index:
+                merged[index[m.id]] = m
+            else:
+                index[m.id] = len(merged)
+                merged.append(m)
+        return [m for m in merged if m.id not in removed] if removed else merged
+
+    def _diff(self, base, messages):
+        """base から messages への差分。差分で表せない（並び替えなど）場合は None"""
+        # よくある「末尾に追加しただけ」の場合は、先頭が同じオブジェクトかどうかだけを見る
+        # （メッセージどうしの比較や、適用して確かめる処理を省く）
+        if len(messages) >= len(base) and all(a is b for a, b in zip(base, messages)):
+            added = messages[len(base):]
+            added_ids = {m.id for m in added}
+            if None not in added_ids and len(added_ids) == len(added) and added_ids.isdisjoint(m.id for m in base):
+                return {_DELTA: True, "upserts": added, "removed": []}
+        base_by_id = {m.id: m for m in base}
+        if None in base_by_id or any(m.id is None for m in messages):
+            return None
+        upserts = [m for m in messages if base_by_id.get(m.id) is not m and base_by_id.get(m.id) != m]
+        new_ids = {m.id for m in messages}
+        delta = {_DELTA: True, "upserts": upserts, "removed": [i for i in base_by_id if i not in new_ids]}
+        if [m.id for m in self._apply(base, delta)] != [m.id for m in messages]:
+            return None
+        return delta
+
+    def _materialize(self, thread_id, checkpoint_ns, checkpoint_id, value):
+        """保存された値（全体または差分）からメッセージ一覧と _Position を復元する"""
+        # キャッシュにあるか全体保存に着くまで差分をさかのぼり、古い順に適用する
+        chain = []
+        key = (thread_id, checkpoint_ns, checkpoint_id)
+        while (cached := self._cache_get(key)) is None:
+            if not (isinstance(value, dict) and value.get(_DELTA)):
+                cached = (value, _Position.snapshot(key[2]))
+                self._cache_put(key, *cached)
+                break
+            chain.append((key, value))
+            base_config = {"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": value["base"],
+            }}
+            base_tuple = self.inner.get_tuple(base_config)
+            if base_tuple is None:
+                raise ValueError(f"Base checkpoint {value['base']!r} of thread {thread_id!r} not found")
+            key = (thread_id, checkpoint_ns, value["base"])
+            value = base_tuple.checkpoint["channel_values"].get(self.channel, [])
+        messages, position = cached
+        for key, delta in reversed(chain):
+            messages = self._apply(messages, delta)
+            position = position.anchored(key[2]) if delta.get("anchor") else position.next()
+            self._cache_put(key, messages, position)
+        return messages, position
+
+    def _messages_at(self, thread_id, checkpoint_ns, checkpoint_id):
+        """チェックポイントのメッセージ一覧と _Position（キャッシュになければ読み込んで復元する）"""
+        key = (thread_id, checkpoint_ns, checkpoint_id)
+        if (cached := self._cache_get(key)) is not None:
+            return cached
+        config = {"configurable": {
+            "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id,
+        }}
+        tuple_ = self.inner.get_tuple(config)
+        if tuple_ is None or self.channel not in tuple_.checkpoint["channel_values"]:
+            return None
+        return self._materialize(thread_id, checkpoint_ns, checkpoint_id,
+                                 tuple_.checkpoint["channel_values"][self.channel])
+
+    def _encode(self, thread_id, checkpoint_ns, parent_id, checkpoint_id, messages):
+        """保存する値（全体または差分）と _Position を決める"""
+        parent = self._messages_at(thread_id, checkpoint_ns, parent_id)
+        if parent is not None:
+            base, position = parent
+            if position.since + 1 < self.snapshot_every:
+                # 親からの差分
+                delta = self._diff(base, messages)
+                if delta is not None:
+                    return {**delta, "base": parent_id}, position.next()
+            elif position.anchors + 1 < max(self.snapshot_every, len(messages) // self.snapshot_every):
+                # 区切りの差分（直前の区切りから。読み込み時は間の親からの差分を飛ばせる）
+                anchor = self._messages_at(thread_id, checkpoint_ns, position.anchor)
+                delta = None if anchor is None else self._diff(anchor[0], messages)
+                if delta is not None:
+                    return {**delta, "base": position.anchor, "anchor": True}, position.anchored(checkpoint_id)
+        return messages, _Position.snapshot(checkpoint_id)
+
+    def _restore(self, tuple_):
+        if tuple_ is None or self.channel not in tuple_.checkpoint["channel_values"]:
+            return tuple_
+        conf = tuple_.config["configurable"]
+        values = tuple_.checkpoint["channel_values"]
+        messages, _ = self._materialize(
+            conf["thread_id"], conf.get("checkpoint_ns", ""), conf["checkpoint_id"], values[self.channel],
+        )
+        checkpoint = {**tuple_.checkpoint, "channel_values": {**values, self.channel: messages}}
+        return tuple_._replace(checkpoint=checkpoint)
+
+    # ---------- BaseCheckpointSaver ----------
+
+    def get_tuple(self, config):
+        return self._restore(self.inner.get_tuple(config))
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        for tuple_ in self.inner.list(config, filter=filter, before=before, limit=limit):
+            yield self._restore(tuple_)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        conf = config["configurable"]
+        thread_id, checkpoint_ns = conf["thread_id"], conf.get("checkpoint_ns", "")
+        parent_id = conf.get("checkpoint_id")
+        values = checkpoint["channel_values"]
+        messages = values.get(self.channel)
+
+        stored, position = messages, _Position.snapshot(checkpoint["id"])
+        if self.channel in new_versions and messages is not None and parent_id:
+            # 再起動直後などキャッシュにない場合は、親チェックポイントを読み込んで復元する
+            stored, position = self._encode(thread_id, checkpoint_ns, parent_id, checkpoint["id"], messages)
+        elif messages is not None and parent_id:
+            # messages が変わっていなければ親と同じ（保存済みの値がそのまま参照される）
+            parent = self._cache_get((thread_id, checkpoint_ns, parent_id))
+            if parent is not None:
+                position = parent[1]
+
+        if messages is not None:
+            self._cache_put((thread_id, checkpoint_ns, checkpoint["id"]), messages, position)
+        if stored is not messages:
+            checkpoint = {**checkpoint, "channel_values": {**values, self.channel: stored}}
+        return self.inner.put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        return self.inner.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == thread_id]:
+                del self._cache[key]
+        return self.inner.delete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self.inner.get_next_version(current, channel)
+
+    # ---------- 非同期（同期版をスレッドで実行する） ----------
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
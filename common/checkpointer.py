@@ -0,0 +1,71 @@
+"""
+チェックポインターの切り替え
+
+引数 kind または環境変数 CHECKPOINTER で保存先を選びます。
+- memory（既定）: MemorySaver（プロセスのメモリ。再起動で消える）
+- sqlite: SqliteSaver（ファイル。再起動後も会話を再開できる）
+  保存先は環境変数 CHECKPOINT_DB（既定: checkpoints.sqlite）
+- bounded: BoundedMemorySaver（メモリ。LRU / TTL で古いスレッドを捨てる）
+  上限は環境変数 CHECKPOINT_MAX_THREADS / CHECKPOINT_MAX_BYTES / CHECKPOINT_TTL（秒） / CHECKPOINT_KEEP_LAST
+
+引数 delta または環境変数 CHECKPOINT_DELTA=1 で、messages を差分で保存する
+DeltaCheckpointSaver（common/checkpoint_delta.py）で包みます。
+
+    CHECKPOINTER=sqlite CHECKPOINT_DELTA=1 python3 chapter4/memory_saver.py
+
+引数 trace または環境変数 TRACE_FILE / TRACE_METRICS_PORT で、読み書きの時間をトレースに記録する
+TracedCheckpointer（common/tracing.py）で包みます。
+"""
+import os
+
+from langgraph.checkpoint.memory import MemorySaver
+
+
+def _create_sqlite(path=None, **opts):
+    from common.checkpoint_sqlite import SqliteSaver
+    return SqliteSaver(path or os.environ.get("CHECKPOINT_DB", "checkpoints.sqlite"), **opts)
+
+
+def _create_bounded(**opts):
+    from common.checkpoint_bounded import BoundedMemorySaver
+    for name, env, type_ in (
+        ("max_threads", "CHECKPOINT_MAX_THREADS", int),
+        ("max_bytes", "CHECKPOINT_MAX_BYTES", int),
+        ("ttl", "CHECKPOINT_TTL", float),
+        ("keep_last", "CHECKPOINT_KEEP_LAST", int),
+    ):
+        if name not in opts and os.environ.get(env):
+            opts[name] = type_(os.environ[env])
+    return BoundedMemorySaver(**opts)
+
+
+# 名前 -> (**opts) を受け取ってチェックポインターを返す関数
+_CHECKPOINTERS = {
+    "memory": lambda **opts: MemorySaver(**opts),
+    "sqlite": _create_sqlite,
+    "bounded": _create_bounded,
+}
+
+
+def create_checkpointer(kind=None, delta=None, trace=None, **opts):
+    """チェックポインターを生成する"""
+    kind = kind or os.environ.get("CHECKPOINTER", "memory")
+    if kind not in _CHECKPOINTERS:
+        raise ValueError(f"Unknown checkpointer: {kind!r} (available: {sorted(_CHECKPOINTERS)})")
+    checkpointer = _CHECKPOINTERS[kind](**opts)
+
+    if delta is None:
+        delta = os.environ.get("CHECKPOINT_DELTA", "").lower() in ("1", "true", "yes")
+    if delta:
+        if getattr(checkpointer, "keep_last", None) is not None:
+            # 差分は親チェックポイントを参照するため、古いチェックポイントを消すと復元できない
+            raise ValueError("CHECKPOINT_DELTA cannot be combined with keep_last")
+        from common.checkpoint_delta import DeltaCheckpointSaver
+        checkpointer = DeltaCheckpointSaver(checkpointer)
+
+    if trace is None:
+        trace = bool(os.environ.get("TRACE_FILE") or os.environ.get("TRACE_METRICS_PORT"))
+    if trace:
+        from common.tracing import TracedCheckpointer
+        checkpointer = TracedCheckpointer(checkpointer)
+    return checkpointer
@@ -0,0 +1,176 @@
+"""
+プロンプトをトークン予算内に収めるコンテキストウィンドウ
+
+チャットボットが毎ターン state["messages"] 全体をLLMに送ると、会話が長くなるほど
+プロンプトのトークン数（レイテンシ・コスト）が増えていきます。ContextWindow は
+LLMの手前に置くノードとして、予算を超えた古いターンを「要約」に畳み込みます。
+
+- トークン数は手元で高速に見積もる（estimate_tokens）
+- システムプロンプトと直近のターンは常に残す
+- 1ターン（ユーザー発話 → ツール呼び出し → ツール結果 → 応答）は分割しない
+- 要約は State の summary に保存し、予算を超えたときだけ差分を追加で要約する
+  （畳み込むときは予算の keep_ratio まで減らすので、毎ターン要約が走ることはない）
+- state["messages"] 自体は削除しない（会話履歴はチェックポイントに残る）
+
+例:
+    class State(TypedDict):
+        messages: Annotated[list, add_messages]
+        summary: str         # 古いターンの要約
+        summary_until: str   # 要約に含めた最後のメッセージのid
+
+    window = ContextWindow(max_tokens=4000)
+
+    def chatbot(state: State):
+        return {"messages": [llm.invoke(window.prompt(state))]}
+
+    builder.add_node("trim", async_node(window.trim, window.atrim))
+    builder.add_edge(START, "trim")
+    builder.add_edge("trim", "chatbot")
+"""
+import os
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+_SUMMARY_PROMPT = (
+    "あなたは会話の要約係です。これまでの要約と新しい会話から、今後の応答に必要な情報"
+    "（ユーザーの名前・好み・決まったこと・未解決の依頼など）を残した簡潔な要約を日本語で作成してください。"
+    "要約だけを出力してください。"
+)
+
+
+def estimate_tokens(text):
+    """文字列のトークン数のおおよその見積もり
+
+    英数字は約4文字で1トークン、日本語などのマルチバイト文字は1文字で約1トークンとして数えます。
+    トークナイザーを呼ばず、UTF-8のバイト数と文字数の差から求めるため高速です。
+    """
+    n = len(text)
+    wide = (len(text.encode("utf-8")) - n) // 2
+    return (n - wide) // 4 + wide + 1
+
+
+def _text(message):
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+
+
+def message_tokens(message):
+    """1メッセージのトークン数の見積もり（ロールなどのオーバーヘッドを含む）"""
+    tokens = 4 + estimate_tokens(_text(message))
+    for call in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(call["name"]) + estimate_tokens(str(call["args"]))
+    return tokens
+
+
+def split_turns(messages):
+    """ユーザー発話ごとにターンに分ける（ツール呼び出しと結果は同じターンに入る）"""
+    turns = []
+    for message in messages:
+        if message.type == "human" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+class ContextWindow:
+    """トークン予算を超えた古いターンを要約に畳み込む
+
+    Args:
+        max_tokens: プロンプトのトークン予算（省略時は環境変数 CONTEXT_MAX_TOKENS、既定 4000）
+        keep_ratio: 畳み込んだ後に残す直近ターンの割合（予算に対する比率）
+        summarizer: 要約に使うLLM（省略時は common.llm.llm）
+        max_summary_tokens: 要約の長さの上限（省略時は予算の1/4）
+    """
+
+    def __init__(self, max_tokens=None, keep_ratio=0.5, summarizer=None, max_summary_tokens=None):
+        self.max_tokens = max_tokens or int(os.environ.get("CONTEXT_MAX_TOKENS", "4000"))
+        self.keep_ratio = keep_ratio
+        self.summarizer = summarizer
+        self.max_summary_tokens = max_summary_tokens or self.max_tokens // 4
+
+    def _llm(self):
+        if self.summarizer is None:
+            from common.llm import llm
+            return llm
+        return self.summarizer
+
+    # ---------- プロンプトの組み立て ----------
+
+    @staticmethod
+    def _split(state):
+        """(先頭のシステムプロンプト, 要約済みより後のメッセージ) に分ける"""
+        messages = state["messages"]
+        n_system = 0
+        while n_system < len(messages) and messages[n_system].type == "system":
+            n_system += 1
+        start = n_system
+        if until := state.get("summary_until"):
+            # 直近のメッセージから探す（要約済みの位置は通常、末尾に近い）
+            for i in range(len(messages) - 1, n_system - 1, -1):
+                if messages[i].id == until:
+                    start = i + 1
+                    break
+        return messages[:n_system], messages[start:]
+
+    def prompt(self, state):
+        """LLMに送るメッセージ（システムプロンプト + 要約 + 要約されていないターン）"""
+        system, rest = self._split(state)
+        summary = state.get("summary")
+        if not summary:
+            return [*system, *rest]
+        # Gemini などシステムメッセージを先頭に1つしか置けないモデルがあるため1つにまとめる
+        parts = [_text(m) for m in system] + [f"これまでの会話の要約:\n{summary}"]
+        return [SystemMessage(content="\n\n".join(parts)), *rest]
+
+    # ---------- 畳み込み ----------
+
+    def _plan(self, state):
+        """予算を超えていれば畳み込むターンを返す（超えていなければ None）"""
+        system, rest = self._split(state)
+        fixed = sum(message_tokens(m) for m in system) + estimate_tokens(state.get("summary") or "")
+        budget = self.max_tokens - fixed
+        if sum(message_tokens(m) for m in rest) <= budget:
+            return None
+        turns = split_turns(rest)
+        target = budget * self.keep_ratio
+        kept, used = 0, 0
+        for turn in reversed(turns):
+            tokens = sum(message_tokens(m) for m in turn)
+            # 最新のターンは予算を超えていても残す
+            if kept and used + tokens > target:
+                break
+            kept += 1
+            used += tokens
+        folded = [m for turn in turns[:len(turns) - kept] for m in turn]
+        return folded or None
+
+    def _summary_request(self, summary, folded):
+        lines = [f"{m.type}: {_text(m)}" for m in folded if _text(m)]
+        body = f"これまでの要約:\n{summary or '（なし）'}\n\n新しい会話:\n" + "\n".join(lines)
+        return [SystemMessage(content=_SUMMARY_PROMPT), HumanMessage(content=body)]
+
+    def _update(self, folded, response):
+        text = _text(response)
+        if estimate_tokens(text) > self.max_summary_tokens:
+            # 長すぎる要約は末尾（新しい内容）を優先して切り詰める
+            while text and estimate_tokens(text) > self.max_summary_tokens:
+                text = text[len(text) // 10 + 1:]
+        return {"summary": text, "summary_until": folded[-1].id}
+
+    def trim(self, state):
+        """予算を超えていれば古いターンを要約に畳み込むノード"""
+        folded = self._plan(state)
+        if folded is None:
+            return {}
+        response = self._llm().invoke(self._summary_request(state.get("summary"), folded))
+        return self._update(folded, response)
+
+    async def atrim(self, state):
+        """trim の非同期版"""
+        folded = self._plan(state)
+        if folded is None:
+            return {}
+        response = await self._llm().ainvoke(self._summary_request(state.get("summary"), folded))
+        return self._update(folded, response)
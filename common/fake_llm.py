@@ -0,0 +1,407 @@
+"""
+オフライン用のフェイクチャットモデル
+
+ネットワークなしでグラフを動かすための決定的なLLMの代役です。
+
+- bind_tools() に対応し、ルールベース（または応答関数・スクリプト）で tool_calls を返す
+- 初回トークンまでの時間（ttft）とトークンごとの遅延を再現する（ばらつきと、まれに極端に遅い呼び出しも）
+- 指定した確率で例外を発生させる（障害注入）
+- 1秒あたりのリクエスト数の上限を超えた呼び出しに 429 を返す（プロバイダのクォータの再現）
+
+使い方:
+    LLM_BACKEND=fake python3 chapter3/multi_tools.py
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_]+|\s+|.", re.DOTALL)
+
+
+class FakeLLMError(Exception):
+    """障害注入で発生する例外（status_code で種類を区別できる）"""
+
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def tokenize(text):
+    """簡易トークナイザ（英数字の連続は1トークン、それ以外は1文字1トークン）"""
+    return _TOKEN_RE.findall(text)
+
+
+def message_text(message):
+    """メッセージ本文を文字列として取り出す"""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part if isinstance(part, str) else part.get("text", "")
+        for part in content
+    )
+
+
+# ========================================
+# ルールベースの応答
+# ========================================
+
+def _numbers(text):
+    return [int(n) for n in re.findall(r"-?\d+", text)]
+
+
+def _two_numbers(pattern):
+    def rule(text):
+        nums = _numbers(text)
+        if re.search(pattern, text) and len(nums) >= 2:
+            return {"a": nums[0], "b": nums[1]}
+        return None
+    return rule
+
+
+def _rule_search_weather(text):
+    match = re.search(r"([^\s、。の]+)の天気", text)
+    if match:
+        return {"city": match.group(1)}
+    return None
+
+
+def _rule_get_current_time(text):
+    if re.search(r"何時|時刻|今の時間|日時", text):
+        return {}
+    return None
+
+
+def _rule_send_email(text):
+    if not re.search(r"メール", text):
+        return None
+    to = re.search(r"[A-Za-z0-9_.+-]+@[A-Za-z0-9-]+\.[A-Za-z0-9.]+", text)
+    subject = re.search(r"「(.+?)」", text)
+    return {
+        "to": to.group(0) if to else "unknown@example.com",
+        "subject": subject.group(1) if subject else "（件名なし）",
+        "body": text,
+    }
+
+
+def _rule_delete_file(text):
+    if not re.search(r"削除|消して", text):
+        return None
+    filename = re.search(r"[A-Za-z0-9_\-]+\.[A-Za-z0-9]+", text)
+    return {"filename": filename.group(0) if filename else "unknown.txt"}
+
+
+def _rule_get_info(text):
+    if re.search(r"調べ|検索|情報", text):
+        return {"query": text}
+    return None
+
+
+# ツール名 -> 引数を返す関数（該当しなければNone）
+DEFAULT_RULES = {
+    "add": _two_numbers(r"足|たす|プラス|\+"),
+    "multiply": _two_numbers(r"かけ|掛け|×|\*"),
+    "divide": _two_numbers(r"割|÷|/"),
+    "search_weather": _rule_search_weather,
+    "get_current_time": _rule_get_current_time,
+    "send_email": _rule_send_email,
+    "delete_file": _rule_delete_file,
+    "get_info": _rule_get_info,
+}
+
+
+def make_tool_call(name, args):
+    """AIMessage.tool_calls の要素を1つ作る"""
+    return {"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+
+
+def rule_based_responder(messages, tools, rules=None):
+    """会話履歴とバインド済みツールから決定的に応答を作る
+
+    - 最後がユーザー発話で、ルールに合うツールがあれば tool_calls を返す
+    - 最後がツール結果なら、結果をまとめたテキストを返す
+    - それ以外は簡単なテキスト応答を返す
+    """
+    rules = DEFAULT_RULES if rules is None else rules
+    tool_names = [t["function"]["name"] for t in tools or []]
+
+    last_human = next((m for m in reversed(messages) if isinstance(m, HumanMessage)), None)
+    text = message_text(last_human) if last_human is not None else ""
+
+    if messages and isinstance(messages[-1], ToolMessage):
+        results = []
+        for m in reversed(messages):
+            if not isinstance(m, ToolMessage):
+                break
+            results.append(message_text(m))
+        results.reverse()
+        # 「〜の結果に3をかけた」のような連鎖計算
+        chain = re.search(r"結果に(\d+)を(?:かけ|掛け)", text)
+        if chain and "multiply" in tool_names and len(results) == 1:
+            done = sum(1 for m in messages[messages.index(last_human):] if isinstance(m, ToolMessage))
+            if done == 1 and re.fullmatch(r"-?\d+", results[0].strip()):
+                args = {"a": int(results[0]), "b": int(chain.group(1))}
+                return AIMessage(content="", tool_calls=[make_tool_call("multiply", args)])
+        return AIMessage(content="ツールの実行結果: " + "、".join(results))
+
+    tool_calls = []
+    for name in tool_names:
+        rule = rules.get(name)
+        args = rule(text) if rule else None
+        if args is not None:
+            tool_calls.append(make_tool_call(name, args))
+    if tool_calls:
+        return AIMessage(content="", tool_calls=tool_calls)
+
+    # 会話履歴を使った応答（Chapter 4 の記憶の確認用）
+    if re.search(r"名前を覚えて", text):
+        for m in messages:
+            if isinstance(m, HumanMessage):
+                name = re.search(r"私の名前は(.+?)です", message_text(m))
+                if name:
+                    return AIMessage(content=f"はい、あなたの名前は{name.group(1)}さんです。")
+        return AIMessage(content="すみません、まだお名前を伺っていません。")
+
+    return AIMessage(content=f"「{text}」について、フェイクモデルが応答します。")
+
+
+def tool_loop_responder(depth, name, args):
+    """ユーザー発話ごとに depth 回ツールを呼んでから回答する応答関数（ベンチマーク用）"""
+    def respond(messages, tools):
+        done = 0
+        for m in reversed(messages):
+            if isinstance(m, HumanMessage):
+                break
+            if isinstance(m, ToolMessage):
+                done += 1
+        if done < depth:
+            return AIMessage(content="", tool_calls=[make_tool_call(name, dict(args))])
+        return AIMessage(content=f"{done}回のツール呼び出しが完了しました。")
+    return respond
+
+
+# ========================================
+# フェイクチャットモデル
+# ========================================
+
+class FakeChatModel(BaseChatModel):
+    """決定的に応答するオフライン用チャットモデル
+
+    Attributes:
+        responder: (messages, tools) -> AIMessage を返す関数。省略時はルールベース
+        script: 応答のリスト（AIMessage または文字列）。指定すると先頭から順に返す
+        ttft: 初回トークンまでの遅延（秒）
+        per_token_latency: 1トークンあたりの遅延（秒）
+        per_input_token_latency: 入力1トークンあたりの処理時間（秒）。初回トークンまでの遅延に加わる
+            （キャッシュ済みのプレフィックスの分は加わらない）
+        ttft_jitter: 初回トークンまでの遅延のばらつき（対数正規分布の sigma。遅延に exp(N(0, sigma)) をかける）
+        slow_rate: 初回トークンまでの遅延に slow_latency が加わる呼び出しの確率（裾のレイテンシの再現）
+        slow_latency: 遅い呼び出しに加わる遅延（秒）
+        failure_rate: 例外を発生させる確率（0.0〜1.0）
+        failure_status: 発生させる例外の status_code（429でレート制限を再現）
+        rate_limit: 1秒あたりに受け付けるリクエスト数（超えた呼び出しはすぐに status_code=429 で失敗する）
+        seed: 乱数シード（障害注入の再現用）
+    """
+
+    model: str = "fake"
+    responder: Optional[Callable[..., Any]] = None
+    script: Optional[list] = None
+    ttft: float = 0.0
+    per_token_latency: float = 0.0
+    per_input_token_latency: float = 0.0
+    ttft_jitter: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 0.0
+    failure_rate: float = 0.0
+    failure_status: int = 500
+    rate_limit: Optional[float] = None
+    seed: Optional[int] = None
+
+    _rng: random.Random = PrivateAttr()
+    _script_index: int = PrivateAttr(default=0)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    # キャッシュ名 -> (プレフィックスのメッセージ, ツール, トークン数)
+    _cached_contents: dict = PrivateAttr(default_factory=dict)
+    # rate_limit のトークンバケット（残量, 最後に補充した時刻）
+    _quota: tuple = PrivateAttr(default=None)
+
+    def model_post_init(self, __context):
+        super().model_post_init(__context)
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self):
+        return {"model": self.model}
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        formatted = [convert_to_openai_tool(t) for t in tools]
+        return self.bind(tools=formatted, **kwargs)
+
+    def create_cached_content(self, messages, tools=None, ttl=None):
+        """プロバイダのコンテキストキャッシュの代わりにプレフィックスを登録し、キャッシュ名を返す
+
+        以降 cached_content=キャッシュ名 を指定した呼び出しでは、登録したメッセージが先頭にあり
+        ツールがバインドされているものとして応答します（ttl は無視します）。
+        """
+        formatted = [convert_to_openai_tool(t) for t in tools or []]
+        tokens = self._count_tokens(messages, formatted)
+        name = f"cachedContents/fake-{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self._cached_contents[name] = (list(messages), formatted, tokens)
+        return name
+
+    # ---------- 応答の組み立て ----------
+
+    def _respond(self, messages, tools):
+        if self.script:
+            with self._lock:
+                item = self.script[self._script_index % len(self.script)]
+                self._script_index += 1
+            return AIMessage(content=item) if isinstance(item, str) else item.model_copy()
+        if self.responder is not None:
+            return self.responder(messages, tools)
+        return rule_based_responder(messages, tools)
+
+    def _pieces(self, message):
+        """ストリーミングで送る単位（本文トークン + tool_callの引数断片）"""
+        pieces = [("text", tok) for tok in tokenize(message_text(message))]
+        for index, tc in enumerate(message.tool_calls):
+            args = json.dumps(tc["args"], ensure_ascii=False)
+            fragments = [args[i:i + 4] for i in range(0, len(args), 4)] or [""]
+            for n, fragment in enumerate(fragments):
+                pieces.append(("tool", (index, tc if n == 0 else None, fragment)))
+        return pieces
+
+    @staticmethod
+    def _count_tokens(messages, tools):
+        tokens = sum(len(tokenize(message_text(m))) for m in messages)
+        if tools:
+            tokens += len(tokenize(json.dumps(tools, ensure_ascii=False)))
+        return tokens
+
+    def _check_quota(self):
+        """rate_limit を超えていれば 429 で失敗させる（1秒分までのバーストは受け付ける）"""
+        if not self.rate_limit:
+            return
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._quota or (self.rate_limit, now)
+            tokens = min(self.rate_limit, tokens + (now - last) * self.rate_limit)
+            if tokens < 1:
+                self._quota = (tokens, now)
+                raise FakeLLMError(f"quota exceeded ({self.rate_limit:g} requests/s)", 429)
+            self._quota = (tokens - 1, now)
+
+    def _start(self, messages, kwargs):
+        """応答・送信単位・使用量・初回トークンまでの遅延を用意する"""
+        self._check_quota()
+        tools, cached = kwargs.get("tools"), 0
+        if name := kwargs.get("cached_content"):
+            if name not in self._cached_contents:
+                raise FakeLLMError(f"cached content {name!r} not found", 404)
+            prefix, tools, cached = self._cached_contents[name]
+            messages = prefix + list(messages)
+        else:
+            prefix = []
+        message = self._respond(messages, tools)
+        pieces = self._pieces(message)
+        input_tokens = cached + self._count_tokens(messages[len(prefix):], None if cached else tools)
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": len(pieces),
+            "total_tokens": input_tokens + len(pieces),
+        }
+        if cached:
+            usage["input_token_details"] = {"cache_read": cached}
+        delay = self.ttft + self.per_input_token_latency * (input_tokens - cached)
+        if self.ttft_jitter:
+            delay *= self._rng.lognormvariate(0.0, self.ttft_jitter)
+        if self.slow_rate and self._rng.random() < self.slow_rate:
+            delay += self.slow_latency
+        return message, pieces, usage, delay
+
+    def _maybe_fail(self):
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise FakeLLMError(f"injected failure (status={self.failure_status})", self.failure_status)
+
+    def _chunk(self, piece):
+        kind, value = piece
+        if kind == "text":
+            return AIMessageChunk(content=value)
+        index, tc, fragment = value
+        return AIMessageChunk(
+            content="",
+            tool_call_chunks=[{
+                "name": tc["name"] if tc else None,
+                "args": fragment,
+                "id": tc["id"] if tc else None,
+                "index": index,
+                "type": "tool_call_chunk",
+            }],
+        )
+
+    # ---------- 同期 ----------
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message, pieces, usage, delay = self._start(messages, kwargs)
+        time.sleep(delay)
+        self._maybe_fail()
+        time.sleep(self.per_token_latency * len(pieces))
+        message.usage_metadata = usage
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        message, pieces, usage, delay = self._start(messages, kwargs)
+        time.sleep(delay)
+        self._maybe_fail()
+        # 時刻を基準に送る（sleep の誤差が積み重なって invoke より遅くならないように）
+        deadline = time.monotonic()
+        for piece in pieces:
+            deadline += self.per_token_latency
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            chunk = ChatGenerationChunk(message=self._chunk(piece))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", usage_metadata=usage))
+
+    # ---------- 非同期 ----------
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message, pieces, usage, delay = self._start(messages, kwargs)
+        await asyncio.sleep(delay)
+        self._maybe_fail()
+        await asyncio.sleep(self.per_token_latency * len(pieces))
+        message.usage_metadata = usage
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        message, pieces, usage, delay = self._start(messages, kwargs)
+        await asyncio.sleep(delay)
+        self._maybe_fail()
+        deadline = time.monotonic()
+        for piece in pieces:
+            deadline += self.per_token_latency
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+            chunk = ChatGenerationChunk(message=self._chunk(piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", usage_metadata=usage))
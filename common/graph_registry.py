@@ -0,0 +1,207 @@
+"""
+コンパイル済みグラフのレジストリ
+
+各チャプターのスクリプトは import 時に StateGraph を組み立てて compile します。サーバー・バッチランナー・
+可視化などがそれぞれスクリプトを読み込み直したり、同じ builder を compile し直したりすると、
+そのたびに組み立てとコンパイルが繰り返されます。GraphRegistry は
+
+- 名前ごとにスクリプトを1度だけ読み込む（モジュールはプロセスで共有する）
+- コンパイル済みのグラフを (名前, チェックポインター, interrupt_before, interrupt_after) ごとにキャッシュする
+- スクリプトが compile したグラフは、その設定のグラフとしてそのまま使う（同じ設定で compile し直さない）
+- warm_up() で、サーバーがリクエストを受ける前に読み込み・コンパイル・LLMの生成
+  （sample を指定すれば1回の実行も。承認の interrupt は残したまま）を済ませる
+
+チェックポインターの指定:
+- 省略: スクリプトと同じ（スクリプトのグラフをそのまま返す）
+- None: チェックポインターなし
+- "memory" / "sqlite" / "bounded": create_checkpointer(kind) で作る（グラフの名前ごとに1つ）
+- インスタンス: そのチェックポインターを使う
+
+例:
+    from common.graph_registry import registry
+
+    agent = registry.get("multi_tools")                         # chapter3/multi_tools.py の agent
+    agent = registry.get("memory", checkpointer="sqlite")       # SQLite 付きで1度だけ compile する
+    agent = registry.get("human_in_loop", interrupt_before=())  # 承認なしで実行する版
+    registry.warm_up(sample="こんにちは")
+"""
+import importlib.util
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# 名前 -> (スクリプト, StateGraph の変数名, コンパイル済みグラフの変数名)
+CHAPTER_GRAPHS = {
+    "chat": ("chapter2/simple_chat.py", "graph_builder", "graph"),
+    "multi_tools": ("chapter3/multi_tools.py", "builder", "agent"),
+    "memory": ("chapter4/memory_saver.py", "builder", "agent_with_memory"),
+    "human_in_loop": ("chapter5/human_in_loop.py", "builder", "agent"),
+}
+
+_DEFAULT = object()
+_module_lock = threading.Lock()
+
+
+def load_module(path):
+    """スクリプトをモジュールとして1度だけ読み込む（2回目以降は同じモジュールを返す）
+
+    モジュール名はリポジトリからの相対パスから作ります（"chapter3/multi_tools.py" -> "chapter3_multi_tools"）。
+    """
+    path = Path(path)
+    if not path.is_absolute():
+        path = ROOT / path
+    try:
+        relpath = path.resolve().relative_to(ROOT.resolve()).as_posix()
+    except ValueError:
+        relpath = path.name
+    name = relpath.replace("/", "_").removesuffix(".py")
+    with _module_lock:
+        if name in sys.modules:
+            return sys.modules[name]
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[name]
+            raise
+        return module
+
+
+def _nodes(value):
+    """interrupt_before / interrupt_after をキーにできる形にする（"*" はそのまま）"""
+    if value is None or value == "*":
+        return value or ()
+    return tuple(value)
+
+
+def _compile_nodes(value):
+    """interrupt_before / interrupt_after を compile() に渡す形（リスト / "*" / None）にする"""
+    value = _nodes(value)
+    if value == "*":
+        return value
+    return list(value) or None
+
+
+class GraphRegistry:
+    """名前でコンパイル済みのグラフを返すレジストリ"""
+
+    def __init__(self, graphs=None):
+        self._specs = dict(CHAPTER_GRAPHS if graphs is None else graphs)
+        self._modules = {}
+        self._graphs = {}
+        self._checkpointers = {}
+        self._lock = threading.RLock()
+        self._stats = {"loads": 0, "compiles": 0, "hits": 0, "load_seconds": 0.0, "compile_seconds": 0.0}
+
+    def register(self, name, path, builder="builder", graph="agent"):
+        """グラフを追加する（path はスクリプト、builder / graph はその中の変数名）"""
+        with self._lock:
+            self._specs[name] = (path, builder, graph)
+
+    def names(self):
+        return sorted(self._specs)
+
+    def _module(self, name):
+        """スクリプトを読み込み、スクリプトが compile したグラフをその設定のキーで登録する"""
+        module = self._modules.get(name)
+        if module is not None:
+            return module
+        if name not in self._specs:
+            raise KeyError(f"unknown graph: {name!r} (available: {self.names()})")
+        path, _, attr = self._specs[name]
+        t0 = time.perf_counter()
+        module = load_module(path)
+        graph = getattr(module, attr)
+        self._stats["loads"] += 1
+        self._stats["load_seconds"] += time.perf_counter() - t0
+        self._graphs[self._key(name, graph.checkpointer, graph.interrupt_before_nodes,
+                               graph.interrupt_after_nodes)] = graph
+        self._modules[name] = module
+        return module
+
+    @staticmethod
+    def _key(name, checkpointer, interrupt_before, interrupt_after):
+        return (name, None if checkpointer is None else id(checkpointer),
+                _nodes(interrupt_before), _nodes(interrupt_after))
+
+    def _checkpointer(self, name, value):
+        if not isinstance(value, str):
+            return value
+        key = (name, value)
+        if key not in self._checkpointers:
+            from common.checkpointer import create_checkpointer
+            self._checkpointers[key] = create_checkpointer(value)
+        return self._checkpointers[key]
+
+    def get(self, name, checkpointer=_DEFAULT, interrupt_before=_DEFAULT, interrupt_after=_DEFAULT):
+        """コンパイル済みのグラフを返す（省略した設定はスクリプトと同じ）"""
+        with self._lock:
+            module = self._module(name)
+            path, builder_attr, graph_attr = self._specs[name]
+            default = getattr(module, graph_attr)
+            checkpointer = default.checkpointer if checkpointer is _DEFAULT else self._checkpointer(name, checkpointer)
+            if interrupt_before is _DEFAULT:
+                interrupt_before = default.interrupt_before_nodes
+            if interrupt_after is _DEFAULT:
+                interrupt_after = default.interrupt_after_nodes
+            key = self._key(name, checkpointer, interrupt_before, interrupt_after)
+            graph = self._graphs.get(key)
+            if graph is not None:
+                self._stats["hits"] += 1
+                return graph
+            t0 = time.perf_counter()
+            graph = getattr(module, builder_attr).compile(
+                checkpointer=checkpointer,
+                interrupt_before=_compile_nodes(interrupt_before),
+                interrupt_after=_compile_nodes(interrupt_after),
+            )
+            self._stats["compiles"] += 1
+            self._stats["compile_seconds"] += time.perf_counter() - t0
+            self._graphs[key] = graph
+            return graph
+
+    def warm_up(self, names=None, sample=None, **opts):
+        """グラフの読み込み・コンパイルと、LLMの生成を済ませる。かかった秒数を返す
+
+        sample（ユーザーの発話）を指定すると、各グラフを1回ずつ実行し、初回の呼び出しでしか起きない処理
+        （プロンプトキャッシュの登録など）も済ませます。interrupt_before / interrupt_after はそのまま
+        なので、承認が必要なツールは実行されません（その手前で止まります）。
+        会話の状態は使い捨てのチェックポインターに書くので残りませんが、LLMは呼び出されます。
+        """
+        from langgraph.checkpoint.memory import MemorySaver
+
+        from common.llm import default_llm
+
+        t0 = time.perf_counter()
+        for name in names or self.names():
+            self.get(name, **opts)
+        model = default_llm()
+        if hasattr(model, "models"):
+            # モデルのルーティング（MODEL_ROUTER）では tier ごとのモデルも作っておく
+            model.models()
+        if sample is not None:
+            for name in names or self.names():
+                graph = self.get(name, **opts)
+                # interrupt にはチェックポインターが要るので、使い捨てのものでコンパイルする（キャッシュしない）
+                with self._lock:
+                    builder = getattr(self._module(name), self._specs[name][1])
+                graph = builder.compile(
+                    checkpointer=MemorySaver(),
+                    interrupt_before=_compile_nodes(graph.interrupt_before_nodes),
+                    interrupt_after=_compile_nodes(graph.interrupt_after_nodes),
+                )
+                graph.invoke({"messages": [("user", sample)]}, {"configurable": {"thread_id": "warm-up"}})
+        return time.perf_counter() - t0
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "graphs": len(self._graphs)}
+
+
+# 共有のレジストリ（各チャプターのグラフを登録済み）
+registry = GraphRegistry()
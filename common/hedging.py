@@ -0,0 +1,345 @@
+"""
+LLM呼び出しのヘッジ（裾のレイテンシを短くする）
+
+chatbot ノードのレイテンシの p99 は、まれに最初のトークンが極端に遅い呼び出し（プロバイダ側の混雑など）で決まります。
+HedgedChatModel は get_llm のモデルを包み、最初のトークンがしきい値までに届かなければ同じリクエストをもう1つ送り、
+先に最初のトークンを返した方を使って、もう一方を取り消します。
+
+- しきい値: 最近の呼び出しの初回トークンまでの時間（TTFT）の percentile パーセンタイル（既定 p95）。
+  直近 window 件から求め、min_samples 件たまるまではヘッジしない。ヘッジで負けた呼び出しは、
+  負けた時点までの時間を記録する（実際の TTFT はそれより長いので、遅い呼び出しが履歴から消えない）
+- 予算（HedgeBudget）: リクエスト1件ごとに ratio（既定 0.05）ずつ貯まり、ヘッジ1回で1使う。
+  ヘッジで増えるリクエストは全体の ratio 倍（+ burst 件）まで。予算はプロセス全体で共有する
+- 最初のトークンより前に失敗した呼び出しは、もう一方が実行中ならそちらを待つ（失敗の再試行はしない）
+- 非同期実行では負けた呼び出しをキャンセルする。同期実行では呼び出しを別スレッドで受け取り、
+  負けた方は次のチャンクが届いた時点で打ち切る（待っている最中の呼び出しは中断できない）
+- 呼び出しはストリーミングで行い、invoke でもチャンクをまとめて返す
+- 同じリクエストを2回送るので、その分の料金がかかる
+
+環境変数:
+    HEDGE=1: get_llm のモデルに適用する
+    HEDGE_PERCENTILE: しきい値のパーセンタイル（既定 95）
+    HEDGE_BUDGET: ヘッジで増えるリクエストの割合の上限（既定 0.05）
+
+    HEDGE=1 LLM_BACKEND=fake FAKE_LLM_TTFT=0.2 FAKE_LLM_SLOW_RATE=0.02 FAKE_LLM_SLOW_LATENCY=2 \\
+        python3 chapter2/simple_chat.py
+"""
+import asyncio
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from langchain_core.language_models.chat_models import (
+    BaseChatModel,
+    agenerate_from_stream,
+    generate_from_stream,
+)
+from pydantic import PrivateAttr
+
+
+class LatencyWindow:
+    """直近 size 件の値（秒）のパーセンタイル"""
+
+    def __init__(self, size=200):
+        self._values = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._values.append(seconds)
+
+    def __len__(self):
+        return len(self._values)
+
+    def percentile(self, p):
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class HedgeBudget:
+    """ヘッジで増えるリクエストの上限（リクエストごとに ratio 貯まり、ヘッジ1回で1使う）
+
+    Args:
+        ratio: ヘッジで増えるリクエストの割合の上限
+        burst: 貯められる上限（一度にヘッジできる回数）
+    """
+
+    def __init__(self, ratio=0.05, burst=10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "hedges": 0, "denied": 0}
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+            self._stats["requests"] += 1
+
+    def withdraw(self):
+        """ヘッジしてよければ True（予算を1使う）"""
+        with self._lock:
+            if self._tokens < 1.0:
+                self._stats["denied"] += 1
+                return False
+            self._tokens -= 1.0
+            self._stats["hedges"] += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["extra_ratio"] = stats["hedges"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+
+class HedgedChatModel(BaseChatModel):
+    """最初のトークンが遅い呼び出しをヘッジするチャットモデルのラッパー
+
+    Attributes:
+        inner: 実際に応答を生成するチャットモデル
+        percentile: しきい値にする TTFT のパーセンタイル
+        min_samples: ヘッジを始めるのに必要な TTFT の件数
+        min_delay: しきい値の下限（秒）
+        window: TTFT の履歴（LatencyWindow）
+        budget: ヘッジの予算（HedgeBudget。省略時はプロセス全体で共有するもの）
+    """
+
+    inner: BaseChatModel
+    percentile: float = 95.0
+    min_samples: int = 20
+    min_delay: float = 0.0
+    window: Any = None
+    budget: Any = None
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stats: dict = PrivateAttr(default_factory=lambda: dict.fromkeys(
+        ("requests", "hedged", "hedge_wins", "primary_wins"), 0,
+    ))
+
+    def model_post_init(self, __context):
+        super().model_post_init(__context)
+        if self.window is None:
+            self.window = LatencyWindow()
+        if self.budget is None:
+            self.budget = shared_budget()
+
+    @property
+    def _llm_type(self):
+        return f"hedged-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self):
+        return self.inner._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        # ツールの変換は包んでいるモデルに任せ、変換結果をこのモデルにバインドする
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def threshold(self):
+        """ヘッジするまでの待ち時間（秒）。履歴が足りなければ None"""
+        if len(self.window) < self.min_samples:
+            return None
+        return max(self.min_delay, self.window.percentile(self.percentile))
+
+    def stats(self):
+        """ヘッジした回数・ヘッジが勝った回数と、しきい値・予算の状態"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_rate"] = stats["hedged"] / stats["requests"] if stats["requests"] else 0.0
+        threshold = self.threshold()
+        stats["threshold_ms"] = None if threshold is None else threshold * 1000
+        stats["budget"] = self.budget.stats()
+        return stats
+
+    def _start(self):
+        """リクエストの開始: 予算を貯め、しきい値を返す"""
+        self.budget.deposit()
+        with self._lock:
+            self._stats["requests"] += 1
+        return self.threshold()
+
+    def _hedge(self):
+        if not self.budget.withdraw():
+            return False
+        with self._lock:
+            self._stats["hedged"] += 1
+        return True
+
+    def _won(self, winner, started, now):
+        """最初のトークンが届いた: TTFT を記録する（ヘッジが勝ったら、最初の呼び出しはその時点までの時間）"""
+        self.window.add(now - started[0])
+        if len(started) == 1:
+            return
+        with self._lock:
+            self._stats["hedge_wins" if winner else "primary_wins"] += 1
+
+    # ---------- 同期 ----------
+
+    def _race(self, messages, stop, kwargs):
+        """先に最初のチャンクを返した呼び出しのチャンクを順に返す"""
+        threshold = self._start()
+        events = queue.Queue()
+        cancelled = []
+        started = []
+
+        def run(attempt, cancel):
+            try:
+                for chunk in self.inner._stream(messages, stop=stop, **kwargs):
+                    if cancel.is_set():
+                        return
+                    events.put((attempt, "chunk", chunk))
+                events.put((attempt, "done", None))
+            except Exception as e:
+                events.put((attempt, "error", e))
+
+        def launch():
+            cancel = threading.Event()
+            cancelled.append(cancel)
+            started.append(time.perf_counter())
+            # contextvars（実行中の config など）を引き継ぐ
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(run, len(started) - 1, cancel), daemon=True).start()
+
+        launch()
+        winner, failed = None, set()
+        try:
+            while winner is None:
+                timeout = None
+                if threshold is not None and len(started) == 1:
+                    timeout = max(0.0, started[0] + threshold - time.perf_counter())
+                try:
+                    attempt, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    if self._hedge():
+                        launch()
+                    else:
+                        threshold = None
+                    continue
+                if kind == "error":
+                    failed.add(attempt)
+                    if len(failed) == len(started):
+                        raise value
+                    continue
+                winner = attempt
+                self._won(winner, started, time.perf_counter())
+                if kind == "done":
+                    return
+                yield value
+            while True:
+                attempt, kind, value = events.get()
+                if attempt != winner:
+                    continue
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    return
+                yield value
+        finally:
+            for cancel in cancelled:
+                cancel.set()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return generate_from_stream(self._race(messages, stop, kwargs))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        yield from self._race(messages, stop, kwargs)
+
+    # ---------- 非同期 ----------
+
+    async def _arace(self, messages, stop, kwargs):
+        threshold = self._start()
+        events = asyncio.Queue()
+        tasks = []
+        started = []
+
+        async def run(attempt):
+            try:
+                async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+                    await events.put((attempt, "chunk", chunk))
+                await events.put((attempt, "done", None))
+            except Exception as e:
+                await events.put((attempt, "error", e))
+
+        def launch():
+            started.append(time.perf_counter())
+            tasks.append(asyncio.ensure_future(run(len(started) - 1)))
+
+        launch()
+        winner, failed, getter = None, set(), None
+        try:
+            while winner is None:
+                timeout = None
+                if threshold is not None and len(started) == 1:
+                    timeout = max(0.0, started[0] + threshold - time.perf_counter())
+                # 待ち時間が過ぎても取り出し中の get は取り消さない（届いたチャンクを失わないように）
+                getter = getter or asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait({getter}, timeout=timeout)
+                if not done:
+                    if self._hedge():
+                        launch()
+                    else:
+                        threshold = None
+                    continue
+                (attempt, kind, value), getter = getter.result(), None
+                if kind == "error":
+                    failed.add(attempt)
+                    if len(failed) == len(started):
+                        raise value
+                    continue
+                winner = attempt
+                self._won(winner, started, time.perf_counter())
+                # 負けた呼び出しはすぐに取り消す
+                for i, task in enumerate(tasks):
+                    if i != winner:
+                        task.cancel()
+                if kind == "done":
+                    return
+                yield value
+            while True:
+                attempt, kind, value = await events.get()
+                if attempt != winner:
+                    continue
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    return
+                yield value
+        finally:
+            for task in tasks + ([getter] if getter else []):
+                task.cancel()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await agenerate_from_stream(self._arace(messages, stop, kwargs))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async for chunk in self._arace(messages, stop, kwargs):
+            yield chunk
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def shared_budget():
+    """プロセス全体で共有するヘッジの予算（環境変数 HEDGE_BUDGET、既定 0.05）"""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = HedgeBudget(ratio=float(os.environ.get("HEDGE_BUDGET", "0.05")))
+        return _budget
+
+
+def create_hedged_model(model):
+    """環境変数の設定で model を HedgedChatModel で包む
+
+    - HEDGE_PERCENTILE: しきい値のパーセンタイル（既定 95）
+    """
+    return HedgedChatModel(inner=model, percentile=float(os.environ.get("HEDGE_PERCENTILE", "95")))
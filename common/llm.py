@@ -1,6 +1,221 @@
+"""
+共有LLMファクトリ
+
+- get_llm(model=..., **opts): 初回呼び出し時にLLMを生成し、(model, opts)ごとにキャッシュする
+- llm: 従来どおり `from common.llm import llm` で使える遅延プロキシ（実体は default_llm()）
+- resolve(model): 遅延プロキシなら実体を返す（プロバイダ固有の機能を使う処理向け）
+
+プロバイダのクライアント（HTTP接続プール）は、接続設定を上書きしない限り
+全インスタンスで1つを共有します。
+
+バックエンドは引数 backend または環境変数 LLM_BACKEND で切り替えます。
+- gemini（既定）: ChatGoogleGenerativeAI
+- fake: ネットワーク不要のフェイクモデル（common/fake_llm.py）
+  FAKE_LLM_TTFT / FAKE_LLM_TOKEN_LATENCY / FAKE_LLM_INPUT_TOKEN_LATENCY / FAKE_LLM_TTFT_JITTER /
+  FAKE_LLM_SLOW_RATE / FAKE_LLM_SLOW_LATENCY / FAKE_LLM_FAILURE_RATE / FAKE_LLM_FAILURE_STATUS /
+  FAKE_LLM_RATE_LIMIT で遅延と障害を設定できます
+
+    LLM_BACKEND=fake FAKE_LLM_TTFT=0.2 python3 chapter3/multi_tools.py
+
+環境変数 MODEL_ROUTER=1 で、llm をリクエストごとに軽いモデルと通常のモデルを使い分けるモデル
+（get_llm("auto")。common/model_router.py）にできます。
+
+環境変数 RESPONSE_CACHE=memory|sqlite で応答キャッシュ（common/response_cache.py）を、
+RATE_LIMIT_RPM / RATE_LIMIT_TPM / RATE_LIMIT_CONCURRENCY でクライアント側のレート制限
+（common/rate_limit.py）を、HEDGE=1 で遅い呼び出しのヘッジ（common/hedging.py）を、TRACE_FILE / TRACE_METRICS_PORT でトレース（common/tracing.py）を有効にできます。
+"""
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
+import threading
+
+# APIキーの設定（環境変数 GOOGLE_API_KEY が設定されていればそちらを優先）
+GOOGLE_API_KEY = "API_KEY"
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# get_llm にこのモデル名を渡すと、tier（モデル）を使い分けるモデルを返す（common/model_router.py）
+ROUTED_MODEL = "auto"
+
+# これらを指定した場合は接続先が変わるため、共有クライアントを使わない
+_CONNECTION_OPTS = {
+    "google_api_key", "api_key", "credentials", "base_url", "client_args",
+    "additional_headers", "api_version", "vertexai", "project", "location",
+}
+
+_lock = threading.Lock()
+_instances = {}
+_shared_client = None
+
+# トレースはグラフの最初の実行より前に有効にする必要があるため、import 時に行う
+# （設定されていなければ common/tracing.py は import しない）
+if os.environ.get("TRACE_FILE") or os.environ.get("TRACE_METRICS_PORT"):
+    from common.tracing import enable_from_env
+    enable_from_env()
+
+
+def _cache_key(model, opts):
+    return (model, tuple(sorted((k, repr(v)) for k, v in opts.items())))
+
+
+def _create_gemini(model, **opts):
+    """ChatGoogleGenerativeAIを生成する（プロバイダのimportはここで初めて行う）"""
+    global _shared_client
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    share_client = not (_CONNECTION_OPTS & opts.keys())
+    opts.setdefault("google_api_key", os.environ.get("GOOGLE_API_KEY") or GOOGLE_API_KEY)
+    instance = ChatGoogleGenerativeAI(model=model, **opts)
+    if share_client:
+        if _shared_client is None:
+            _shared_client = instance.client
+        else:
+            instance.client = _shared_client
+    return instance
+
+
+def _create_fake(model, **opts):
+    """オフライン用のフェイクモデルを生成する（未指定の遅延・障害設定は環境変数から）"""
+    from common.fake_llm import FakeChatModel
+
+    for name, env in (
+        ("ttft", "FAKE_LLM_TTFT"),
+        ("per_token_latency", "FAKE_LLM_TOKEN_LATENCY"),
+        ("per_input_token_latency", "FAKE_LLM_INPUT_TOKEN_LATENCY"),
+        ("ttft_jitter", "FAKE_LLM_TTFT_JITTER"),
+        ("slow_rate", "FAKE_LLM_SLOW_RATE"),
+        ("slow_latency", "FAKE_LLM_SLOW_LATENCY"),
+        ("failure_rate", "FAKE_LLM_FAILURE_RATE"),
+        ("rate_limit", "FAKE_LLM_RATE_LIMIT"),
+    ):
+        if name not in opts and os.environ.get(env):
+            opts[name] = float(os.environ[env])
+    if "failure_status" not in opts and os.environ.get("FAKE_LLM_FAILURE_STATUS"):
+        opts["failure_status"] = int(os.environ["FAKE_LLM_FAILURE_STATUS"])
+    return FakeChatModel(model=model, **opts)
+
+
+# バックエンド名 -> (model, **opts) を受け取ってチャットモデルを返す関数
+_BACKENDS = {
+    "gemini": _create_gemini,
+    "fake": _create_fake,
+}
+
+
+def _with_response_cache(instance):
+    """RESPONSE_CACHE が設定されていれば応答キャッシュで包む（common/response_cache.py）"""
+    if not os.environ.get("RESPONSE_CACHE"):
+        return instance
+    from common.response_cache import create_response_cache
+    return create_response_cache(instance)
+
+
+def _with_hedging(instance):
+    """HEDGE が設定されていれば、最初のトークンが遅い呼び出しをヘッジする（common/hedging.py）"""
+    if not os.environ.get("HEDGE"):
+        return instance
+    from common.hedging import create_hedged_model
+    return create_hedged_model(instance)
+
+
+def _with_rate_limit(instance):
+    """RATE_LIMIT_* が設定されていればレート制限で包む（common/rate_limit.py）"""
+    if not any(os.environ.get(env) for env in ("RATE_LIMIT_RPM", "RATE_LIMIT_TPM", "RATE_LIMIT_CONCURRENCY")):
+        return instance
+    from common.rate_limit import create_rate_limiter
+    return create_rate_limiter(instance)
+
+
+# 生成したチャットモデルを包む関数（環境変数で有効になる）。get_llm が順に適用する
+# （後のものほど外側になる。応答キャッシュのヒットはレート制限を消費せずヘッジもしない。
+# ヘッジで送るもう1つのリクエストもレート制限を通る）
+_WRAPPERS = [_with_rate_limit, _with_hedging, _with_response_cache]
+
+
+def register_backend(name, factory):
+    """バックエンドを追加する。factory(model, **opts) はチャットモデルを返すこと。"""
+    _BACKENDS[name] = factory
+
+
+def get_llm(model=DEFAULT_MODEL, backend=None, **opts):
+    """LLMインスタンスを取得する。同じ (backend, model, opts) には同じインスタンスを返す。"""
+    backend = backend or os.environ.get("LLM_BACKEND", "gemini")
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {backend!r} (available: {sorted(_BACKENDS)})")
+    key = (backend,) + _cache_key(model, opts)
+    instance = _instances.get(key)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(key)
+            if instance is None:
+                if model == ROUTED_MODEL:
+                    # tier ごとのモデルは最初の呼び出しのときに get_llm で作る（ラッパーはそちらに付く）
+                    from common.model_router import create_model_router
+                    instance = create_model_router(backend, **opts)
+                else:
+                    instance = _BACKENDS[backend](model, **opts)
+                    for wrap in _WRAPPERS:
+                        instance = wrap(instance)
+                _instances[key] = instance
+    return instance
+
+
+def default_llm():
+    """llm の実体（MODEL_ROUTER が設定されていれば get_llm("auto")、なければ get_llm()）"""
+    return get_llm(ROUTED_MODEL if os.environ.get("MODEL_ROUTER") else DEFAULT_MODEL)
+
+
+class _LazyLLM:
+    """初回利用時に実体を生成するプロキシ
+
+    bind_tools() も遅延されるため、グラフの構築・コンパイル・可視化だけなら
+    プロバイダのクライアントは生成されません。
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+
+    def _resolve(self):
+        if self._target is None:
+            self._target = self._factory()
+        return self._target
+
+    def bind_tools(self, tools, **kwargs):
+        return _LazyLLM(lambda: self._resolve().bind_tools(tools, **kwargs))
+
+    # compile() はノード関数が参照するオブジェクトの属性を getattr で調べるため、
+    # 実行用メソッドは明示的に定義しておく（属性の参照だけでは実体を生成しない）
+    def invoke(self, *args, **kwargs):
+        return self._resolve().invoke(*args, **kwargs)
+
+    def ainvoke(self, *args, **kwargs):
+        return self._resolve().ainvoke(*args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        return self._resolve().stream(*args, **kwargs)
+
+    def astream(self, *args, **kwargs):
+        return self._resolve().astream(*args, **kwargs)
+
+    def batch(self, *args, **kwargs):
+        return self._resolve().batch(*args, **kwargs)
+
+    def abatch(self, *args, **kwargs):
+        return self._resolve().abatch(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # __self__ などの特殊属性の問い合わせでは実体を生成しない
+        if name.startswith("__") and name.endswith("__"):
+            raise AttributeError(name)
+        return getattr(self._resolve(), name)
+
+    def __repr__(self):
+        state = "resolved" if self._target is not None else "unresolved"
+        return f"<LazyLLM {state}>"
+
+
+def resolve(model):
+    """遅延プロキシ（llm や llm.bind_tools(...) の戻り値）なら実体を、それ以外はそのまま返す"""
+    return model._resolve() if isinstance(model, _LazyLLM) else model
 
-os.environ["GOOGLE_API_KEY"] = "API_KEY"
 
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
+llm = _LazyLLM(default_llm)
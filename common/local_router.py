@@ -0,0 +1,180 @@
+"""
+ツールだけで答えられる質問のショートカット（chatbot の前に置くルーター）
+
+「123かける456は？」のような質問でも、ツールを使うループではLLMを2回呼びます
+（multiply の tool_call を返す1回と、結果を文章にする1回）。LocalRouter は chatbot の前で
+ユーザーの発話をローカルの規則で判定し、登録したツールでそのまま答えられるものだけを先に処理します。
+
+判定（ツールのスキーマを使う）:
+- intents に登録したツールのうち、キーワード（正規表現）に合うものがちょうど1つ
+- 発話中の数値の個数が、そのツールの引数（integer / number のみ）の個数と同じ。数値は引数の順番に割り当てる
+- 数値・キーワード・助詞などのつなぎの言葉（FILLERS）を取り除くと何も残らない
+  （「〜の結果に3をかけた」のように、ほかの言葉が残る発話は確信が持てないので通常のループに任せる）
+
+答え方（mode）:
+- "template": ルーターがツールを実行し、テンプレートの文で答える（LLMを呼ばない）
+- "llm": ルーターが tool_call を作って tools ノードに渡し、結果の文章化だけをLLMに任せる（LLMは1回）
+- 環境変数 LOCAL_ROUTER=template / llm で有効（既定は無効）
+
+例:
+    router = LocalRouter(tools, intents={"multiply": (r"かける|掛ける|×|\\*", "{a}×{b}は{result}です。")})
+
+    builder.add_node("router", router.node)
+    builder.add_edge(START, "router")
+    builder.add_conditional_edges("router", router.next_node, ["tools", "chatbot", END])
+"""
+import os
+import re
+import threading
+import unicodedata
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.graph import END
+
+MODES = ("template", "llm")
+
+# 取り除いても意味が変わらない言葉（長いものから順に取り除く）
+FILLERS = sorted([
+    "は", "を", "と", "の", "って", "いくつ", "何", "なに", "なん", "でしょうか", "ですか", "です",
+    "計算して", "計算", "教えて", "ください", "答え", "結果", "＝", "=", "？", "?", "。", "、", "！", "!",
+], key=len, reverse=True)
+_FILLER_RE = re.compile("|".join(re.escape(f) for f in FILLERS))
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def _text(message):
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+
+
+def _numeric_params(tool):
+    """ツールの引数名と型（integer / number）を順番に返す（数値以外の引数があれば None）"""
+    params = convert_to_openai_tool(tool)["function"]["parameters"]
+    props = params.get("properties", {})
+    if any(p.get("type") not in ("integer", "number") for p in props.values()):
+        return None
+    return [(name, props[name]["type"]) for name in props]
+
+
+class LocalRouter:
+    """ツールで直接答えられる発話を、LLMを呼ぶ前に処理するルーター
+
+    Args:
+        tools: ツールのリスト
+        intents: ツール名 -> (キーワードの正規表現, テンプレート)。テンプレートには引数名と {result} を使える
+            （None なら "template" モードでも tools ノードとLLMで答える）
+        mode: "template" / "llm"（省略時は環境変数 LOCAL_ROUTER）。None なら無効
+    """
+
+    def __init__(self, tools, intents, mode=None):
+        if mode is None:
+            mode = os.environ.get("LOCAL_ROUTER") or None
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"Unknown router mode: {mode!r} (available: {list(MODES)})")
+        self.mode = mode
+        self.tools_by_name = {t.name: t for t in tools}
+        self.intents = {}
+        for name, (pattern, template) in intents.items():
+            params = _numeric_params(self.tools_by_name[name])
+            if params is None:
+                raise ValueError(f"{name}: only tools with numeric arguments can be routed locally")
+            self.intents[name] = (re.compile(pattern), template, params)
+        self.node = RunnableLambda(self._route, afunc=self._aroute, name="router")
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "template": 0, "llm": 0, "fallthrough": 0}
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    # ---------- 判定 ----------
+
+    def match(self, text):
+        """発話をツールの呼び出し（tool_call）にする。確信が持てなければ None"""
+        text = unicodedata.normalize("NFKC", text).strip()
+        candidates = [name for name, (pattern, _, _) in self.intents.items() if pattern.search(text)]
+        if len(candidates) != 1:
+            return None
+        name = candidates[0]
+        pattern, _, params = self.intents[name]
+        numbers = _NUMBER_RE.findall(text)
+        if len(numbers) != len(params):
+            return None
+        rest = _FILLER_RE.sub("", pattern.sub("", _NUMBER_RE.sub("", text)))
+        if rest.strip():
+            return None
+        args = {}
+        for (param, kind), number in zip(params, numbers):
+            if kind == "integer" and "." in number:
+                return None
+            args[param] = int(number) if kind == "integer" else float(number)
+        return {"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+
+    def _call(self, state):
+        """新しいユーザーの発話で、ツールで答えられるときだけ tool_call を返す"""
+        messages = state["messages"]
+        if not messages or not isinstance(messages[-1], HumanMessage):
+            return None
+        call = self.match(_text(messages[-1]))
+        with self._lock:
+            self._stats["requests"] += 1
+            if call is None:
+                self._stats["fallthrough"] += 1
+        return call
+
+    def _reply(self, call, result):
+        template = self.intents[call["name"]][1]
+        return AIMessage(content=template.format(**call["args"], result=_text(result)))
+
+    def _count(self, mode):
+        with self._lock:
+            self._stats[mode] += 1
+
+    # ---------- ノード ----------
+
+    def _request(self, state):
+        """(tool_call, ルーターで答えるか) を返す（任せるときは (None, False)）"""
+        call = self._call(state)
+        if call is None:
+            return None, False
+        local = self.mode == "template" and self.intents[call["name"]][1] is not None
+        self._count("template" if local else "llm")
+        return call, local
+
+    def _route(self, state):
+        call, local = self._request(state)
+        if call is None:
+            return {}
+        request = AIMessage(content="", tool_calls=[call])
+        if not local:
+            return {"messages": [request]}
+        result = self.tools_by_name[call["name"]].invoke(call)
+        return {"messages": [request, result, self._reply(call, result)]}
+
+    async def _aroute(self, state):
+        call, local = self._request(state)
+        if call is None:
+            return {}
+        request = AIMessage(content="", tool_calls=[call])
+        if not local:
+            return {"messages": [request]}
+        result = await self.tools_by_name[call["name"]].ainvoke(call)
+        return {"messages": [request, result, self._reply(call, result)]}
+
+    def next_node(self, state):
+        """ルーターの次のノード（tool_call を作った -> tools、答えた -> END、任せる -> chatbot）"""
+        last = state["messages"][-1]
+        if isinstance(last, AIMessage):
+            return "tools" if last.tool_calls else END
+        return "chatbot"
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["routed_ratio"] = (stats["template"] + stats["llm"]) / stats["requests"] if stats["requests"] else 0.0
+        return stats
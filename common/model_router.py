@@ -0,0 +1,389 @@
+"""
+モデルのルーティング: 軽いモデルから始めて、必要なときだけ大きいモデルに切り替える
+
+すべてのグラフが同じモデル（gemini-2.0-flash）を使うと、「こんにちは！」にもツールを何度も使う質問にも
+同じ料金と待ち時間がかかります。RoutedChatModel はリクエストをローカルの規則で分類して軽いモデル（tier）に送り、
+応答がおかしいときだけ次の tier で呼び直します（エスカレーション）。
+
+分類（RoutingPolicy。LLMは呼ばない）:
+- 最後のユーザーの発話の文字数（max_chars）
+- 会話のメッセージ数（max_history）と、このターンでツールを呼んだ回数（max_tool_rounds）
+- ツールを使いそうな言葉の出現回数（tool_hints。2回以上なら複数のツールを続けて使いそうとみなす）
+どれかを超えたら2番目の tier から、超えなければ最初の tier から始めます。
+
+エスカレーションする応答（最後の tier の応答はそのまま返す）:
+- tool_call が壊れている（invalid_tool_calls、知らないツール名、必須の引数がない・型が違う）
+- 本文も tool_call もない
+- 確信が低い（「わかりません」などの言い回し。プロバイダが avg_logprobs を返す場合は min_avg_logprob 未満）
+
+ノードごとの設定: nodes={"trim": "gemini-2.0-flash-lite", "chatbot": "auto"} のように、ノード名
+（langgraph_node）ごとに最初の tier を固定するか、"auto"（分類する）を指定できます。
+
+tier ごとの呼び出し回数・トークン数・料金（prices。100万トークンあたりのドル）・レイテンシと
+エスカレーションの割合は stats() で確認できます。応答の response_metadata["model_routing"] にも
+使った tier とエスカレーションの経緯が入ります（common/tracing.py のメトリクスが使う）。
+usage_metadata は捨てた応答の分も含めた合計です（common/budget.py のトークン数の予算に入るように）。
+
+ストリーミングでは、最後でない tier の応答は確認してからまとめて送ります（エスカレーションしたら捨てる）。
+
+環境変数:
+    MODEL_ROUTER=1: common.llm の llm をこのモデルにする（get_llm("auto") と同じ）
+    MODEL_ROUTER_TIERS: 軽い順のモデル名（カンマ区切り。既定 "gemini-2.0-flash-lite,gemini-2.0-flash"）
+    MODEL_ROUTER_NODES: ノードごとの tier（例: "trim=gemini-2.0-flash-lite,chatbot=auto"）
+
+    MODEL_ROUTER=1 LLM_BACKEND=fake python3 chapter3/multi_tools.py
+"""
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
+from langchain_core.messages.ai import add_usage
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_core.runnables.config import ensure_config
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field, PrivateAttr
+
+DEFAULT_TIERS = ("gemini-2.0-flash-lite", "gemini-2.0-flash")
+
+# モデル名 -> (入力, 出力) の100万トークンあたりの料金（ドル。公開価格の例なので、実際の料金で上書きすること）
+PRICES = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
+# ツールを使いそうな言葉（Chapter 3 / 5 のツール）
+TOOL_HINTS = r"足し|足す|引い|引く|かけ|掛け|×|割っ|割る|計算|天気|気温|何時|時刻|日時|メール|送っ|送信|削除|消し|調べ|検索"
+# 確信が低いときの言い回し
+HEDGES = r"わかりません|分かりません|わかりかねます|分かりかねます|不明です|確信が(?:あり|持て)ません|I'm not sure|I don't know"
+
+_JSON_TYPES = {
+    "integer": int, "number": (int, float), "string": str, "boolean": bool, "array": list, "object": dict,
+}
+
+
+def _text(message):
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+
+
+def _turn(messages):
+    """最後のユーザーの発話と、それより後のメッセージ"""
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return messages[i], messages[i + 1:]
+    return None, list(messages)
+
+
+def _bad_args(args, schema):
+    """引数がツールのスキーマ（JSON Schema の properties / required）に合わなければ True"""
+    params = schema["function"].get("parameters") or {}
+    props = params.get("properties") or {}
+    if not isinstance(args, dict) or any(name not in args for name in params.get("required", ())):
+        return True
+    for name, value in args.items():
+        if name not in props:
+            return True
+        expected = _JSON_TYPES.get(props[name].get("type"))
+        # bool は int のサブクラスなので、integer / number には別に確認する
+        if expected is not None and (not isinstance(value, expected)
+                                     or (isinstance(value, bool) and expected is not bool)):
+            return True
+    return False
+
+
+class RoutingPolicy:
+    """ローカルの規則でリクエストを分類し、応答をエスカレーションするか判定する
+
+    Args:
+        max_chars: 最後のユーザーの発話の文字数の上限
+        max_history: 会話のメッセージ数（システムプロンプトを除く）の上限
+        max_tool_rounds: このターンでツールを呼んだ回数の上限
+        tool_hints: ツールを使いそうな言葉の正規表現（出現回数が2回以上なら上限を超えたとみなす）
+        hedges: 確信が低いときの言い回しの正規表現
+        min_avg_logprob: response_metadata["avg_logprobs"] の下限（プロバイダが返す場合のみ確認する）
+    """
+
+    def __init__(self, max_chars=200, max_history=20, max_tool_rounds=2, tool_hints=TOOL_HINTS, hedges=HEDGES,
+                 min_avg_logprob=-1.0):
+        self.max_chars = max_chars
+        self.max_history = max_history
+        self.max_tool_rounds = max_tool_rounds
+        self.tool_hints = re.compile(tool_hints)
+        self.hedges = re.compile(hedges)
+        self.min_avg_logprob = min_avg_logprob
+
+    def classify(self, messages, tools=None):
+        """("light" / "long" / "history" / "tool_rounds" / "tool_hints") を返す。"light" 以外は2番目の tier から"""
+        human, turn = _turn(messages)
+        text = _text(human) if human is not None else ""
+        if len(text) > self.max_chars:
+            return "long"
+        if sum(1 for m in messages if not isinstance(m, SystemMessage)) > self.max_history:
+            return "history"
+        if sum(1 for m in turn if isinstance(m, AIMessage) and m.tool_calls) > self.max_tool_rounds:
+            return "tool_rounds"
+        if tools and len(self.tool_hints.findall(text)) >= 2:
+            return "tool_hints"
+        return "light"
+
+    def escalation(self, message, tools=None):
+        """応答をエスカレーションする理由（"malformed_tool_call" / "unknown_tool" / "bad_args" / "empty" /
+        "low_confidence"）。問題がなければ None"""
+        if message.invalid_tool_calls:
+            return "malformed_tool_call"
+        if tools is not None:
+            schemas = {t["function"]["name"]: t for t in tools}
+            for call in message.tool_calls:
+                if call["name"] not in schemas:
+                    return "unknown_tool"
+                if _bad_args(call["args"], schemas[call["name"]]):
+                    return "bad_args"
+        text = _text(message)
+        if not message.tool_calls and not text.strip():
+            return "empty"
+        logprob = message.response_metadata.get("avg_logprobs")
+        if self.hedges.search(text) or (logprob is not None and logprob < self.min_avg_logprob):
+            return "low_confidence"
+        return None
+
+
+class RoutedChatModel(BaseChatModel):
+    """リクエストごとに tier（モデル）を選び、応答がおかしければ次の tier で呼び直すチャットモデル
+
+    Attributes:
+        tiers: 軽い順のモデル名（各 tier のモデルは get_llm(tier, backend, **opts) で作る）
+        backend: get_llm に渡すバックエンド（None なら環境変数 LLM_BACKEND）
+        opts: get_llm に渡すオプション
+        policy: RoutingPolicy
+        nodes: ノード名 -> 最初の tier（モデル名）または "auto"。書いていないノードは "auto"
+        prices: モデル名 -> (入力, 出力) の100万トークンあたりの料金
+    """
+
+    tiers: list
+    backend: Optional[str] = None
+    opts: dict = Field(default_factory=dict)
+    policy: Any = None
+    nodes: dict = Field(default_factory=dict)
+    prices: dict = Field(default_factory=lambda: dict(PRICES))
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stats: dict = PrivateAttr(default=None)
+    # create_cached_content で返した名前 -> ({tier: その tier のキャッシュ名}, ツールのスキーマ)
+    _caches: dict = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context):
+        super().model_post_init(__context)
+        if self.policy is None:
+            self.policy = RoutingPolicy()
+        for node, tier in self.nodes.items():
+            if tier != "auto" and tier not in self.tiers:
+                raise ValueError(f"{node}: unknown tier {tier!r} (available: {self.tiers + ['auto']})")
+        self._stats = {
+            "requests": 0,
+            "escalations": 0,
+            "routes": {},
+            "escalation_reasons": {},
+            "tiers": {tier: dict.fromkeys(
+                ("calls", "answered", "input_tokens", "output_tokens", "cost_usd", "latency_seconds"), 0,
+            ) for tier in self.tiers},
+        }
+
+    @property
+    def _llm_type(self):
+        return "routed"
+
+    @property
+    def _identifying_params(self):
+        return {"tiers": list(self.tiers)}
+
+    def model(self, tier):
+        """tier のモデル（get_llm が作ったものなので、応答キャッシュやレート制限のラッパーも付く）"""
+        from common.llm import get_llm
+        return get_llm(tier, self.backend, **self.opts)
+
+    def models(self):
+        """すべての tier のモデルを作って返す（ウォームアップ用）"""
+        return {tier: self.model(tier) for tier in self.tiers}
+
+    def bind_tools(self, tools, **kwargs):
+        # ツールの変換は最初の tier に任せる（tier はすべて同じバックエンド）。
+        # 応答の確認に使うスキーマは routing_tools としてバインドし、tier には渡さない
+        formatted = [convert_to_openai_tool(t) for t in tools]
+        return self.bind(**self.model(self.tiers[0]).bind_tools(tools, **kwargs).kwargs, routing_tools=formatted)
+
+    def create_cached_content(self, messages, tools=None, ttl=None):
+        """プレフィックスを tier ごとに登録する（コンテキストキャッシュはモデルごと）"""
+        from common.prompt_cache import register_prefix
+        names = {tier: register_prefix(self.model(tier), messages, tools, ttl) for tier in self.tiers}
+        name = f"routed/{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self._caches[name] = (names, [convert_to_openai_tool(t) for t in tools or []])
+        return name
+
+    def stats(self):
+        with self._lock:
+            stats = {**self._stats, "routes": dict(self._stats["routes"]),
+                     "escalation_reasons": dict(self._stats["escalation_reasons"]),
+                     "tiers": {tier: dict(s) for tier, s in self._stats["tiers"].items()}}
+        stats["escalation_rate"] = stats["escalations"] / stats["requests"] if stats["requests"] else 0.0
+        stats["cost_usd"] = sum(s["cost_usd"] for s in stats["tiers"].values())
+        for s in stats["tiers"].values():
+            s["mean_latency_ms"] = s["latency_seconds"] / s["calls"] * 1000 if s["calls"] else 0.0
+        return stats
+
+    # ---------- 選択と記録 ----------
+
+    def _plan(self, messages, kwargs):
+        """(最初の tier の番号, 選んだ理由, 応答の確認に使うツールのスキーマ, tier ごとの kwargs) を返す"""
+        kwargs = dict(kwargs)
+        tools = kwargs.pop("routing_tools", None)
+        per_tier = {tier: kwargs for tier in self.tiers}
+        if (name := kwargs.get("cached_content")) in self._caches:
+            names, tools = self._caches[name]
+            per_tier = {tier: {**kwargs, "cached_content": names[tier]} for tier in self.tiers}
+        node = ensure_config().get("metadata", {}).get("langgraph_node")
+        choice = self.nodes.get(node, "auto")
+        if choice != "auto":
+            start, route = self.tiers.index(choice), f"node:{node}"
+        else:
+            route = self.policy.classify(messages, tools)
+            start = 0 if route == "light" else min(1, len(self.tiers) - 1)
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["routes"][route] = self._stats["routes"].get(route, 0) + 1
+        return start, route, tools, per_tier
+
+    def _record(self, tier, usage, seconds, answered):
+        usage = usage or {}
+        input_price, output_price = self.prices.get(tier, (0.0, 0.0))
+        with self._lock:
+            s = self._stats["tiers"][tier]
+            s["calls"] += 1
+            s["answered"] += answered
+            s["input_tokens"] += usage.get("input_tokens", 0)
+            s["output_tokens"] += usage.get("output_tokens", 0)
+            s["cost_usd"] += (usage.get("input_tokens", 0) * input_price
+                              + usage.get("output_tokens", 0) * output_price) / 1_000_000
+            s["latency_seconds"] += seconds
+
+    def _check(self, index, message, tools, escalations, t0):
+        """tier の応答を確認して記録する。エスカレーションするなら理由を escalations に加えて True"""
+        tier = self.tiers[index]
+        reason = None if index == len(self.tiers) - 1 else self.policy.escalation(message, tools)
+        self._record(tier, message.usage_metadata, time.perf_counter() - t0, reason is None)
+        if reason is None:
+            return False
+        escalations.append({"from": tier, "to": self.tiers[index + 1], "reason": reason})
+        with self._lock:
+            self._stats["escalations"] += 1
+            reasons = self._stats["escalation_reasons"]
+            reasons[reason] = reasons.get(reason, 0) + 1
+        return True
+
+    @staticmethod
+    def _routing(tier, route, escalations):
+        return {"model_routing": {"tier": tier, "route": route, "escalations": escalations}}
+
+    # ---------- 同期 ----------
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        start, route, tools, per_tier = self._plan(messages, kwargs)
+        escalations, discarded = [], None
+        for index in range(start, len(self.tiers)):
+            tier, t0 = self.tiers[index], time.perf_counter()
+            result = self.model(tier)._generate(messages, stop=stop, run_manager=run_manager, **per_tier[tier])
+            message = result.generations[0].message
+            if not self._check(index, message, tools, escalations, t0):
+                break
+            discarded = add_usage(discarded, message.usage_metadata)
+        message.response_metadata.update(self._routing(tier, route, escalations))
+        if discarded is not None:
+            message.usage_metadata = add_usage(discarded, message.usage_metadata)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        start, route, tools, per_tier = self._plan(messages, kwargs)
+        escalations, discarded = [], None
+        for index in range(start, len(self.tiers)):
+            tier, t0 = self.tiers[index], time.perf_counter()
+            stream = self.model(tier)._stream(messages, stop=stop, run_manager=run_manager, **per_tier[tier])
+            if index == len(self.tiers) - 1:
+                # 最後の tier はそのまま送る
+                final = None
+                for chunk in stream:
+                    final = chunk.message if final is None else final + chunk.message
+                    yield chunk
+                self._check(index, final or AIMessageChunk(content=""), tools, escalations, t0)
+                break
+            chunks = list(stream)
+            message = sum((c.message for c in chunks[1:]), chunks[0].message) if chunks else AIMessageChunk(content="")
+            if not self._check(index, message, tools, escalations, t0):
+                yield from chunks
+                break
+            discarded = add_usage(discarded, message.usage_metadata)
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", usage_metadata=discarded, response_metadata=self._routing(tier, route, escalations)))
+
+    # ---------- 非同期 ----------
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        start, route, tools, per_tier = self._plan(messages, kwargs)
+        escalations, discarded = [], None
+        for index in range(start, len(self.tiers)):
+            tier, t0 = self.tiers[index], time.perf_counter()
+            result = await self.model(tier)._agenerate(messages, stop=stop, run_manager=run_manager,
+                                                       **per_tier[tier])
+            message = result.generations[0].message
+            if not self._check(index, message, tools, escalations, t0):
+                break
+            discarded = add_usage(discarded, message.usage_metadata)
+        message.response_metadata.update(self._routing(tier, route, escalations))
+        if discarded is not None:
+            message.usage_metadata = add_usage(discarded, message.usage_metadata)
+        return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        start, route, tools, per_tier = self._plan(messages, kwargs)
+        escalations, discarded = [], None
+        for index in range(start, len(self.tiers)):
+            tier, t0 = self.tiers[index], time.perf_counter()
+            stream = self.model(tier)._astream(messages, stop=stop, run_manager=run_manager, **per_tier[tier])
+            if index == len(self.tiers) - 1:
+                final = None
+                async for chunk in stream:
+                    final = chunk.message if final is None else final + chunk.message
+                    yield chunk
+                self._check(index, final or AIMessageChunk(content=""), tools, escalations, t0)
+                break
+            chunks = [chunk async for chunk in stream]
+            message = sum((c.message for c in chunks[1:]), chunks[0].message) if chunks else AIMessageChunk(content="")
+            if not self._check(index, message, tools, escalations, t0):
+                for chunk in chunks:
+                    yield chunk
+                break
+            discarded = add_usage(discarded, message.usage_metadata)
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", usage_metadata=discarded, response_metadata=self._routing(tier, route, escalations)))
+
+
+def create_model_router(backend=None, **opts):
+    """環境変数の設定で RoutedChatModel を作る
+
+    - MODEL_ROUTER_TIERS: 軽い順のモデル名（カンマ区切り）
+    - MODEL_ROUTER_NODES: ノード名=tier（カンマ区切り。tier はモデル名か auto）
+    """
+    tiers = [t.strip() for t in os.environ.get("MODEL_ROUTER_TIERS", ",".join(DEFAULT_TIERS)).split(",") if t.strip()]
+    nodes = {}
+    for item in filter(None, (s.strip() for s in os.environ.get("MODEL_ROUTER_NODES", "").split(","))):
+        node, _, tier = item.partition("=")
+        nodes[node.strip()] = tier.strip()
+    return RoutedChatModel(tiers=tiers, backend=backend, opts=opts, nodes=nodes)
@@ -0,0 +1,127 @@
+"""
+固定のプレフィックス（システムプロンプト + ツール定義）のキャッシュ
+
+ツールを使うエージェントは毎回
+    [SystemMessage(content=SYSTEM_PROMPT)] + state["messages"]
+のようにリストを作り直し、bind_tools(tools) のツール定義と一緒に全体を送信します。
+CachedPrefix はシステムプロンプトとツール定義をプロバイダのコンテキストキャッシュに1度だけ登録し、
+以降の呼び出しではキャッシュ名を参照して会話（state["messages"]）だけを送ります。
+
+- Gemini: langchain_google_genai.create_context_cache で登録（cached_content で参照）
+- フェイクモデル: create_cached_content で同じ動作を再現
+- 登録できない場合（キャッシュの最小トークン数に満たない・未対応のモデルなど）は
+  従来どおりシステムプロンプトを先頭に付けて送る
+- キャッシュは ttl の9割が過ぎたら登録し直す
+- 環境変数 PROMPT_CACHE=1 で有効（既定は無効。プレフィックスがプロバイダの最小トークン数に満たないと
+  登録に失敗するため、長いシステムプロンプトやツール定義を使う場合に指定する）
+
+例:
+    model = CachedPrefix(llm, SYSTEM_PROMPT, tools)
+
+    def chatbot(state: State):
+        return {"messages": [model.invoke(state["messages"])]}
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import warnings
+
+from langchain_core.messages import SystemMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from common.llm import resolve
+
+# キャッシュ名 -> 登録した内容のハッシュ（キャッシュ名はプロセスごとに変わるため、
+# 応答キャッシュなど内容で比較したい処理が使う）
+_digests = {}
+
+
+def prefix_digest(name):
+    """キャッシュ名に対応する、登録した内容（システムプロンプト + ツール定義）のハッシュ"""
+    return _digests.get(name)
+
+
+def register_prefix(model, messages, tools, ttl):
+    """プレフィックスをプロバイダに登録し、キャッシュ名を返す"""
+    # ラッパー（応答キャッシュなど）は inner に実際のモデルを持つ
+    while getattr(model, "inner", None) is not None:
+        model = model.inner
+    if hasattr(model, "create_cached_content"):
+        return model.create_cached_content(messages, tools=tools, ttl=ttl)
+    from langchain_google_genai import ChatGoogleGenerativeAI, create_context_cache
+    if isinstance(model, ChatGoogleGenerativeAI):
+        return create_context_cache(model, messages, tools=tools, ttl=f"{int(ttl)}s")
+    raise TypeError(f"{type(model).__name__} does not support context caching")
+
+
+class CachedPrefix:
+    """システムプロンプトとツール定義をキャッシュして呼び出すモデル
+
+    Args:
+        llm: チャットモデル（common.llm の遅延プロキシも可）
+        system_prompt: システムプロンプト
+        tools: バインドするツール
+        ttl: キャッシュの有効期間（秒）
+        enabled: True でキャッシュを使う（省略時は環境変数 PROMPT_CACHE、既定で無効）
+    """
+
+    def __init__(self, llm, system_prompt, tools, ttl=3600, enabled=None):
+        self.llm = llm
+        self.tools = list(tools)
+        self.ttl = ttl
+        if enabled is None:
+            enabled = os.environ.get("PROMPT_CACHE", "").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        # プレフィックスは1度だけ作る（キャッシュを使わない場合もこのリストを使い回す）
+        self.prefix = [SystemMessage(content=system_prompt)]
+        self.cache_name = None
+        self._runnable = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def _create(self):
+        # 遅延プロキシは最初の呼び出しまで実体を生成しない
+        model = resolve(self.llm)
+        if self.enabled:
+            try:
+                self.cache_name = register_prefix(model, self.prefix, self.tools, self.ttl)
+                _digests[self.cache_name] = hashlib.sha256(json.dumps(
+                    [self.prefix[0].content, [convert_to_openai_tool(t) for t in self.tools]],
+                    sort_keys=True, ensure_ascii=False,
+                ).encode("utf-8")).hexdigest()
+                return model.bind(cached_content=self.cache_name), time.monotonic() + self.ttl * 0.9
+            except Exception as e:
+                warnings.warn(f"Context caching is unavailable, sending the full prompt instead: {e}")
+                self.enabled = False
+        self.cache_name = None
+        return model.bind_tools(self.tools), float("inf")
+
+    def _get(self):
+        if self._runnable is None or time.monotonic() >= self._expires:
+            with self._lock:
+                if self._runnable is None or time.monotonic() >= self._expires:
+                    self._runnable, self._expires = self._create()
+        return self._runnable, self.cache_name is not None
+
+    def _input(self, messages):
+        runnable, cached = self._get()
+        # キャッシュ済みならプレフィックスはプロバイダ側にあるので、会話だけを送る
+        return runnable, (messages if cached else self.prefix + messages)
+
+    def invoke(self, messages, config=None, **kwargs):
+        runnable, messages = self._input(messages)
+        return runnable.invoke(messages, config, **kwargs)
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        runnable, messages = self._input(messages)
+        return await runnable.ainvoke(messages, config, **kwargs)
+
+    def stream(self, messages, config=None, **kwargs):
+        runnable, messages = self._input(messages)
+        return runnable.stream(messages, config, **kwargs)
+
+    def astream(self, messages, config=None, **kwargs):
+        runnable, messages = self._input(messages)
+        return runnable.astream(messages, config, **kwargs)
@@ -0,0 +1,457 @@
+"""
+クライアント側のレート制限と適応的な同時実行数の制御
+
+多数の会話を同時に実行すると、共有のLLMがプロバイダのクォータ（requests/min・tokens/min）を超えて
+429 が返り、再試行が積み重なってスループットが落ちます。RateLimitedChatModel は get_llm が作る
+モデルを包み、呼び出しの手前で待つことで 429 をそもそも起こしにくくします。
+
+- requests/min と tokens/min のトークンバケット（スレッドと asyncio のタスクで共有）
+- 同時実行数を AIMD で調整（429 で乗算的に減らし、成功するたびに少しずつ増やす）
+- 429 を受けた呼び出しはバックオフしてから自動で再試行する
+- 同じモデル名のインスタンスは1つのリミッターを共有する
+
+tokens/min は呼び出し前にメッセージから見積もった入力トークン数 + expected_output_tokens を差し引き、
+応答の usage_metadata で実際の使用量との差を精算します。
+
+環境変数（どれかを指定すると get_llm のモデルに適用される）:
+    RATE_LIMIT_RPM: 1分あたりのリクエスト数
+    RATE_LIMIT_TPM: 1分あたりのトークン数
+    RATE_LIMIT_CONCURRENCY: 同時実行数の上限（既定 32。AIMD はこの範囲で調整する）
+
+    RATE_LIMIT_RPM=15 python3 chapter3/multi_tools.py
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from pydantic import PrivateAttr
+
+from common.context_window import message_tokens
+
+
+def status_code(error):
+    """例外から HTTP の status_code を取り出す（わからなければ None）
+
+    例外の属性（status_code / code）を見ます。プロバイダの例外を包み直した例外
+    （langchain_google_genai など）は、元の例外（__cause__）もたどります。
+    メッセージの文字列は、Gemini のレート制限の状態名 RESOURCE_EXHAUSTED だけを見ます
+    （"429" のような数字は ID や金額などにも現れるため使わない）。
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        for name in ("status_code", "code"):
+            value = getattr(error, name, None)
+            if isinstance(value, int) and not isinstance(value, bool):
+                return int(value)
+        if getattr(error, "status", None) == "RESOURCE_EXHAUSTED" or "RESOURCE_EXHAUSTED" in str(error):
+            return 429
+        error = error.__cause__
+    return None
+
+
+class TokenBucket:
+    """1分あたり rate_per_minute のトークンバケット
+
+    reserve() は残量を先に差し引いて待ち時間を返します（残量はマイナスになり得る）。
+    呼び出し側がその時間だけ待つことで、スレッドとイベントループをまたいで到着順に割り当てられます。
+
+    Args:
+        rate_per_minute: 1分あたりに補充する量
+        capacity: 貯められる上限（既定は1秒分。一度に送りすぎて短い時間枠の制限に当たらないように）
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1.0):
+        """amount を差し引き、使えるようになるまでの秒数を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    def adjust(self, amount):
+        """見積もりとの差を精算する（正なら追加で差し引き、負なら返す）"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class _Waiter:
+    """同時実行数の空きを待つ呼び出し（同期はイベント、非同期はフューチャーで起こす）"""
+
+    def __init__(self, loop=None):
+        self.granted = False
+        if loop is None:
+            self._event = threading.Event()
+            self.wake = self._event.set
+        else:
+            self.future = loop.create_future()
+            self.wake = lambda: loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+    def wait(self):
+        self._event.wait()
+
+
+class AdaptiveConcurrency:
+    """AIMD で上限を調整するセマフォ（スレッドと asyncio のタスクで共有できる）
+
+    Args:
+        max_limit: 同時実行数の上限
+        min_limit: 同時実行数の下限
+        initial: 最初の上限（省略時は max_limit）
+        decrease: 429 を受けたときに上限に掛ける係数
+
+    上限を減らすのは、前回減らした後に始まった呼び出しが 429 を受けたときだけです
+    （減らす前から実行中だった呼び出しの 429 で、続けて何度も半分にしないため）。
+    """
+
+    def __init__(self, max_limit=32, min_limit=1, initial=None, decrease=0.5):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial or max_limit)
+        self.decrease = decrease
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _wake(self):
+        # ロックを持った状態で呼ぶ。空いた分だけ待っている呼び出しに順番に割り当てる
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self.in_flight += 1
+            waiter.wake()
+
+    def _try_acquire(self, waiter_loop=None):
+        with self._lock:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return None
+            waiter = _Waiter(waiter_loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter):
+        # 待っている途中で中断された呼び出しを取り下げる（割り当て済みなら空きを返す）
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return
+        self.cancel()
+
+    def acquire(self):
+        """空きを待って確保し、開始時刻（release に渡す）を返す"""
+        waiter = self._try_acquire()
+        if waiter is not None:
+            try:
+                waiter.wait()
+            except BaseException:
+                self._abandon(waiter)
+                raise
+        return time.monotonic()
+
+    async def aacquire(self):
+        waiter = self._try_acquire(asyncio.get_running_loop())
+        if waiter is None:
+            return time.monotonic()
+        try:
+            await waiter.future
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        return time.monotonic()
+
+    def cancel(self):
+        """確保した空きを、呼び出さずに返す（上限は変えない）"""
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def release(self, started=None, throttled=False):
+        """呼び出しが終わったら acquire の戻り値を渡して呼ぶ。
+
+        throttled=True（429）なら上限を減らし、そうでなければ少し増やします。
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if throttled:
+                if started is None or started >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = time.monotonic()
+            else:
+                # 上限の数だけ成功するとおよそ1増える（加算的な増加）
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._wake()
+
+
+class RateLimiter:
+    """requests/min・tokens/min のバケットと適応的な同時実行数をまとめたもの
+
+    Args:
+        rpm: 1分あたりのリクエスト数（None で制限しない）
+        tpm: 1分あたりのトークン数（None で制限しない）
+        max_concurrency: 同時実行数の上限
+        min_concurrency: 同時実行数の下限
+    """
+
+    def __init__(self, rpm=None, tpm=None, max_concurrency=32, min_concurrency=1):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency, min_concurrency)
+        self._stats = dict.fromkeys(("requests", "throttled", "retries", "waited_seconds"), 0)
+        self._lock = threading.Lock()
+
+    def _delay(self, tokens):
+        delay = 0.0
+        if self.requests is not None:
+            delay = self.requests.reserve(1)
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(tokens))
+        return delay
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def _refund(self, tokens):
+        # バケットを待つ途中で中断されたら、呼び出していないので差し引いた分を返す
+        if self.requests is not None:
+            self.requests.adjust(-1)
+        if self.tokens is not None:
+            self.tokens.adjust(-tokens)
+
+    def acquire(self, tokens):
+        """同時実行数の空きとバケットを待つ。戻り値（チケット）は release に渡す
+
+        待っている途中で中断されたら、空きを成功扱いにせず返します（AIMD の上限は増やさない）。
+        """
+        t0 = time.perf_counter()
+        self.concurrency.acquire()
+        try:
+            if (delay := self._delay(tokens)) > 0:
+                time.sleep(delay)
+        except BaseException:
+            self._refund(tokens)
+            self.concurrency.cancel()
+            raise
+        self._count("waited_seconds", time.perf_counter() - t0)
+        self._count("requests")
+        return time.monotonic(), tokens
+
+    async def aacquire(self, tokens):
+        t0 = time.perf_counter()
+        await self.concurrency.aacquire()
+        try:
+            if (delay := self._delay(tokens)) > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._refund(tokens)
+            self.concurrency.cancel()
+            raise
+        self._count("waited_seconds", time.perf_counter() - t0)
+        self._count("requests")
+        return time.monotonic(), tokens
+
+    def release(self, ticket, used=None, throttled=False):
+        """呼び出しの後に、実際の使用トークン数（わかれば）で精算する"""
+        started, estimated = ticket
+        if throttled:
+            self._count("throttled")
+        if self.tokens is not None and used is not None:
+            self.tokens.adjust(used - estimated)
+        self.concurrency.release(started, throttled)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(limit=self.concurrency.limit, in_flight=self.concurrency.in_flight)
+        return stats
+
+
+def _usage(message):
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """呼び出しの前に RateLimiter で待つチャットモデルのラッパー
+
+    Attributes:
+        inner: 実際に応答を生成するチャットモデル
+        limiter: 共有するリミッター
+        max_retries: 429 を受けたときの再試行の上限
+        backoff: 再試行の待ち時間の基準（秒）。attempt 回目は backoff * 2**(attempt-1) 秒（ジッター付き）
+        expected_output_tokens: tokens/min の見積もりに加える出力トークン数
+    """
+
+    inner: BaseChatModel
+    limiter: Any
+    max_retries: int = 5
+    backoff: float = 1.0
+    expected_output_tokens: int = 256
+
+    _rng: random.Random = PrivateAttr(default_factory=random.Random)
+
+    @property
+    def _llm_type(self):
+        return f"rate-limited-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self):
+        return self.inner._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        # ツールの変換は包んでいるモデルに任せ、変換結果をこのモデルにバインドする
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def stats(self):
+        return self.limiter.stats()
+
+    def _estimate(self, messages):
+        return sum(message_tokens(m) for m in messages) + self.expected_output_tokens
+
+    def _retry_delay(self, error, attempt):
+        """再試行するなら待ち時間（秒）、しないなら None"""
+        if status_code(error) != 429 or attempt > self.max_retries:
+            return None
+        self.limiter._count("retries")
+        return self.backoff * 2 ** (attempt - 1) * self._rng.uniform(0.5, 1.0)
+
+    # ---------- 同期 ----------
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        estimated = self._estimate(messages)
+        attempt = 0
+        while True:
+            attempt += 1
+            ticket = self.limiter.acquire(estimated)
+            try:
+                result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                throttled = status_code(e) == 429
+                self.limiter.release(ticket, throttled=throttled)
+                if (delay := self._retry_delay(e, attempt)) is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.limiter.release(ticket, _usage(result.generations[0].message))
+            return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        estimated = self._estimate(messages)
+        attempt = 0
+        while True:
+            attempt += 1
+            ticket = self.limiter.acquire(estimated)
+            used, started, released = None, False, False
+            try:
+                for chunk in self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    used = _usage(chunk.message) or used
+                    yield chunk
+            except Exception as e:
+                throttled = status_code(e) == 429
+                self.limiter.release(ticket, throttled=throttled)
+                released = True
+                # 途中まで送ったストリームは再試行できない
+                if started or (delay := self._retry_delay(e, attempt)) is None:
+                    raise
+                time.sleep(delay)
+                continue
+            finally:
+                if not released:
+                    self.limiter.release(ticket, used)
+            return
+
+    # ---------- 非同期 ----------
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        estimated = self._estimate(messages)
+        attempt = 0
+        while True:
+            attempt += 1
+            ticket = await self.limiter.aacquire(estimated)
+            try:
+                result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                throttled = status_code(e) == 429
+                self.limiter.release(ticket, throttled=throttled)
+                if (delay := self._retry_delay(e, attempt)) is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.limiter.release(ticket, _usage(result.generations[0].message))
+            return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        estimated = self._estimate(messages)
+        attempt = 0
+        while True:
+            attempt += 1
+            ticket = await self.limiter.aacquire(estimated)
+            used, started, released = None, False, False
+            try:
+                async for chunk in self.inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    used = _usage(chunk.message) or used
+                    yield chunk
+            except Exception as e:
+                throttled = status_code(e) == 429
+                self.limiter.release(ticket, throttled=throttled)
+                released = True
+                if started or (delay := self._retry_delay(e, attempt)) is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                if not released:
+                    self.limiter.release(ticket, used)
+            return
+
+
+# モデル名 -> RateLimiter（クォータはモデルごとなので、同じモデルのインスタンスで共有する）
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def shared_limiter(model_name, **opts):
+    """モデル名ごとに1つの RateLimiter を返す（初回の opts で作る）"""
+    with _limiters_lock:
+        if model_name not in _limiters:
+            _limiters[model_name] = RateLimiter(**opts)
+        return _limiters[model_name]
+
+
+def create_rate_limiter(model):
+    """環境変数の設定で model を RateLimitedChatModel で包む
+
+    - RATE_LIMIT_RPM: 1分あたりのリクエスト数
+    - RATE_LIMIT_TPM: 1分あたりのトークン数
+    - RATE_LIMIT_CONCURRENCY: 同時実行数の上限（既定 32）
+    """
+    opts = {}
+    if os.environ.get("RATE_LIMIT_RPM"):
+        opts["rpm"] = float(os.environ["RATE_LIMIT_RPM"])
+    if os.environ.get("RATE_LIMIT_TPM"):
+        opts["tpm"] = float(os.environ["RATE_LIMIT_TPM"])
+    if os.environ.get("RATE_LIMIT_CONCURRENCY"):
+        opts["max_concurrency"] = int(os.environ["RATE_LIMIT_CONCURRENCY"])
+    name = getattr(model, "model", None) or type(model).__name__
+    return RateLimitedChatModel(inner=model, limiter=shared_limiter(name, **opts))
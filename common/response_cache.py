@@ -0,0 +1,439 @@
+"""
+LLMの応答キャッシュ
+
+同じ質問（例:「東京の天気を教えて」）が繰り返し来る場合、毎回LLMを呼ぶ必要はありません。
+CachedChatModel はチャットモデルを包み、応答をキャッシュします。
+
+- 完全一致: 正規化したメッセージ・バインド済みツール・モデルのパラメータのハッシュで検索
+  保存先はプロセス内のLRU（MemoryStore）またはSQLiteファイル（SqliteStore）
+- 類似検索（任意）: 最後のユーザー発話の埋め込みが近い応答を使う（SemanticIndex）
+  それまでの会話・ツール・パラメータが完全一致するものの中から探す
+- 結果が毎回変わるツール（get_current_time など）の結果を含む会話はキャッシュしない
+- stats() でヒット率と、ヒットによって省けたLLMの時間（推定）を確認できる
+
+common/llm.py の get_llm は環境変数 RESPONSE_CACHE=memory|sqlite でこのラッパーを適用します。
+
+    RESPONSE_CACHE=sqlite RESPONSE_CACHE_SEMANTIC=0.9 python3 chapter3/multi_tools.py
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, message_chunk_to_message, messages_from_dict, messages_to_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+# 結果が呼び出しのたびに変わるツール（これらの結果を含む会話はキャッシュしない）
+DEFAULT_BYPASS_TOOLS = frozenset({"get_current_time"})
+
+
+def normalize_text(text):
+    """全角・半角や空白の違いを吸収する"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def _content(message):
+    content = message.content
+    if isinstance(content, str):
+        return normalize_text(content)
+    return [normalize_text(p) if isinstance(p, str) else p for p in content]
+
+
+def _jsonable(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    return repr(value)
+
+
+def _digest(obj):
+    data = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=_jsonable)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+# ========================================
+# 保存先（完全一致）
+# ========================================
+
+class MemoryStore:
+    """プロセス内のLRUキャッシュ
+
+    Args:
+        max_entries: 保持する応答の数（超えたら最後に使われた時刻の古いものから削除）
+        ttl: 保存してから削除するまでの秒数（None で無期限）
+    """
+
+    def __init__(self, max_entries=10000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            message, created = item
+            if self.ttl is not None and time.time() - created > self.ttl:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return message
+
+    def put(self, key, message):
+        with self._lock:
+            self._items[key] = (message, time.time())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SqliteStore:
+    """SQLiteファイルに保存するLRUキャッシュ（プロセスを再起動しても残る）
+
+    Args:
+        path: データベースファイルのパス
+        max_entries: 保持する応答の数（超えたら最後に使われた時刻の古いものから削除）
+        ttl: 保存してから削除するまでの秒数（None で無期限）
+    """
+
+    def __init__(self, path="response_cache.sqlite", max_entries=100000, ttl=None):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                message TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+        """)
+        self._count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT message, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._count -= 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return messages_from_dict([json.loads(row[0])])[0]
+
+    def put(self, key, message):
+        data = json.dumps(messages_to_dict([message])[0], ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO responses VALUES (?, ?, ?, ?)", (key, data, now, now),
+            )
+            self._count += cur.rowcount
+            if self._count > self.max_entries:
+                excess = self._count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                    (excess,),
+                )
+                self._count -= excess
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        self._conn.close()
+
+
+# ========================================
+# 類似検索
+# ========================================
+
+def ngram_embedding(text, n=2):
+    """文字 n-gram の出現回数による埋め込み（外部のモデルを使わずに手元で計算できる）"""
+    text = normalize_text(text).lower()
+    grams = Counter(text[i:i + n] for i in range(max(1, len(text) - n + 1)))
+    norm = math.sqrt(sum(c * c for c in grams.values())) or 1.0
+    return {g: c / norm for g, c in grams.items()}
+
+
+def _cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+class SemanticIndex:
+    """埋め込みの類似度で応答のキーを探すインデックス
+
+    Args:
+        threshold: ヒットとみなすコサイン類似度
+        embed: テキスト -> {次元: 値} の正規化済み疎ベクトルを返す関数（省略時は文字 bigram）
+        max_entries: 保持するベクトルの数（超えたら古いものから削除）
+    """
+
+    def __init__(self, threshold=0.92, embed=ngram_embedding, max_entries=10000):
+        self.threshold = threshold
+        self.embed = embed
+        self.max_entries = max_entries
+        # 文脈のキー -> [(ベクトル, 応答のキー)]
+        self._partitions = {}
+        self._order = []
+        self._lock = threading.Lock()
+
+    def search(self, context, text):
+        vector = self.embed(text)
+        best, best_key = self.threshold, None
+        with self._lock:
+            for candidate, key in self._partitions.get(context, ()):
+                score = _cosine(vector, candidate)
+                if score >= best:
+                    best, best_key = score, key
+        return best_key
+
+    def add(self, context, text, key):
+        vector = self.embed(text)
+        with self._lock:
+            self._partitions.setdefault(context, []).append((vector, key))
+            self._order.append(context)
+            if len(self._order) > self.max_entries:
+                oldest = self._order.pop(0)
+                entries = self._partitions[oldest]
+                entries.pop(0)
+                if not entries:
+                    del self._partitions[oldest]
+
+
+# ========================================
+# キャッシュ付きチャットモデル
+# ========================================
+
+class CachedChatModel(BaseChatModel):
+    """応答をキャッシュするチャットモデルのラッパー
+
+    Attributes:
+        inner: 実際に応答を生成するチャットモデル
+        store: 完全一致の保存先（MemoryStore / SqliteStore など get/put を持つもの）
+        semantic: 類似検索のインデックス（None で無効）
+        bypass_tools: 結果が毎回変わるツール名。これらの呼び出しを含む会話はキャッシュしない
+    """
+
+    inner: BaseChatModel
+    store: Any = None
+    semantic: Optional[Any] = None
+    bypass_tools: frozenset = DEFAULT_BYPASS_TOOLS
+
+    _stats: dict = PrivateAttr(default_factory=lambda: dict.fromkeys(
+        ("exact_hits", "semantic_hits", "misses", "bypassed", "llm_calls", "llm_seconds", "saved_seconds"), 0,
+    ))
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context):
+        super().model_post_init(__context)
+        if self.store is None:
+            self.store = MemoryStore()
+
+    @property
+    def _llm_type(self):
+        return f"cached-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self):
+        return self.inner._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        # ツールの変換は包んでいるモデルに任せ、変換結果をこのモデルにバインドする
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def stats(self):
+        """ヒット・ミスの回数、ヒット率、ヒットによって省けた時間（LLM呼び出しの平均所要時間から推定）"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    # ---------- キーと検索 ----------
+
+    def _bypass(self, messages):
+        for m in messages:
+            if m.type == "tool" and m.name in self.bypass_tools:
+                return True
+            if any(tc["name"] in self.bypass_tools for tc in getattr(m, "tool_calls", None) or []):
+                return True
+        return False
+
+    def _keys(self, messages, stop, kwargs):
+        """(完全一致のキー, 類似検索の文脈キー, 類似検索するテキスト) を返す"""
+        params = {k: v for k, v in kwargs.items() if k != "cached_content"}
+        if name := kwargs.get("cached_content"):
+            # キャッシュ名はプロセスごとに変わるため、登録した内容のハッシュで置き換える
+            from common.prompt_cache import prefix_digest
+            params["cached_content"] = prefix_digest(name) or name
+        base = [self._identifying_params, stop, params]
+        normalized = [
+            (m.type, _content(m), [(tc["name"], tc["args"]) for tc in getattr(m, "tool_calls", None) or []])
+            for m in messages
+        ]
+        key = _digest(base + normalized)
+        if self.semantic is None or not messages or messages[-1].type != "human":
+            return key, None, None
+        return key, _digest(base + normalized[:-1]), normalized[-1][1]
+
+    def _lookup(self, messages, stop, kwargs):
+        """キャッシュを引く。(キャッシュの情報, ヒットした応答) を返す"""
+        if self._bypass(messages):
+            self._count("bypassed")
+            return None, None
+        key, context, text = self._keys(messages, stop, kwargs)
+        if (message := self.store.get(key)) is not None:
+            self._count("exact_hits")
+            return None, self._fresh(message, "exact")
+        if context is not None and isinstance(text, str):
+            similar = self.semantic.search(context, text)
+            if similar is not None and (message := self.store.get(similar)) is not None:
+                self._count("semantic_hits")
+                return None, self._fresh(message, "semantic")
+        self._count("misses")
+        return (key, context, text), None
+
+    def _fresh(self, message, tier):
+        """ヒットした応答を、新しいメッセージIDとtool_call IDで返す
+
+        同じIDのメッセージは add_messages で上書きされるため、IDは使い回さない。
+        """
+        with self._lock:
+            self._stats["saved_seconds"] += self._stats["llm_seconds"] / max(1, self._stats["llm_calls"])
+        return message.model_copy(update={
+            "id": None,
+            "tool_calls": [{**tc, "id": f"call_{uuid.uuid4().hex[:24]}"} for tc in message.tool_calls],
+            "usage_metadata": None,
+            "response_metadata": {**message.response_metadata, "response_cache": tier},
+        })
+
+    def _save(self, entry, message, elapsed):
+        with self._lock:
+            self._stats["llm_calls"] += 1
+            self._stats["llm_seconds"] += elapsed
+        if entry is None:
+            return
+        key, context, text = entry
+        self.store.put(key, message)
+        if context is not None and isinstance(text, str):
+            self.semantic.add(context, text, key)
+
+    @staticmethod
+    def _as_chunk(message):
+        return ChatGenerationChunk(message=AIMessageChunk(
+            content=message.content,
+            tool_call_chunks=[
+                {"name": tc["name"], "args": json.dumps(tc["args"], ensure_ascii=False),
+                 "id": tc["id"], "index": i, "type": "tool_call_chunk"}
+                for i, tc in enumerate(message.tool_calls)
+            ],
+            response_metadata=message.response_metadata,
+        ))
+
+    # ---------- 同期 ----------
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        entry, hit = self._lookup(messages, stop, kwargs)
+        if hit is not None:
+            return ChatResult(generations=[ChatGeneration(message=hit)])
+        t0 = time.perf_counter()
+        result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._save(entry, result.generations[0].message, time.perf_counter() - t0)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        entry, hit = self._lookup(messages, stop, kwargs)
+        if hit is not None:
+            chunk = self._as_chunk(hit)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            return
+        t0 = time.perf_counter()
+        final = None
+        for chunk in self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            final = chunk if final is None else final + chunk
+            yield chunk
+        if final is not None:
+            self._save(entry, message_chunk_to_message(final.message), time.perf_counter() - t0)
+
+    # ---------- 非同期 ----------
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        entry, hit = self._lookup(messages, stop, kwargs)
+        if hit is not None:
+            return ChatResult(generations=[ChatGeneration(message=hit)])
+        t0 = time.perf_counter()
+        result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._save(entry, result.generations[0].message, time.perf_counter() - t0)
+        return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        entry, hit = self._lookup(messages, stop, kwargs)
+        if hit is not None:
+            chunk = self._as_chunk(hit)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            return
+        t0 = time.perf_counter()
+        final = None
+        async for chunk in self.inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            final = chunk if final is None else final + chunk
+            yield chunk
+        if final is not None:
+            self._save(entry, message_chunk_to_message(final.message), time.perf_counter() - t0)
+
+
+def create_response_cache(model, kind=None):
+    """環境変数の設定で model を CachedChatModel で包む
+
+    - RESPONSE_CACHE: memory | sqlite
+    - RESPONSE_CACHE_DB: sqlite の保存先（既定: response_cache.sqlite）
+    - RESPONSE_CACHE_SIZE: 保持する応答の数
+    - RESPONSE_CACHE_TTL: 有効期間（秒）
+    - RESPONSE_CACHE_SEMANTIC: 類似検索のしきい値（指定した場合のみ類似検索を使う）
+    """
+    kind = kind or os.environ.get("RESPONSE_CACHE", "memory")
+    opts = {}
+    if os.environ.get("RESPONSE_CACHE_SIZE"):
+        opts["max_entries"] = int(os.environ["RESPONSE_CACHE_SIZE"])
+    if os.environ.get("RESPONSE_CACHE_TTL"):
+        opts["ttl"] = float(os.environ["RESPONSE_CACHE_TTL"])
+    if kind == "memory":
+        store = MemoryStore(**opts)
+    elif kind == "sqlite":
+        store = SqliteStore(os.environ.get("RESPONSE_CACHE_DB", "response_cache.sqlite"), **opts)
+    else:
+        raise ValueError(f"Unknown response cache: {kind!r} (available: ['memory', 'sqlite'])")
+    semantic = None
+    if os.environ.get("RESPONSE_CACHE_SEMANTIC"):
+        semantic = SemanticIndex(threshold=float(os.environ["RESPONSE_CACHE_SEMANTIC"]))
+    return CachedChatModel(inner=model, store=store, semantic=semantic)
@@ -0,0 +1,400 @@
+"""
+コンパイル済みのエージェントを HTTP / SSE で公開する ASGI サーバー
+
+エンドポイント（{name} はエージェント名、{thread_id} は会話のID）:
+    POST /agents/{name}/threads/{thread_id}/invoke   最後まで実行して結果を返す
+    POST /agents/{name}/threads/{thread_id}/stream   トークン単位の SSE（common/streaming.py のイベント）
+    GET  /agents/{name}/threads/{thread_id}/state    チェックポイントの状態（チェックポインター付きのみ）
+    GET  /health                                     実行中・待機中の件数など
+    GET  /metrics                                    Prometheus のテキスト形式（トレースが有効なときだけ。common/tracing.py）
+
+リクエストの本文:
+    {"message": "東京の天気を教えて"}   ユーザーの発話を1つ送る
+    {"resume": true}                   interrupt で止まったところから再開する（Chapter 5 の承認）
+    "budget": {"max_iterations": 5, "timeout": 30, "max_tokens": 20000}
+                                       を加えると、この実行の予算になる（common/budget.py。
+                                       timeout はリクエストを受け付けてからの秒数。省略時は --timeout）
+
+- 同じ thread_id へのリクエストは到着順に1つずつ実行し、異なる thread_id は並行に実行する
+- 1スレッドあたりの待ち行列（max_queue）と全体の同時受付数（max_pending）を超えたら 429 を返す
+- SSE は keepalive 秒ごとにコメント行を送り、待ち行列やLLMの待ちで接続が切られないようにする
+- クライアントが切断したら実行を取り消す
+
+起動（uvicorn が必要: pip install uvicorn）:
+    python3 common/server.py --port 8000
+    LLM_BACKEND=fake python3 common/server.py
+
+    curl -X POST localhost:8000/agents/multi_tools/threads/t1/invoke -d '{"message": "12かける8は？"}'
+    curl -N -X POST localhost:8000/agents/memory/threads/t1/stream -d '{"message": "私の名前は太郎です"}'
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from common.budget import with_budget
+from common.graph_registry import registry
+from common.rate_limit import status_code
+from common.streaming import ChatStream
+
+_ROUTE = re.compile(r"^/agents/(?P<name>[^/]+)/threads/(?P<thread_id>[^/]+)/(?P<action>invoke|stream|state)$")
+
+
+class HTTPError(Exception):
+    """エラー応答（status と {"error": メッセージ} の JSON を返す）"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or []
+
+
+class _Disconnected(Exception):
+    """クライアントが切断した"""
+
+
+def message_json(message):
+    """メッセージを JSON にできる dict にする"""
+    data = {"type": message.type, "content": message.content, "id": message.id}
+    if getattr(message, "tool_calls", None):
+        data["tool_calls"] = [{"name": tc["name"], "args": tc["args"], "id": tc["id"]} for tc in message.tool_calls]
+    if message.type == "tool":
+        data.update(name=message.name, tool_call_id=message.tool_call_id)
+    return data
+
+
+def _to_json(value):
+    if hasattr(value, "type") and hasattr(value, "content"):
+        return message_json(value)
+    if isinstance(value, dict):
+        return {k: _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+class _Lane:
+    """1つの thread_id の実行順を守るロックと、待っているリクエストの数"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiting = 0
+
+
+class AgentServer:
+    """エージェントを公開する ASGI アプリケーション
+
+    Args:
+        agents: エージェント名 -> コンパイル済みのグラフ
+        max_queue: 1つの thread_id で実行中・待機中にできるリクエストの数
+        max_pending: 全体で実行中・待機中にできるリクエストの数
+        keepalive: SSE でコメント行を送る間隔（秒）
+        timeout: 本文で budget の timeout を省略したときの、1回の実行の締め切り（秒。None なら締め切りなし）
+    """
+
+    def __init__(self, agents, max_queue=4, max_pending=256, keepalive=15.0, timeout=None):
+        self.agents = dict(agents)
+        self.max_queue = max_queue
+        self.max_pending = max_pending
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self._lanes = {}
+        self._pending = 0
+        self._stats = dict.fromkeys(("requests", "rejected", "errors", "cancelled"), 0)
+
+    def stats(self):
+        return {**self._stats, "pending": self._pending, "threads": len(self._lanes)}
+
+    # ---------- ASGI ----------
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while (message := await receive())["type"] != "lifespan.shutdown":
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+        if scope["type"] != "http":
+            return
+        try:
+            await self._dispatch(scope, receive, send)
+        except HTTPError as e:
+            await self._send_json(send, e.status, {"error": str(e)}, e.headers)
+        except _Disconnected:
+            self._stats["cancelled"] += 1
+
+    async def _dispatch(self, scope, receive, send):
+        method, path = scope["method"], scope["path"]
+        if path == "/health" and method == "GET":
+            return await self._send_json(send, 200, {"status": "ok", **self.stats()})
+        if path == "/metrics" and method == "GET":
+            return await self._metrics(send)
+        match = _ROUTE.match(path)
+        if match is None:
+            raise HTTPError(404, f"not found: {path}")
+        name, thread_id, action = match["name"], match["thread_id"], match["action"]
+        agent = self.agents.get(name)
+        if agent is None:
+            raise HTTPError(404, f"unknown agent: {name!r} (available: {sorted(self.agents)})")
+        config = {"configurable": {"thread_id": thread_id}}
+
+        if action == "state":
+            if method != "GET":
+                raise HTTPError(405, "use GET")
+            return await self._send_json(send, 200, await self._state(agent, config))
+        if method != "POST":
+            raise HTTPError(405, "use POST")
+        data = self._json(await self._read_body(receive))
+        inputs = self._inputs(data)
+        config = self._budget(config, data.get("budget"))
+        if action == "invoke":
+            await self._invoke(agent, inputs, config, (name, thread_id), receive, send)
+        else:
+            await self._stream(agent, inputs, config, (name, thread_id), receive, send)
+
+    def _budget(self, config, budget):
+        """本文の budget（省略した timeout はサーバーの既定）を config に入れる"""
+        budget = {} if budget is None else budget
+        if not isinstance(budget, dict) or set(budget) - {"max_iterations", "timeout", "max_tokens"}:
+            raise HTTPError(400, 'budget must be {"max_iterations": ..., "timeout": ..., "max_tokens": ...}')
+        budget = {"timeout": self.timeout, **budget}
+        if all(v is None for v in budget.values()):
+            return config
+        return with_budget(config, **budget)
+
+    @staticmethod
+    async def _read_body(receive):
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise _Disconnected
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                return body
+
+    @staticmethod
+    def _json(body):
+        try:
+            data = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            raise HTTPError(400, f"invalid JSON: {e}")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "body must be a JSON object")
+        return data
+
+    @staticmethod
+    def _inputs(data):
+        if data.get("resume"):
+            return None
+        if not isinstance(data.get("message"), str):
+            raise HTTPError(400, 'body must be {"message": "..."} or {"resume": true}')
+        return {"messages": [("user", data["message"])]}
+
+    @staticmethod
+    async def _state(agent, config):
+        if agent.checkpointer is None:
+            raise HTTPError(404, "this agent has no checkpointer")
+        state = await agent.aget_state(config)
+        return {"values": _to_json(state.values), "next": list(state.next)}
+
+    # ---------- スレッドごとの直列化 ----------
+
+    def _enter(self, key):
+        """待ち行列に入る。いっぱいなら 429"""
+        lane = self._lanes.get(key)
+        if self._pending >= self.max_pending or (lane is not None and lane.waiting >= self.max_queue):
+            self._stats["rejected"] += 1
+            raise HTTPError(429, "too many requests, retry later", [(b"retry-after", b"1")])
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        lane.waiting += 1
+        self._pending += 1
+        self._stats["requests"] += 1
+        return lane
+
+    def _leave(self, key, lane):
+        lane.waiting -= 1
+        self._pending -= 1
+        if lane.waiting == 0:
+            # 使われていないスレッドの情報は残さない
+            self._lanes.pop(key, None)
+
+    async def _run_in_lane(self, key, coro_fn, receive):
+        """同じ thread_id の前のリクエストが終わるのを待ってから実行する（切断されたら取り消す）"""
+        lane = self._enter(key)
+        try:
+            async with lane.lock:
+                return await _cancel_on_disconnect(coro_fn(), receive)
+        finally:
+            self._leave(key, lane)
+
+    # ---------- invoke ----------
+
+    async def _invoke(self, agent, inputs, config, key, receive, send):
+        async def run():
+            result = await agent.ainvoke(inputs, config)
+            body = {"values": _to_json(result)}
+            if agent.checkpointer is not None:
+                body["next"] = list((await agent.aget_state(config)).next)
+            return body
+
+        try:
+            body = await self._run_in_lane(key, run, receive)
+        except (HTTPError, _Disconnected):
+            raise
+        except Exception as e:
+            self._stats["errors"] += 1
+            raise HTTPError(429 if status_code(e) == 429 else 500, f"{type(e).__name__}: {e}")
+        await self._send_json(send, 200, body)
+
+    # ---------- stream (SSE) ----------
+
+    async def _stream(self, agent, inputs, config, key, receive, send):
+        lane = self._enter(key)
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        events = asyncio.Queue()
+
+        async def produce():
+            try:
+                async with lane.lock:
+                    stream = ChatStream(agent, inputs, config)
+                    async for event in stream:
+                        await events.put(event)
+                    if agent.checkpointer is not None:
+                        stats = {**stream.stats, "next": list((await agent.aget_state(config)).next)}
+                    else:
+                        stats = stream.stats
+                    await events.put(("end", None, stats))
+            except Exception as e:
+                self._stats["errors"] += 1
+                await events.put(("error", None, {"error": f"{type(e).__name__}: {e}", "status": status_code(e)}))
+
+        producer = asyncio.create_task(produce())
+        watcher = asyncio.create_task(_wait_disconnect(receive))
+        try:
+            while True:
+                getter = asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait({getter, watcher}, timeout=self.keepalive,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if watcher in done:
+                    getter.cancel()
+                    self._stats["cancelled"] += 1
+                    return
+                if getter not in done:
+                    getter.cancel()
+                    await _send_chunk(send, b": keep-alive\n\n")
+                    continue
+                kind, node, data = getter.result()
+                payload = {"node": node, "data": _to_json(data)} if node is not None else _to_json(data)
+                await _send_chunk(send, _sse(kind, payload))
+                if kind in ("end", "error"):
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+                    return
+        finally:
+            producer.cancel()
+            watcher.cancel()
+            await asyncio.gather(producer, watcher, return_exceptions=True)
+            self._leave(key, lane)
+
+    @staticmethod
+    async def _metrics(send):
+        tracer = sys.modules["common.tracing"].current_tracer() if "common.tracing" in sys.modules else None
+        if tracer is None:
+            raise HTTPError(404, "tracing is disabled (set TRACE_FILE or TRACE_METRICS_PORT)")
+        data = tracer.metrics_text().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+                        (b"content-length", str(len(data)).encode())],
+        })
+        await send({"type": "http.response.body", "body": data})
+
+    # ---------- 応答 ----------
+
+    @staticmethod
+    async def _send_json(send, status, body, headers=()):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json; charset=utf-8"),
+                        (b"content-length", str(len(data)).encode()), *headers],
+        })
+        await send({"type": "http.response.body", "body": data})
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def _send_chunk(send, body):
+    await send({"type": "http.response.body", "body": body, "more_body": True})
+
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _cancel_on_disconnect(coro, receive):
+    """coro を実行し、先にクライアントが切断したら取り消す"""
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.create_task(_wait_disconnect(receive))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if not task.done():
+            raise _Disconnected
+        return task.result()
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+
+
+def load_agents(names=None):
+    """共有のレジストリ（common/graph_registry.py）からエージェントを取り出す（names で絞り込み）"""
+    return {name: registry.get(name) for name in names or registry.names()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--agents", nargs="+", choices=registry.names(), help="公開するエージェント（既定: すべて）")
+    parser.add_argument("--max-queue", type=int, default=4)
+    parser.add_argument("--max-pending", type=int, default=256)
+    parser.add_argument("--keepalive", type=float, default=15.0)
+    parser.add_argument("--timeout", type=float, help="1回の実行の締め切り（秒）。本文の budget で上書きできる")
+    parser.add_argument("--warm-up", metavar="MESSAGE",
+                        help="起動時にこの発話で各エージェントを1回実行してから受け付ける（LLMが呼ばれる）")
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("uvicorn が必要です: pip install uvicorn")
+    # リクエストを受ける前に、読み込み・コンパイル・LLMの生成を済ませる
+    seconds = registry.warm_up(args.agents, sample=args.warm_up)
+    print(f"warm-up: {seconds:.2f}秒 {registry.stats()}", file=sys.stderr)
+    app = AgentServer(load_agents(args.agents), max_queue=args.max_queue,
+                      max_pending=args.max_pending, keepalive=args.keepalive, timeout=args.timeout)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
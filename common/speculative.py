@@ -0,0 +1,172 @@
+"""
+ツールの投機実行（LLMの応答を受け取り終わる前に、引数がそろったツール呼び出しを実行し始める）
+
+ツールを使うループでは、chatbot ノードが AIMessage を最後まで受け取ってから tools ノードがツールを実行します。
+ストリーミングで受け取ると、tool_call の引数は応答の終わりより前にそろうことがよくあります
+（複数の tool_calls の前の方・本文が後に続く場合・Gemini のように呼び出し単位で届く場合）。
+SpeculativeToolCalls は
+
+- chatbot ノードの中でLLMの応答をストリーミングで受け取り
+- tool_call のチャンクに id と名前があり、引数が JSON のオブジェクトとして読めた時点で、
+  safe に指定したツールだけを ParallelToolNode のスレッドプール（非同期ならタスク）で実行し始め
+  （同時実行数の上限は tools ノードと共有する）
+- tools ノード（ParallelToolNode）は、id・名前・引数が同じ呼び出しの結果をそこから受け取る
+
+- 最終的な応答にない・引数が変わった呼び出しの結果は捨てる（実行は済んでいるので、
+  safe には副作用のないツールだけを指定する）
+- safe にないツールはこれまでどおり tools ノードで実行する
+- 環境変数 SPECULATIVE_TOOLS=1 で有効（無効のときは model.invoke をそのまま呼ぶ）
+
+例:
+    tool_node = ParallelToolNode(tools)
+    speculation = SpeculativeToolCalls(tool_node, safe=[add, multiply, search_weather])
+
+    def chatbot(state: State):
+        return {"messages": [speculation.invoke(llm_with_tools, state["messages"])]}
+
+注意: 承認（interrupt_before）で止めるツールを safe に入れないでください。
+投機実行は tools ノードの前の interrupt では止まりません。
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.messages import message_chunk_to_message
+from langchain_core.runnables import ensure_config
+
+
+def _ready_calls(chunk, started):
+    """これまでに受け取ったチャンクのうち、引数がそろった（まだ実行していない）tool_call を返す"""
+    for tc in chunk.tool_call_chunks:
+        if not tc.get("id") or not tc.get("name") or tc["id"] in started:
+            continue
+        try:
+            args = json.loads(tc.get("args") or "")
+        except ValueError:
+            continue
+        if isinstance(args, dict):
+            yield {"name": tc["name"], "args": args, "id": tc["id"], "type": "tool_call"}
+
+
+class SpeculativeToolCalls:
+    """ストリーミング中に安全なツールを実行し始め、結果を tools ノードに渡す
+
+    Args:
+        tool_node: 結果を受け取る ParallelToolNode（実行にもこのノードのスレッドプールを使う）
+        safe: 投機実行してよいツール（ツールまたはツール名）。副作用がなく、承認の要らないものだけ
+        enabled: False で投機実行しない（省略時は環境変数 SPECULATIVE_TOOLS、既定で無効）
+        max_pending: 受け取られていない結果を保持する上限（超えたら古いものから捨てる）
+    """
+
+    def __init__(self, tool_node, safe, enabled=None, max_pending=256):
+        self.tool_node = tool_node
+        self.safe = {t if isinstance(t, str) else t.name for t in safe}
+        unknown = self.safe - set(tool_node.tools_by_name)
+        if unknown:
+            raise ValueError(f"unknown tools: {sorted(unknown)}")
+        if enabled is None:
+            enabled = os.environ.get("SPECULATIVE_TOOLS", "").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        self.max_pending = max_pending
+        # tool_call_id -> (ツール名, 引数, Future またはタスク, 実行し始めた時刻)
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"started": 0, "used": 0, "discarded": 0, "head_start_seconds": 0.0}
+        tool_node.speculation = self
+
+    # ---------- 結果の登録と受け取り ----------
+
+    def _start(self, call, future):
+        with self._lock:
+            self._pending[call["id"]] = (call["name"], call["args"], future, time.monotonic())
+            self._stats["started"] += 1
+            while len(self._pending) > self.max_pending:
+                _, (_, _, old, _) = self._pending.popitem(last=False)
+                old.cancel()
+                self._stats["discarded"] += 1
+
+    def _discard(self, call_id):
+        with self._lock:
+            entry = self._pending.pop(call_id, None)
+            if entry is not None:
+                entry[2].cancel()
+                self._stats["discarded"] += 1
+
+    def take(self, call):
+        """id・名前・引数が一致する投機実行の Future（またはタスク）を返す（なければ None）"""
+        with self._lock:
+            entry = self._pending.pop(call["id"], None)
+            if entry is None:
+                return None
+            name, args, future, started = entry
+            if name != call["name"] or args != call["args"]:
+                future.cancel()
+                self._stats["discarded"] += 1
+                return None
+            self._stats["used"] += 1
+            # tools ノードが実行し始めるはずだった時点までに、先に進めておけた時間
+            self._stats["head_start_seconds"] += time.monotonic() - started
+            return future
+
+    def _settle(self, message, started):
+        """最終的な応答と食い違う（ない・名前や引数が違う）投機実行の結果を捨てる"""
+        final = {tc["id"]: tc for tc in message.tool_calls}
+        for call_id in started:
+            tc = final.get(call_id)
+            with self._lock:
+                entry = self._pending.get(call_id)
+            if entry is not None and (tc is None or (tc["name"], tc["args"]) != entry[:2]):
+                self._discard(call_id)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "pending": len(self._pending)}
+
+    # ---------- 同期 ----------
+
+    def invoke(self, model, messages, config=None):
+        """model をストリーミングで呼び出し、引数がそろった安全なツールを実行し始めながら AIMessage を返す"""
+        if not self.enabled:
+            return model.invoke(messages, config)
+        config = ensure_config(config)
+        started, full = [], None
+        try:
+            for chunk in model.stream(messages, config):
+                full = chunk if full is None else full + chunk
+                for call in _ready_calls(full, started):
+                    started.append(call["id"])
+                    if call["name"] in self.safe:
+                        self._start(call, self.tool_node.submit(call, config))
+        except BaseException:
+            for call_id in started:
+                self._discard(call_id)
+            raise
+        message = message_chunk_to_message(full)
+        self._settle(message, started)
+        return message
+
+    # ---------- 非同期 ----------
+
+    async def ainvoke(self, model, messages, config=None):
+        """invoke の非同期版（ツールはイベントループのタスクとして実行し始める）"""
+        if not self.enabled:
+            return await model.ainvoke(messages, config)
+        config = ensure_config(config)
+        started, full = [], None
+        try:
+            async for chunk in model.astream(messages, config):
+                full = chunk if full is None else full + chunk
+                for call in _ready_calls(full, started):
+                    started.append(call["id"])
+                    if call["name"] in self.safe:
+                        # 同時実行数の上限は tools ノードと共有する（ParallelToolNode のセマフォ）
+                        self._start(call, self.tool_node.asubmit(call, config))
+        except BaseException:
+            for call_id in started:
+                self._discard(call_id)
+            raise
+        message = message_chunk_to_message(full)
+        self._settle(message, started)
+        return message
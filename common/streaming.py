@@ -0,0 +1,155 @@
+"""
+トークン単位のストリーミング実行
+
+graph.stream(...) を既定（ノード単位の updates）で回すと、LLMの応答が最後まで生成されるまで
+何も表示されません。ChatStream は stream_mode=["messages", "updates"] で実行し、
+LLMのトークンを届いた順に返しつつ、ノードの完了（遷移）も報告します。
+初回トークンまでの時間（TTFT）と全体の所要時間も計測します。
+
+イベントは (種類, ノード名, データ) のタプルです。
+- ("token", node, text): LLMが生成したテキストの断片
+- ("tool_call", node, name): LLMがツール呼び出しを生成し始めた
+- ("update", node, update): ノードが完了した（interrupt で停止した場合は node が "__interrupt__"）
+
+例:
+    stream = ChatStream(graph, {"messages": [("user", "こんにちは")]})
+    for kind, node, data in stream:
+        if kind == "token":
+            print(data, end="", flush=True)
+    print(stream.stats)  # {"ttft_s": ..., "total_s": ..., "tokens": ...}
+
+    # 表示まで任せる場合
+    print_stream(graph, {"messages": [("user", "こんにちは")]})
+"""
+import sys
+import time
+
+from langchain_core.messages import AIMessageChunk
+
+STREAM_MODE = ["messages", "updates"]
+
+
+class ChatStream:
+    """グラフをトークン単位でストリーミング実行する（for / async for の両方で使える）
+
+    Args:
+        graph: コンパイル済みのグラフ
+        inputs: グラフへの入力（再開する場合は None）
+        config: 実行時の config（thread_id など）
+        nodes: トークンを返すノード名（None ですべて）。要約ノードなど、表示したくないLLM呼び出しを除く
+
+    実行後の stats:
+        ttft_s: 初回トークン（テキスト）までの秒数（テキストがなければ None）
+        first_chunk_s: LLMの最初の出力（ツール呼び出しを含む）までの秒数
+        total_s: 全体の秒数
+        tokens: 受け取ったテキストの断片の数
+        llm_messages: LLMが生成したメッセージの数
+    """
+
+    def __init__(self, graph, inputs, config=None, nodes=None):
+        self.graph = graph
+        self.inputs = inputs
+        self.config = config
+        self.nodes = set(nodes) if nodes is not None else None
+        self.stats = {}
+
+    def _begin(self):
+        self._started = time.perf_counter()
+        self._message_ids = set()
+        self.stats = {"ttft_s": None, "first_chunk_s": None, "total_s": None, "tokens": 0, "llm_messages": 0}
+
+    def _events(self, mode, payload):
+        """stream の1要素を、このクラスのイベントに変換する"""
+        if mode == "updates":
+            for node, update in payload.items():
+                yield "update", node, update
+            return
+        chunk, metadata = payload
+        node = metadata.get("langgraph_node")
+        if not isinstance(chunk, AIMessageChunk) or (self.nodes is not None and node not in self.nodes):
+            return
+        elapsed = time.perf_counter() - self._started
+        if chunk.id not in self._message_ids:
+            self._message_ids.add(chunk.id)
+            self.stats["llm_messages"] += 1
+        for tc in chunk.tool_call_chunks:
+            if self.stats["first_chunk_s"] is None:
+                self.stats["first_chunk_s"] = elapsed
+            if tc.get("name"):
+                yield "tool_call", node, tc["name"]
+        text = chunk.text if isinstance(chunk.text, str) else chunk.text()
+        if text:
+            if self.stats["ttft_s"] is None:
+                self.stats["ttft_s"] = elapsed
+            if self.stats["first_chunk_s"] is None:
+                self.stats["first_chunk_s"] = elapsed
+            self.stats["tokens"] += 1
+            yield "token", node, text
+
+    def __iter__(self):
+        self._begin()
+        for mode, payload in self.graph.stream(self.inputs, self.config, stream_mode=STREAM_MODE):
+            yield from self._events(mode, payload)
+        self.stats["total_s"] = time.perf_counter() - self._started
+
+    async def __aiter__(self):
+        self._begin()
+        async for mode, payload in self.graph.astream(self.inputs, self.config, stream_mode=STREAM_MODE):
+            for event in self._events(mode, payload):
+                yield event
+        self.stats["total_s"] = time.perf_counter() - self._started
+
+
+class _Printer:
+    """イベントを端末に表示する（トークンは改行せずに続けて表示する）"""
+
+    def __init__(self, label, show_nodes, show_stats, file):
+        self.label = label
+        self.show_nodes = show_nodes
+        self.show_stats = show_stats
+        self.file = file
+        self._in_text = False
+
+    def _end_line(self):
+        if self._in_text:
+            print(file=self.file)
+            self._in_text = False
+
+    def __call__(self, kind, node, data):
+        if kind == "token":
+            if not self._in_text:
+                print(f"{self.label}: ", end="", file=self.file)
+                self._in_text = True
+            print(data, end="", flush=True, file=self.file)
+        elif kind == "update" and self.show_nodes and not node.startswith("__"):
+            self._end_line()
+            print(f"[{node}] 完了", file=self.file)
+
+    def finish(self, stats):
+        self._end_line()
+        if self.show_stats:
+            ttft = f"{stats['ttft_s']:.2f}秒" if stats["ttft_s"] is not None else "-"
+            print(f"（初回トークン: {ttft} / 合計: {stats['total_s']:.2f}秒 / {stats['tokens']}トークン）",
+                  file=self.file)
+
+
+def print_stream(graph, inputs, config=None, nodes=None, label="Assistant", show_nodes=True,
+                 show_stats=True, file=None):
+    """トークンを届いた順に表示しながらグラフを実行し、stats を返す"""
+    printer = _Printer(label, show_nodes, show_stats, file or sys.stdout)
+    stream = ChatStream(graph, inputs, config, nodes)
+    for event in stream:
+        printer(*event)
+    printer.finish(stream.stats)
+    return stream.stats
+
+
+async def aprint_stream(graph, inputs, config=None, nodes=None, label="Assistant", show_nodes=True,
+                        show_stats=True, file=None):
+    """print_stream の非同期版（graph.astream で実行する）"""
+    printer = _Printer(label, show_nodes, show_stats, file or sys.stdout)
+    stream = ChatStream(graph, inputs, config, nodes)
+    async for event in stream:
+        printer(*event)
+    printer.finish(stream.stats)
+    return stream.stats
@@ -0,0 +1,110 @@
+"""
+純粋なツールの結果のキャッシュ
+
+add / multiply のように同じ引数なら同じ結果を返すツールや、search_weather のように
+結果がゆっくりしか変わらないツールは、エージェントのループの中やスレッドをまたいで
+同じ引数で何度も呼ばれることがあります。cacheable で印を付けたツールは、
+ParallelToolNode（common/tool_node.py）が2回目以降の呼び出しをキャッシュから返します
+（ToolMessage の tool_call_id は呼び出しごとに正しく設定されます）。
+
+- ttl: 結果を使い回す秒数（None で無期限）
+- max_entries: ツールごとに保持する結果の数（超えたら最後に使われた時刻の古いものから削除）
+- エラーになった呼び出しはキャッシュしない
+- cache_stats(tools) でヒット数・ミス数・省けた実行時間などを確認できる
+
+例:
+    @cacheable(ttl=600)
+    @tool
+    def search_weather(city: str) -> str:
+        ...
+"""
+import json
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+# id(ツール) -> ToolCache。tool.metadata はコールバックやイベントにそのまま渡るため、キャッシュは外に持つ。
+# ツール（pydantic のモデル）はハッシュできず WeakKeyDictionary のキーにできないので、
+# id で引き、ツールが破棄されたら weakref.finalize でエントリを消す
+_caches = {}
+
+
+class ToolCache:
+    """1つのツールの結果のキャッシュ
+
+    Args:
+        ttl: 結果を使い回す秒数（None で無期限）
+        max_entries: 保持する結果の数
+    """
+
+    def __init__(self, ttl=None, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # 引数のキー -> (content, artifact, 保存した時刻, 実行にかかった秒数)
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(("hits", "misses", "evictions", "expired", "saved_seconds"), 0)
+
+    @staticmethod
+    def key(args):
+        return json.dumps(args, sort_keys=True, ensure_ascii=False, default=repr)
+
+    def get(self, args):
+        """キャッシュされた (content, artifact) を返す。なければ None"""
+        key = self.key(args)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and self.ttl is not None and time.monotonic() - item[2] > self.ttl:
+                del self._items[key]
+                self._stats["expired"] += 1
+                item = None
+            if item is None:
+                self._stats["misses"] += 1
+                return None
+            self._items.move_to_end(key)
+            self._stats["hits"] += 1
+            self._stats["saved_seconds"] += item[3]
+            return item[0], item[1]
+
+    def put(self, args, content, artifact=None, elapsed=0.0):
+        key = self.key(args)
+        with self._lock:
+            self._items[key] = (content, artifact, time.monotonic(), elapsed)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._items)}
+
+
+def cacheable(tool=None, *, ttl=None, max_entries=1024):
+    """ツールの結果をキャッシュしてよいことを示すデコレーター（@tool の上に付ける）
+
+    @cacheable と @cacheable(ttl=600) のどちらの書き方もできます。
+    """
+    def mark(t):
+        key = id(t)
+        if key not in _caches:
+            weakref.finalize(t, _caches.pop, key, None)
+        _caches[key] = ToolCache(ttl=ttl, max_entries=max_entries)
+        return t
+
+    return mark if tool is None else mark(tool)
+
+
+def tool_cache(tool):
+    """ツールのキャッシュ（cacheable でないツールは None）"""
+    return _caches.get(id(tool)) if tool is not None else None
+
+
+def cache_stats(tools):
+    """ツール名 -> キャッシュの統計（cacheable なツールのみ）"""
+    return {t.name: cache.stats() for t in tools if (cache := tool_cache(t)) is not None}
@@ -0,0 +1,234 @@
+"""
+複数の tool_calls を並列に実行するツールノード
+
+LLMが1回の応答で複数のツール呼び出しを返したとき（例: 天気検索と時刻取得）、
+それらを同時に実行して待ち時間を短くします。ToolNode(tools) の置き換えとして使えます。
+
+- 同期実行（invoke / stream）: 上限付きのスレッドプールで実行
+- 非同期実行（ainvoke / astream）: asyncio.gather で実行（イベントループごとに1つのセマフォで同時実行数を制限）
+- 同時実行数の上限はノード全体で共有する（投機実行した呼び出しも同じスレッドプール・セマフォを使う）
+- ツールごとのタイムアウト（超えた呼び出しはエラーの ToolMessage になる）。
+  実行し始めた時点から数え、同時実行数の上限による待ち時間は含めない
+- 実行の締め切り（common/budget.py の予算）までの残り時間を、タイムアウトの上限にする
+- 結果は元の tool_calls の順番で返す
+- cacheable（common/tool_cache.py）で印を付けたツールは、同じ引数の呼び出しをキャッシュから返す
+- SpeculativeToolCalls（common/speculative.py）が先に実行し始めた呼び出しは、その結果を受け取る
+
+例:
+    builder.add_node("tools", ParallelToolNode(tools, max_concurrency=4, timeouts={"search_weather": 5.0}))
+
+注意: InjectedState などのlanggraph固有の引数注入には対応していません。
+"""
+import asyncio
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+from common.budget import remaining
+from common.tool_cache import cache_stats, tool_cache
+
+
+class ParallelToolNode(RunnableLambda):
+    """tool_calls を並列に実行するノード（ToolNode の置き換え）
+
+    Args:
+        tools: ツールのリスト
+        max_concurrency: 同時に実行するツール呼び出しの上限
+        timeouts: ツール名 -> タイムアウト秒数
+        default_timeout: timeouts にないツールのタイムアウト秒数（None なら無制限）
+        name: ノード名
+    """
+
+    def __init__(self, tools, max_concurrency=8, timeouts=None, default_timeout=None, name="tools"):
+        self.tools_by_name = {t.name: t for t in tools}
+        self.max_concurrency = max_concurrency
+        self.timeouts = dict(timeouts or {})
+        self.default_timeout = default_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="tool")
+        # イベントループ -> セマフォ（非同期実行の同時実行数の上限。スレッドプールと同じくノード全体で共有する）
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._semaphores_lock = threading.Lock()
+        # SpeculativeToolCalls が設定する（投機実行した呼び出しの結果の受け取り先）
+        self.speculation = None
+        super().__init__(self._run, afunc=self._arun, name=name)
+
+    # ---------- 共通 ----------
+
+    def _tool_calls(self, state):
+        messages = state["messages"] if isinstance(state, dict) else state
+        return messages[-1].tool_calls
+
+    def _timeout(self, name):
+        return self.timeouts.get(name, self.default_timeout)
+
+    def _limit(self, name, config):
+        """(タイムアウト秒数, 実行の締め切りで決まったか)"""
+        timeout, left = self._timeout(name), remaining(config)
+        if left is not None and (timeout is None or left < timeout):
+            return max(0.0, left), True
+        return timeout, False
+
+    def _error(self, call, content):
+        return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"], status="error")
+
+    def _invalid(self, call):
+        return self._error(
+            call, f"Error: {call['name']} is not a valid tool, try one of [{', '.join(self.tools_by_name)}].",
+        )
+
+    def _timed_out(self, call):
+        return self._error(call, f"Error: {call['name']} timed out after {self._timeout(call['name'])} seconds.")
+
+    def _past_deadline(self, call):
+        return self._error(call, f"Error: {call['name']} was cancelled because the run's deadline was exceeded.")
+
+    def _failed(self, call, e):
+        return self._error(call, f"Error: {e!r}\n Please fix your mistakes.")
+
+    def _to_message(self, call, output):
+        if isinstance(output, ToolMessage):
+            return output
+        return ToolMessage(content=str(output), name=call["name"], tool_call_id=call["id"])
+
+    def cache_stats(self):
+        """cacheable なツールごとのキャッシュの統計"""
+        return cache_stats(self.tools_by_name.values())
+
+    def _cached(self, call):
+        """キャッシュにあれば、この呼び出しの tool_call_id を付けた ToolMessage を返す"""
+        cache = tool_cache(self.tools_by_name.get(call["name"]))
+        if cache is None or (hit := cache.get(call["args"])) is None:
+            return None
+        content, artifact = hit
+        return ToolMessage(content=content, artifact=artifact, name=call["name"], tool_call_id=call["id"])
+
+    def _remember(self, call, message, elapsed):
+        cache = tool_cache(self.tools_by_name[call["name"]])
+        if cache is not None and message.status != "error":
+            cache.put(call["args"], message.content, message.artifact, elapsed)
+
+    def _speculated(self, call):
+        """投機実行済みで id・名前・引数が一致する呼び出しがあれば、その Future（またはタスク）を返す"""
+        return None if self.speculation is None else self.speculation.take(call)
+
+    # ---------- 同期 ----------
+
+    def _run_one(self, call, config, started):
+        # タイムアウトはスレッドで実行し始めた時点から数える（プールの空き待ちは含めない）
+        started.set_result(time.monotonic())
+        t0 = time.perf_counter()
+        try:
+            message = self._to_message(
+                call, self.tools_by_name[call["name"]].invoke({**call, "type": "tool_call"}, config),
+            )
+        except Exception as e:
+            return self._failed(call, e)
+        self._remember(call, message, time.perf_counter() - t0)
+        return message
+
+    def submit(self, call, config):
+        """1つの呼び出しをスレッドプールで実行し始め、ToolMessage を返す Future を返す"""
+        if (cached := self._cached(call)) is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+        return self._submit(call, config)
+
+    def _submit(self, call, config):
+        started = Future()
+        future = self._executor.submit(self._run_one, call, config, started)
+        # 実行し始めた時刻（time.monotonic()）を返す Future
+        future.started = started
+        return future
+
+    def _wait(self, call, future, config):
+        """submit した呼び出しの結果を、タイムアウト・締め切りまで待つ"""
+        timeout, by_deadline = self._limit(call["name"], config)
+        started = getattr(future, "started", None)
+        try:
+            if by_deadline or timeout is None or started is None:
+                # 締め切りは時刻なので、空き待ちの時間も含めて今から数える
+                return future.result(timeout=timeout)
+            # 実行し始めるまでは、締め切りがあればそれまで待つ
+            left = remaining(config)
+            by_deadline = left is not None
+            begun = started.result(timeout=None if left is None else max(0.0, left))
+            # 実行し始めてから timeout 秒（締め切りの方が早ければ締め切り）まで待つ
+            wait, left = begun + timeout - time.monotonic(), remaining(config)
+            by_deadline = left is not None and left < wait
+            return future.result(timeout=max(0.0, min(wait, left) if by_deadline else wait))
+        except FutureTimeoutError:
+            # スレッドは中断できないため、結果を待たずにエラーとして扱う（まだ始まっていなければ取り消す）
+            future.cancel()
+            return self._past_deadline(call) if by_deadline else self._timed_out(call)
+
+    def _run(self, state, config):
+        calls = self._tool_calls(state)
+        # キャッシュにある呼び出しはスレッドプールに渡さずその場で返す
+        pending = []
+        for call in calls:
+            if call["name"] not in self.tools_by_name:
+                pending.append(self._invalid(call))
+            elif isinstance(speculated := self._speculated(call), Future):
+                pending.append(speculated)
+            elif (cached := self._cached(call)) is not None:
+                pending.append(cached)
+            else:
+                pending.append(self._submit(call, config))
+        messages = [
+            future if isinstance(future, ToolMessage) else self._wait(call, future, config)
+            for call, future in zip(calls, pending)
+        ]
+        return {"messages": messages}
+
+    # ---------- 非同期 ----------
+
+    def _semaphore(self):
+        """実行中のイベントループで共有するセマフォ"""
+        loop = asyncio.get_running_loop()
+        with self._semaphores_lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return semaphore
+
+    async def _arun_one(self, call, config):
+        if call["name"] not in self.tools_by_name:
+            return self._invalid(call)
+        if (speculated := self._speculated(call)) is not None:
+            return await (asyncio.wrap_future(speculated) if isinstance(speculated, Future) else speculated)
+        return await self._aexecute(call, config)
+
+    async def _aexecute(self, call, config):
+        if (cached := self._cached(call)) is not None:
+            return cached
+        async with self._semaphore():
+            t0 = time.perf_counter()
+            timeout, by_deadline = self._limit(call["name"], config)
+            try:
+                # タイムアウト・締め切りを過ぎたら実行中のツールを取り消す
+                output = await asyncio.wait_for(
+                    self.tools_by_name[call["name"]].ainvoke({**call, "type": "tool_call"}, config),
+                    timeout=timeout,
+                )
+                message = self._to_message(call, output)
+            except asyncio.TimeoutError:
+                return self._past_deadline(call) if by_deadline else self._timed_out(call)
+            except Exception as e:
+                return self._failed(call, e)
+            self._remember(call, message, time.perf_counter() - t0)
+            return message
+
+    def asubmit(self, call, config):
+        """1つの呼び出しを実行中のイベントループのタスクとして実行し始める"""
+        return asyncio.ensure_future(self._aexecute(call, config))
+
+    async def _arun(self, state, config):
+        calls = self._tool_calls(state)
+        messages = await asyncio.gather(*(self._arun_one(call, config) for call in calls))
+        return {"messages": list(messages)}
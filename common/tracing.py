@@ -0,0 +1,621 @@
+"""
+グラフ実行のトレースとノードごとの計測
+
+環境変数 TRACE_FILE / TRACE_METRICS_PORT を設定したとき（またはコードから enable_tracing() を呼んだとき）
+だけ有効になります。無効なときはこのモジュールは import されず、コールバックもチェックポインターの
+ラッパーも追加されないため、実行には何のコストもかかりません。
+
+1回の実行（invoke / stream）を1つのトレースとして、次を記録します。
+- グラフ全体・ノード（chatbot / tools など）・条件付きエッジ（should_continue など）の処理時間
+- LLMの呼び出し時間と、入力・出力のトークン数（usage_metadata）
+- ツールの実行時間
+- ループの回数（1回の実行でのLLMの呼び出し数）とステップ数
+- チェックポイントの読み書きの時間（TracedCheckpointer で包んだ場合。create_checkpointer が自動で包む）
+- 使い切った予算の種類（common/budget.py のカスタムイベント budget_exhausted）
+- モデルのルーティングで応答した tier とエスカレーション（common/model_router.py の response_metadata["model_routing"]）
+
+出力:
+- TRACE_FILE: OpenTelemetry の OTLP/JSON 形式で追記する（1行 = 1トレースの resourceSpans）。
+  OpenTelemetry Collector の otlpjsonfile レシーバーなどでそのまま読み込める
+- TRACE_METRICS_PORT: Prometheus のテキスト形式を http://127.0.0.1:{port}/metrics で公開する
+  （common/server.py の GET /metrics でも同じ内容を返す）
+
+    TRACE_FILE=traces.jsonl TRACE_METRICS_PORT=9464 LLM_BACKEND=fake python3 chapter3/multi_tools.py
+
+コードから:
+    tracer = enable_tracing("traces.jsonl")
+    agent.invoke({"messages": [("user", "東京の天気を教えて")]})
+    print(tracer.metrics_text())
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.errors import GraphBubbleUp
+
+SERVICE_NAME = "langgraph-hands-on"
+
+# LangGraph の内部処理（チャネルへの書き込みなど）に付くタグ。スパンにしない
+_HIDDEN_TAG = "langsmith:hidden"
+
+# OTLP の SpanKind（INTERNAL / CLIENT）
+_KIND_INTERNAL = 1
+_KIND_CLIENT = 3
+
+_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_ITERATION_BUCKETS = (1, 2, 3, 4, 5, 8, 13, 21)
+
+# メトリクス名 -> (種類, 説明, ヒストグラムのバケット)
+_METRICS = {
+    "langgraph_runs_total": ("counter", "Graph runs by final status", None),
+    "langgraph_run_duration_seconds": ("histogram", "Wall time of a whole graph run", _DURATION_BUCKETS),
+    "langgraph_loop_iterations": ("histogram", "LLM calls per graph run", _ITERATION_BUCKETS),
+    "langgraph_node_duration_seconds": ("histogram", "Wall time of a graph node", _DURATION_BUCKETS),
+    "langgraph_llm_duration_seconds": ("histogram", "Wall time of an LLM call", _DURATION_BUCKETS),
+    "langgraph_llm_tokens_total": ("counter", "LLM tokens by type (prompt / completion)", None),
+    "langgraph_tool_duration_seconds": ("histogram", "Wall time of a tool call", _DURATION_BUCKETS),
+    "langgraph_tool_errors_total": ("counter", "Tool calls that raised", None),
+    "langgraph_checkpoint_duration_seconds": ("histogram", "Wall time of a checkpointer operation",
+                                              _DURATION_BUCKETS),
+    "langgraph_budget_exhausted_total": ("counter", "Runs ended early by a budget (iterations / deadline / tokens)",
+                                         None),
+    "langgraph_model_escalations_total": ("counter", "LLM responses retried on a larger model tier", None),
+}
+
+
+# ---------- スパン ----------
+
+def _attribute(key, value):
+    """OTLP/JSON の属性（KeyValue）"""
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    """1つの処理（グラフ・ノード・LLM・ツール・チェックポイント）の区間"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "attributes",
+                 "start_ns", "duration", "error", "_t0")
+
+    def __init__(self, trace, span_id, parent_id, name, kind, attributes=None):
+        self.trace = trace
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.duration = None
+        self.error = None
+        self._t0 = time.perf_counter()
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self._t0
+        self.error = error
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": _KIND_CLIENT if self.kind == "llm" else _KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.start_ns + int(self.duration * 1e9)),
+            "attributes": [_attribute("langgraph.span.kind", self.kind)]
+                          + [_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _Trace:
+    """1回の実行のスパンと集計値"""
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+        self.llm_calls = 0
+        self.steps = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.checkpoint_seconds = 0.0
+        self.budget_exhausted = None
+
+
+class FileSpanExporter:
+    """スパンを OTLP/JSON 形式でファイルに追記する（1回の export = 1行）"""
+
+    def __init__(self, path, service_name=None):
+        self.path = path
+        self.resource = {"attributes": [
+            _attribute("service.name", service_name or os.environ.get("OTEL_SERVICE_NAME", SERVICE_NAME)),
+        ]}
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        line = json.dumps({"resourceSpans": [{
+            "resource": self.resource,
+            "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [s.to_otlp() for s in spans]}],
+        }]}, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+# ---------- メトリクス ----------
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Metrics:
+    """カウンターとヒストグラム（Prometheus のテキスト形式で出力する）"""
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = _METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # [バケットごとの件数（累積）, 合計, 件数]
+            histogram = self._histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: (list(c), s, n) for k, (c, s, n) in self._histograms.items()}
+        lines = []
+        for name, (kind, help_, buckets) in _METRICS.items():
+            series = counters if kind == "counter" else histograms
+            keys = sorted(k for k in series if k[0] == name)
+            if not keys:
+                continue
+            lines += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+            for key in keys:
+                labels = key[1]
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {series[key]}")
+                    continue
+                counts, total, count = series[key]
+                for bound, c in zip(buckets, counts):
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {c}")
+                lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {total}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+# ---------- コールバック ----------
+
+def _routing(response):
+    """LLMResult からモデルのルーティングの結果（common/model_router.py）を取り出す（なければ None）"""
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            if message is not None and "model_routing" in message.response_metadata:
+                return message.response_metadata["model_routing"]
+    return None
+
+
+def _token_usage(response):
+    """LLMResult から (入力トークン数, 出力トークン数) を取り出す"""
+    input_tokens = output_tokens = 0
+    found = False
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                found = True
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+    if not found:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        input_tokens = usage.get("prompt_tokens", 0)
+        output_tokens = usage.get("completion_tokens", 0)
+    return input_tokens, output_tokens
+
+
+def _error_message(error):
+    return f"{type(error).__name__}: {error}"
+
+
+class Tracer(BaseCallbackHandler):
+    """実行中のグラフのスパンを組み立て、メトリクスを集計するコールバック
+
+    Args:
+        exporter: export(spans) を持つオブジェクト（FileSpanExporter など）。None ならメトリクスだけ集計する
+    """
+
+    # イベントごとにスレッドへ移さず、その場で処理する（処理は辞書の更新だけ）
+    run_inline = True
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+        self.metrics = Metrics()
+        self._lock = threading.Lock()
+        self._spans = {}    # run_id -> 実行中の Span
+        self._hidden = {}   # スパンにしない run_id -> いちばん近いスパンの run_id
+        self._threads = {}  # thread_id -> 実行中のグラフの run_id（チェックポイントの親にする）
+
+    def metrics_text(self):
+        """Prometheus のテキスト形式"""
+        return self.metrics.render()
+
+    # ---------- スパンの開始・終了 ----------
+
+    def _start(self, run_id, parent_run_id, name, kind, attributes=None):
+        with self._lock:
+            parent = self._spans.get(self._hidden.get(parent_run_id, parent_run_id))
+            trace = parent.trace if parent else _Trace(run_id.hex)
+            span = Span(trace, run_id.hex[16:], parent.span_id if parent else None, name, kind, attributes)
+            self._spans[run_id] = span
+            return span
+
+    def _end(self, run_id, error=None, **attributes):
+        with self._lock:
+            self._hidden.pop(run_id, None)
+            span = self._spans.pop(run_id, None)
+            if span is None:
+                return
+            span.finish(error)
+            span.attributes.update(attributes)
+            trace = span.trace
+            trace.spans.append(span)
+            finished = span.parent_id is None
+            if finished:
+                for thread_id in [t for t, r in self._threads.items() if r == run_id]:
+                    del self._threads[thread_id]
+        self._record(span)
+        if finished:
+            self._finish_trace(span)
+
+    def _record(self, span):
+        seconds, attrs = span.duration, span.attributes
+        if span.kind == "node":
+            self.metrics.observe("langgraph_node_duration_seconds", {"node": span.name}, seconds)
+        elif span.kind == "llm":
+            model = attrs.get("gen_ai.response.model") or attrs.get("gen_ai.request.model") or span.name
+            self.metrics.observe("langgraph_llm_duration_seconds", {"model": model}, seconds)
+            for type_, key in (("prompt", "gen_ai.usage.input_tokens"), ("completion", "gen_ai.usage.output_tokens")):
+                if attrs.get(key):
+                    self.metrics.inc("langgraph_llm_tokens_total", {"model": model, "type": type_}, attrs[key])
+        elif span.kind == "tool":
+            self.metrics.observe("langgraph_tool_duration_seconds", {"tool": span.name}, seconds)
+            if span.error:
+                self.metrics.inc("langgraph_tool_errors_total", {"tool": span.name})
+        elif span.kind == "checkpoint":
+            self.metrics.observe("langgraph_checkpoint_duration_seconds", {"op": span.name}, seconds)
+
+    def _finish_trace(self, root):
+        trace = root.trace
+        if root.kind == "graph":
+            status = "error" if root.error else root.attributes.get("langgraph.status", "ok")
+            if trace.budget_exhausted and status == "ok":
+                status = "budget_exhausted"
+                root.attributes["langgraph.budget_exhausted"] = trace.budget_exhausted
+            root.attributes.update({
+                "langgraph.status": status,
+                "langgraph.llm_calls": trace.llm_calls,
+                "langgraph.steps": trace.steps,
+                "gen_ai.usage.input_tokens": trace.input_tokens,
+                "gen_ai.usage.output_tokens": trace.output_tokens,
+                "langgraph.checkpoint.seconds": trace.checkpoint_seconds,
+            })
+            labels = {"graph": root.name}
+            self.metrics.inc("langgraph_runs_total", {**labels, "status": status})
+            self.metrics.observe("langgraph_run_duration_seconds", labels, root.duration)
+            self.metrics.observe("langgraph_loop_iterations", labels, trace.llm_calls)
+        if self.exporter is not None:
+            self.exporter.export(trace.spans)
+
+    # ---------- チェーン（グラフ・ノード・条件付きエッジ） ----------
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None,
+                       **kwargs):
+        metadata = metadata or {}
+        name = kwargs.get("name") or (serialized or {}).get("name") or "chain"
+        if parent_run_id is None:
+            self._start(run_id, None, name, "graph", {"langgraph.thread_id": metadata.get("thread_id")})
+            if metadata.get("thread_id") is not None:
+                with self._lock:
+                    self._threads[metadata["thread_id"]] = run_id
+            return
+        node = metadata.get("langgraph_node")
+        with self._lock:
+            visible = self._hidden.get(parent_run_id, parent_run_id)
+            parent = self._spans.get(visible)
+            # 内部処理と、ノードの中の同じ名前の関数（async_node で包んだ chatbot など）はスパンにしない
+            if _HIDDEN_TAG in (tags or ()) or (parent is not None and parent.kind == "node" and parent.name == name):
+                self._hidden[run_id] = visible
+                return
+        step = metadata.get("langgraph_step")
+        span = self._start(run_id, parent_run_id, name, "node" if node == name else "chain",
+                           {"langgraph.node": node, "langgraph.step": step})
+        if step is not None:
+            span.trace.steps = max(span.trace.steps, step)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        if isinstance(error, GraphBubbleUp):
+            # interrupt などで止まっただけ（エラーではない）
+            self._end(run_id, **{"langgraph.status": "interrupted"})
+        else:
+            self._end(run_id, _error_message(error))
+
+    def on_custom_event(self, name, data, *, run_id, tags=None, metadata=None, **kwargs):
+        if name != "budget_exhausted":
+            return
+        budget = data["budget"]
+        with self._lock:
+            span = self._spans.get(self._hidden.get(run_id, run_id))
+            if span is not None:
+                span.trace.budget_exhausted = budget
+                span.attributes["langgraph.budget_exhausted"] = budget
+        self.metrics.inc("langgraph_budget_exhausted_total",
+                         {"budget": budget, "node": (metadata or {}).get("langgraph_node")})
+
+    # ---------- LLM ----------
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        name = kwargs.get("name") or (serialized or {}).get("name") or "llm"
+        span = self._start(run_id, parent_run_id, name, "llm", {
+            "gen_ai.request.model": metadata.get("ls_model_name"),
+            "gen_ai.system": metadata.get("ls_provider"),
+            "langgraph.node": metadata.get("langgraph_node"),
+        })
+        with self._lock:
+            span.trace.llm_calls += 1
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, parent_run_id=parent_run_id,
+                                 metadata=metadata, **kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        input_tokens, output_tokens = _token_usage(response)
+        span = self._spans.get(run_id)
+        if span is not None:
+            with self._lock:
+                span.trace.input_tokens += input_tokens
+                span.trace.output_tokens += output_tokens
+        attributes = {"gen_ai.usage.input_tokens": input_tokens, "gen_ai.usage.output_tokens": output_tokens}
+        if routing := _routing(response):
+            attributes["gen_ai.response.model"] = routing["tier"]
+            attributes["langgraph.model_route"] = routing["route"]
+            for escalation in routing["escalations"]:
+                self.metrics.inc("langgraph_model_escalations_total", escalation)
+        self._end(run_id, **attributes)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, _error_message(error))
+
+    # ---------- ツール ----------
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        self._start(run_id, parent_run_id, name, "tool", {
+            "gen_ai.tool.name": name,
+            "langgraph.node": (metadata or {}).get("langgraph_node"),
+        })
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, _error_message(error))
+
+    # ---------- チェックポイント ----------
+
+    def checkpoint(self, op, config, start_ns, seconds, error=None):
+        """チェックポインターの1回の操作を記録する（TracedCheckpointer から呼ばれる）
+
+        同じ thread_id のグラフが実行中ならそのトレースに入れ、そうでなければ（get_state など）単独で出力します。
+        """
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        with self._lock:
+            root = self._spans.get(self._threads.get(thread_id))
+            trace = root.trace if root else _Trace(os.urandom(16).hex())
+            span = Span(trace, os.urandom(8).hex(), root.span_id if root else None, op, "checkpoint",
+                        {"langgraph.thread_id": thread_id})
+            span.start_ns = start_ns
+            span.duration = seconds
+            span.error = error
+            trace.spans.append(span)
+            trace.checkpoint_seconds += seconds
+        self._record(span)
+        if root is None and self.exporter is not None:
+            self.exporter.export([span])
+
+
+# ---------- チェックポインターのラッパー ----------
+
+class TracedCheckpointer(BaseCheckpointSaver):
+    """チェックポインターの読み書きの時間を、有効な Tracer に記録するラッパー
+
+    トレースが無効なとき（enable_tracing の前や disable_tracing の後）はそのまま委譲します。
+    """
+
+    def __init__(self, inner):
+        super().__init__(serde=inner.serde)
+        self.inner = inner
+
+    def _timed(self, op, config, fn, *args):
+        tracer = _tracer
+        if tracer is None:
+            return fn(*args)
+        start_ns, t0 = time.time_ns(), time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            tracer.checkpoint(op, config, start_ns, time.perf_counter() - t0, _error_message(e))
+            raise
+        tracer.checkpoint(op, config, start_ns, time.perf_counter() - t0)
+        return result
+
+    async def _atimed(self, op, config, fn, *args):
+        tracer = _tracer
+        if tracer is None:
+            return await fn(*args)
+        start_ns, t0 = time.time_ns(), time.perf_counter()
+        try:
+            result = await fn(*args)
+        except Exception as e:
+            tracer.checkpoint(op, config, start_ns, time.perf_counter() - t0, _error_message(e))
+            raise
+        tracer.checkpoint(op, config, start_ns, time.perf_counter() - t0)
+        return result
+
+    def get_tuple(self, config):
+        return self._timed("checkpoint.get", config, self.inner.get_tuple, config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        return self.inner.list(config, filter=filter, before=before, limit=limit)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        return self._timed("checkpoint.put", config, self.inner.put, config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        return self._timed("checkpoint.put_writes", config, self.inner.put_writes, config, writes, task_id,
+                           task_path)
+
+    def delete_thread(self, thread_id):
+        return self.inner.delete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self.inner.get_next_version(current, channel)
+
+    async def aget_tuple(self, config):
+        return await self._atimed("checkpoint.get", config, self.inner.aget_tuple, config)
+
+    def alist(self, config, *, filter=None, before=None, limit=None):
+        return self.inner.alist(config, filter=filter, before=before, limit=limit)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await self._atimed("checkpoint.put", config, self.inner.aput, config, checkpoint, metadata,
+                                  new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await self._atimed("checkpoint.put_writes", config, self.inner.aput_writes, config, writes,
+                                  task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await self.inner.adelete_thread(thread_id)
+
+
+# ---------- 有効化 ----------
+
+_tracer = None
+_metrics_server = None
+
+
+class _Current:
+    """register_configure_hook に渡す。スレッドやタスクをまたいで、有効な Tracer を返す
+
+    ContextVar だと別スレッドで始めた実行（ThreadPoolExecutor など）に引き継がれないため、
+    モジュールの変数を返します。None の間はコールバックは追加されません。
+    """
+
+    def get(self):
+        return _tracer
+
+
+# すべての実行（invoke / stream / ainvoke ...）のコールバックに、有効な Tracer を加える
+register_configure_hook(_Current(), inheritable=True)
+
+
+def current_tracer():
+    """有効な Tracer（無効なら None）"""
+    return _tracer
+
+
+def enable_tracing(path=None, metrics_port=None, exporter=None):
+    """トレースを有効にして Tracer を返す
+
+    Args:
+        path: スパンを OTLP/JSON で追記するファイル
+        metrics_port: Prometheus のテキスト形式を公開するポート
+        exporter: path の代わりに使うエクスポーター（export(spans) を持つオブジェクト）
+    """
+    global _tracer
+    if exporter is None and path:
+        exporter = FileSpanExporter(path)
+    _tracer = Tracer(exporter)
+    if metrics_port:
+        serve_metrics(int(metrics_port))
+    return _tracer
+
+
+def enable_from_env():
+    """TRACE_FILE / TRACE_METRICS_PORT が設定されていれば有効にする（有効にした Tracer か None を返す）"""
+    path = os.environ.get("TRACE_FILE")
+    port = os.environ.get("TRACE_METRICS_PORT")
+    if _tracer is not None or not (path or port):
+        return _tracer
+    return enable_tracing(path, port)
+
+
+def disable_tracing():
+    """トレースを無効にする（メトリクスのサーバーも止める）"""
+    global _tracer, _metrics_server
+    _tracer = None
+    if _metrics_server is not None:
+        _metrics_server.shutdown()
+        _metrics_server = None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics" or _tracer is None:
+            self.send_error(404)
+            return
+        body = _tracer.metrics_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """GET /metrics を返す HTTP サーバーを別スレッドで起動する"""
+    global _metrics_server
+    if _metrics_server is None:
+        _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+    return _metrics_server